@@ -0,0 +1,82 @@
+"""Compara la búsqueda exacta con el índice IVF sobre embeddings sintéticos de 512 dimensiones.
+
+Uso (desde vision-ms/):
+
+    python -m benchmarks.ann_benchmark --persons 50000 --queries 2000 --nprobe 4 8 16 32
+"""
+from __future__ import annotations
+import argparse
+import time
+import numpy as np
+from src.face_recognition.recognition.vector_index import ExactIndex, IVFIndex
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def synthetic_gallery(persons: int, dim: int, rng: np.random.Generator):
+    # Identidades agrupadas (edad/etnia/iluminación similares) para que el problema no sea trivial
+    groups = _normalize(rng.standard_normal((max(1, persons // 200), dim)).astype(np.float32))
+    identities = _normalize(groups[rng.integers(0, len(groups), persons)]
+                            + 0.6 * _normalize(rng.standard_normal((persons, dim)).astype(np.float32)))
+    return identities.astype(np.float32)
+
+
+def synthetic_queries(identities: np.ndarray, count: int, noise: float, rng: np.random.Generator):
+    targets = rng.integers(0, len(identities), count)
+    noisy = identities[targets] + noise * _normalize(rng.standard_normal((count, identities.shape[1])).astype(np.float32))
+    return _normalize(noisy).astype(np.float32), targets
+
+
+def timed_search(index: ExactIndex, queries: np.ndarray, batch: int):
+    rows = []
+    started = time.perf_counter()
+    for i in range(0, len(queries), batch):
+        rows.append(index.search(queries[i:i + batch], k=1)[0][:, 0])
+    elapsed = time.perf_counter() - started
+    return np.concatenate(rows), elapsed * 1000 / len(queries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persons", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--noise", type=float, default=1.0, help="ruido relativo de cada consulta respecto a su identidad")
+    parser.add_argument("--batch", type=int, default=4, help="rostros por consulta (rostros de un frame)")
+    parser.add_argument("--nlist", type=int, default=0, help="0 = automático")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    identities = synthetic_gallery(args.persons, args.dim, rng)
+    queries, _ = synthetic_queries(identities, args.queries, args.noise, rng)
+
+    exact = ExactIndex(args.dim)
+    started = time.perf_counter()
+    for key, vector in enumerate(identities):
+        exact.upsert(key, vector)
+    print(f"exact  build {time.perf_counter() - started:7.2f}s")
+    truth, exact_ms = timed_search(exact, queries, args.batch)
+    print(f"exact  {exact_ms:8.3f} ms/face  recall@1 1.000")
+
+    # Re-entrenamiento síncrono: el build mide también el k-means y las búsquedas van sobre el índice final
+    ivf = IVFIndex(args.dim, nlist=args.nlist, min_train_size=min(2048, args.persons), background_rebuild=False)
+    started = time.perf_counter()
+    for key, vector in enumerate(identities):
+        ivf.upsert(key, vector)
+    stats = ivf.stats()
+    print(f"ivf    build {time.perf_counter() - started:7.2f}s  (nlist={stats['nlist']}, rebuilds={stats['rebuilds']}, "
+          f"list size min/mean/max={stats['list_size_min']}/{stats['list_size_mean']}/{stats['list_size_max']})")
+
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        rows, ivf_ms = timed_search(ivf, queries, args.batch)
+        recall = float(np.mean(ivf.keys[rows] == exact.keys[truth]))
+        print(f"ivf    {ivf_ms:8.3f} ms/face  recall@1 {recall:.3f}  nprobe={nprobe:<4d} speedup x{exact_ms / ivf_ms:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from typing import List, Optional, Dict, Any
 from dataclasses import dataclass, field
 from ...helpers.utils.enums import RiskLevel, FaceSource
+from ...helpers.dto.person_summary_dto import PersonSummaryDTO
 import datetime
 
 @dataclass
@@ -16,6 +17,8 @@ class FaceExtractedDTO:
     score: float
     thumbnail: Optional[str]
     pose: Optional[PoseDTO]
+    # Track del rostro en la cámara (FaceTracker); None sin tracking
+    trackId: Optional[int] = None
     
 @dataclass
 class FaceEmbeddingDTO:
@@ -29,6 +32,28 @@ class FaceEmbeddingDTO:
     metadata: Dict[str, Any] = field(default_factory=dict)
     createdAt: datetime.datetime = field(default_factory=lambda: datetime.datetime.utcnow())
 
+@dataclass
+class PersonIndexDTO:
+    """Vista de carga del índice (PersonRepository VIEW_INDEX): identidad y vectores crudos, sin thumbnails."""
+    summary: PersonSummaryDTO
+    # Vectores float32 decodificados (vistas sobre el Binary de Mongo), manual y auto juntos
+    embeddings: List[Any] = field(default_factory=list)
+    # poseBucket guardado y pose de cada embedding (paralelos a `embeddings`)
+    poseBuckets: List[Optional[str]] = field(default_factory=list)
+    poses: List[Optional[Dict[str, Any]]] = field(default_factory=list)
+
+@dataclass
+class SightingDTO:
+    """Avistamientos de una persona agregados en una ventana (SightingAggregator)."""
+    personId: int
+    userId: Optional[int]
+    cameraId: Optional[int]
+    count: int
+    firstSeenAt: datetime.datetime
+    lastSeenAt: datetime.datetime
+    # Mejor rostro de la ventana; se agrega a embeddings.auto
+    embedding: Optional[FaceEmbeddingDTO] = None
+
 @dataclass
 class PersonDTO:
     id: Optional[int]
@@ -38,6 +63,7 @@ class PersonDTO:
     riskLevel: RiskLevel
     metadata: Dict[str, Any] = field(default_factory=dict)
     #embeddings: List[FaceEmbeddingDTO] = field(default_factory=list)
+    # Leído de Mongo es un LazyEmbeddings (subclase de dict que hidrata cada grupo al accederlo)
     embeddings: Dict[str, List[FaceEmbeddingDTO]] = field(
         default_factory=lambda: {"manual": [], "auto": []}
     )
@@ -1,50 +1,103 @@
 from __future__ import annotations
-import base64
-import json
 import logging
 import threading
-import cv2
 import numpy as np
 import pika
-from typing import Optional, Dict
+from typing import Callable, Optional, Dict, List, Sequence
 import datetime
 import asyncio
+import concurrent.futures
+import time
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from ..dto.person_dto import PersonDTO, FaceEmbeddingDTO, FaceExtractedDTO
+from ..dto.person_dto import PersonDTO, PersonIndexDTO, FaceEmbeddingDTO, FaceExtractedDTO, SightingDTO
+from ..repository.person_repository import VIEW_INDEX
 from ...helpers.utils.enums import FaceSource, RiskLevel
-from ..recognition.face_engine import FaceEngine
+from ...helpers.utils.engine_pool import FaceEnginePool
+from ...helpers.utils.utils import generate_unique_number
+from ..recognition.inference_scheduler import InferenceScheduler
+from ..recognition.face_tracker import FaceTracker
+from ..recognition.embedding_gallery import EmbeddingGallery, NO_MATCH_DISTANCE
 from ..services.person_service import PersonService
+from ..services.sighting_aggregator import SightingAggregator
 from ...helpers.constants.constants import constants
+from ...helpers.utils.frame_codec import decode_frame, decode_frame_image, frame_routing_key, frame_queue_name, RENDITION_ANALYTICS
+from ...helpers.utils.amqp import declare_queue, queue_arguments
+from ...helpers.utils.frame_bus import FrameBusSubscription, frame_bus_name
 
 logger = logging.getLogger(__name__)
 
 
 class RabbitConsumer(threading.Thread):
 
-    def __init__(self, camera_id: int, db: AsyncIOMotorDatabase, face_engine: FaceEngine, main_loop: asyncio.AbstractEventLoop):
+    def __init__(self, camera_id: int, db: AsyncIOMotorDatabase, face_engine: FaceEnginePool, main_loop: asyncio.AbstractEventLoop,
+                 inference: Optional[InferenceScheduler] = None):
         super().__init__(daemon=True)
         self.camera_id = camera_id
-        # Face engine
+        # Pool de FaceEngine (cada extract toma un engine libre)
         self._face_engine = face_engine
+        # Scheduler de inferencia por batches compartido entre cámaras (None = inferencia directa)
+        self._inference = inference
         self.main_loop: asyncio.AbstractEventLoop = main_loop
         # Servicio de personas
         self._person_service = PersonService(db=db, engine=self._face_engine)
         # Flag de parada del thread
         self._stop_flag = threading.Event()
+        # Tareas process_faces en vuelo en el event loop; al llegar al límite el thread espera
+        self._inflight_limit = max(1, constants["FACE_MAX_INFLIGHT_TASKS"])
+        self._inflight = threading.BoundedSemaphore(self._inflight_limit)
+        # Future del flush de avistamientos lanzado en stop()
+        self.flushed: Optional[concurrent.futures.Future] = None
         # RabbitMQ
         self._amqp_url = constants["AMQP_URL"]
         self._exchange = constants["AMQP_EXCHANGE"]
         self._connection: Optional[pika.BlockingConnection] = None
         self._channel: Optional[pika.adapters.blocking_connection.BlockingChannel] = None
+        # Frames locales por memoria compartida en lugar de RabbitMQ
+        self._use_frame_bus: bool = constants["FRAME_BUS_ENABLED"]
         # Reconocimiento
         self.MATCH_THRESHOLD = 0.55
         self.UNKNOWN_ALERT_THRESHOLD = 15  # Ej: si un desconocido aparece 15 veces → alerta
         self.RISK_NOTIFY_LEVELS = {RiskLevel.DANGEROUS, RiskLevel.HIGH}
-        # "Modelo" en memoria: { userId: { personId: {centroid, embeddings[], risk} } }
-        self.embedding_index: Dict[int, Dict[int, Dict]] = {}
+        # "Modelo" en memoria: { userId: EmbeddingGallery (centroides por persona en una matriz) }
+        self.embedding_index: Dict[int, EmbeddingGallery] = {}
+        # Avistamientos agregados por persona; se escriben en un bulk_write por ventana
+        self._sightings = SightingAggregator(
+            flush=self._flush_sightings,
+            window_seconds=constants["FACE_SIGHTING_WINDOW_SECONDS"],
+        )
+        # Tracking de rostros: solo se reconocen los rostros que el tracker elige; el resto cuenta
+        # como avistamiento de la identidad ya resuelta de su track
+        self._tracker: Optional[FaceTracker] = None
+        if constants["FACE_TRACKING_ENABLED"]:
+            self._tracker = FaceTracker(
+                iou_threshold=constants["FACE_TRACK_IOU_THRESHOLD"],
+                centroid_ratio=constants["FACE_TRACK_CENTROID_RATIO"],
+                max_missed=constants["FACE_TRACK_MAX_MISSED_FRAMES"],
+                recognize_every=constants["FACE_TRACK_RECOGNIZE_EVERY"],
+                quality_gain=constants["FACE_TRACK_QUALITY_GAIN"],
+            )
 
     def stop(self):
         self._stop_flag.set()
+        # Guarda los avistamientos de la ventana en curso cuando terminen las tareas en vuelo
+        try:
+            self.flushed = asyncio.run_coroutine_threadsafe(self._drain_and_close(), self.main_loop)
+        except RuntimeError as e:
+            logger.warning("No se pudieron guardar los avistamientos de la cámara %s: %s", self.camera_id, e)
+
+    async def _drain_and_close(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self._drain_inflight)
+        await self._sightings.close()
+
+    def _drain_inflight(self) -> None:
+        """Toma todos los permisos del semáforo: no queda ningún process_faces en vuelo
+        y el thread ya no puede lanzar otro. No se devuelven: el consumer está detenido."""
+        deadline = time.monotonic() + constants["FACE_STOP_DRAIN_TIMEOUT_SECONDS"]
+        for taken in range(self._inflight_limit):
+            if not self._inflight.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                logger.warning("Cámara %s: %s tareas siguen en vuelo al guardar los avistamientos",
+                               self.camera_id, self._inflight_limit - taken)
+                return
 
     def connect(self) -> None:
         if self._connection and self._connection.is_open:
@@ -89,7 +142,7 @@ class RabbitConsumer(threading.Thread):
         if not pose:
             return "UNKNOWN"
 
-        yaw = pose.get("yaw")
+        yaw = pose.get("yaw") if isinstance(pose, dict) else getattr(pose, "yaw", None)
         if yaw is None:
             return "UNKNOWN"
 
@@ -122,92 +175,81 @@ class RabbitConsumer(threading.Thread):
         if user_id in self.embedding_index:
             return
 
-        persons: list[PersonDTO] = await self._person_service.list_by_user(user_id)
+        # Vista de índice: identidad y vectores, sin thumbnails ni un DTO por embedding
+        persons: list[PersonIndexDTO] = await self._person_service.list_by_user(user_id, view=VIEW_INDEX)
         logger.info(f"Personas a cargar ${len(persons)}")
-        self.embedding_index[user_id] = {}
+        gallery = EmbeddingGallery()
 
         for p in persons:
-            # Lista de vectores numpy normalizados
-            emb_vecs = []
-            for e in p.embeddings:
-                for group in p.embeddings.values():     # manual y auto
-                    for e in group:
-                        v = np.asarray(e.embedding, dtype=np.float32)
-                        n = np.linalg.norm(v)
-                        if n > 0:
-                            v = v / n
-                            emb_vecs.append(v)
-
-            if not emb_vecs:
-                continue
-
-            centroid = np.mean(emb_vecs, axis=0)
-            ncent = np.linalg.norm(centroid)
-            if ncent > 0:
-                centroid = centroid / ncent
-
-            self.embedding_index[user_id][p.id] = {
-                "embeddings": emb_vecs,
-                "centroid": centroid,
-                "risk": p.riskLevel
-            }
+            # Identidad a la caché compartida: el matching no vuelve a leer la persona de Mongo
+            self._person_service.cache_identity(p.summary)
+            # manual y auto
+            gallery.set_person(
+                p.summary.id,
+                p.embeddings,
+                risk=p.summary.riskLevel,
+                buckets=[bucket or self.pose_bucket(pose) for bucket, pose in zip(p.poseBuckets, p.poses)],
+            )
 
-        logger.info("Embedding index cargado para userId=%s, personas=%s", user_id, len(self.embedding_index[user_id]))
+        self.embedding_index[user_id] = gallery
+        logger.info("Embedding index cargado para userId=%s, personas=%s", user_id, len(gallery))
 
 
     def _update_embedding_index(self,
                                 user_id: int,
                                 person_id: int,
-                                embedding, risk: RiskLevel):
-        emb = np.asarray(embedding, dtype=np.float32)
-        n = np.linalg.norm(emb)
-        if n == 0:
-            return
-        emb = emb / n
-
-        user_bucket = self.embedding_index.setdefault(user_id, {})
-        entry = user_bucket.setdefault(person_id, {
-            "embeddings": [],
-            "centroid": None,
-            "risk": risk
-        })
-
-        entry["embeddings"].append(emb)
-        if len(entry["embeddings"]) > 50:
-            entry["embeddings"] = entry["embeddings"][-50:]
-        
-        centroid = np.mean(entry["embeddings"], axis=0)
-        ncent = np.linalg.norm(centroid)
-        if ncent > 0:
-            centroid = centroid / ncent
-        entry["centroid"] = centroid
-        entry["risk"] = risk
+                                embedding, risk: RiskLevel, pose=None):
+        gallery = self.embedding_index.setdefault(user_id, EmbeddingGallery())
+        gallery.add_embedding(person_id, embedding, risk=risk, bucket=self.pose_bucket(pose))
 
 
     def _match_person(self, user_id: int, embedding):
-        emb = np.asarray(embedding, dtype=np.float32)
-        n = np.linalg.norm(emb)
-        if n == 0:
-            return None, 999.0
-        emb = emb / n
-
-        best_person_id = None
-        best_distance = 999.0
-
-        user_bucket = self.embedding_index.get(user_id, {})
-        for pid, data in user_bucket.items():
-            centroid = data.get("centroid")
-            if centroid is None:
-                continue
-            d = self.cosine_distance(emb, centroid)
-            if d < best_distance:
-                best_distance = d
-                best_person_id = pid
+        return self._match_faces(user_id, [embedding])[0]
+
+
+    def _match_faces(self, user_id: int, embeddings):
+        """Matching de todos los rostros de un frame en un solo producto matricial."""
+        gallery = self.embedding_index.get(user_id)
+        if gallery is None:
+            return [(None, NO_MATCH_DISTANCE)] * len(embeddings)
+        return gallery.match_many(embeddings)
+
+
+    def stats(self) -> dict:
+        return {
+            "tracker": self._tracker.stats() if self._tracker is not None else None,
+            "sightings": self._sightings.stats(),
+        }
+
+    async def process_faces(self, user_id: int, camera_id: int, faces: List[FaceExtractedDTO],
+                            reused: Sequence = ()):
+        """`reused`: personas de los rostros trackeados que no se re-reconocieron en este frame."""
+        for person_id in reused:
+            # Sin embedding nuevo: solo cuenta el avistamiento (seenCount / lastSeenAt)
+            self._sightings.add(user_id=user_id, person_id=person_id, camera_id=camera_id, embedding=None)
+            self._person_service.bump_seen(person_id)
+        if not faces:
+            return
+        # Asegurar que el índice del usuario está cargado
+        await self._ensure_embedding_index(user_id)
 
-        return best_person_id, best_distance
+        # 1. Matching rápido en memoria (todos los rostros del frame juntos)
+        matches = self._match_faces(user_id, [face.embedding for face in faces])
+        for face, (person_id, best_distance) in zip(faces, matches):
+            if self._tracker is not None and person_id is not None and best_distance <= self.MATCH_THRESHOLD:
+                # El resto del track reutiliza este matching
+                self._tracker.set_identity(face.trackId, person_id, best_distance)
+            try:
+                await self._handle_face(user_id, camera_id, face, person_id, best_distance)
+            except Exception as e:
+                logger.exception("Error procesando rostro en cámara %s: %s", camera_id, e)
 
 
     async def process_face(self, user_id: int, camera_id: int, face: FaceExtractedDTO):
+        await self.process_faces(user_id=user_id, camera_id=camera_id, faces=[face])
+
+
+    async def _handle_face(self, user_id: int, camera_id: int, face: FaceExtractedDTO, person_id, best_distance: float):
 
         embedding = face.embedding
         quality = face.score
@@ -215,12 +257,6 @@ class RabbitConsumer(threading.Thread):
         pose = face.pose
         now_iso = datetime.datetime.utcnow().isoformat()
 
-        # Asegurar que el índice del usuario está cargado
-        await self._ensure_embedding_index(user_id)
-
-        # 1. Matching rápido en memoria
-        person_id, best_distance = self._match_person(user_id, embedding)
-
         # ----------------- UNKNOWN -----------------
         if person_id is None or best_distance > self.MATCH_THRESHOLD:
             logger.info(f"[UNKNOWN] user={user_id} dist={best_distance:.3f}")
@@ -250,15 +286,30 @@ class RabbitConsumer(threading.Thread):
                 },
             )
 
-            new_id = await self._person_service.create(dto=p_unknown)
-
-            # Actualizar índice en memoria
+            # Caché, track e índice en memoria antes de la escritura: los frames siguientes ya
+            # reconocen a la persona en lugar de crear otro desconocido mientras el insert espera
+            new_id = p_unknown.id = generate_unique_number()
+            self._person_service.cache_identity(p_unknown)
+            if self._tracker is not None:
+                self._tracker.set_identity(face.trackId, new_id, best_distance)
             self._update_embedding_index(
                 user_id=user_id,
                 person_id=new_id,
                 embedding=embedding,
-                risk=RiskLevel.UNKNOWN
+                risk=RiskLevel.UNKNOWN,
+                pose=pose
             )
+            try:
+                await self._person_service.create(dto=p_unknown, new_id=new_id)
+            except Exception:
+                # Sin documento: se deshace lo agregado en memoria
+                self._person_service.forget_identity(new_id)
+                if self._tracker is not None:
+                    self._tracker.set_identity(face.trackId, None, None)
+                gallery = self.embedding_index.get(user_id)
+                if gallery is not None:
+                    gallery.remove(new_id)
+                raise
 
             # Si supera umbral de desconocido frecuente
             seen = p_unknown.metadata.get("seenCount", 1)
@@ -267,10 +318,12 @@ class RabbitConsumer(threading.Thread):
             return
 
         # ----------------- PERSONA EXISTENTE -----------------
-        person: PersonDTO = await self._person_service.get(person_id)
+        # Identidad desde la caché de personas (sin embeddings); solo va a Mongo si no está cacheada
+        person = await self._person_service.get_identity(person_id)
         if not person:
             logger.warning(f"Persona {person_id} no encontrada en BD aunque estaba en índice")
             return
+        risk = person.riskLevel
 
         logger.info(f"[MATCH] PersonId={person.id} user={user_id} dist={best_distance:.3f}")
 
@@ -288,51 +341,147 @@ class RabbitConsumer(threading.Thread):
         )
 
         # === Persona peligrosa ===
-        if person.riskLevel in self.RISK_NOTIFY_LEVELS:
+        if risk in self.RISK_NOTIFY_LEVELS:
             logger.warning(f"[HIGH RISK] Persona peligrosa detectada: {person.displayName}")
             # Aquí iría la notificación real
 
-        # Guardar embedding en BD
-        await self._person_service.add_embedding(
-            person_id=person.id,
-            embedding=emb_dto
-        )
-
-        # Actualizar índice en memoria
-        self._update_embedding_index(
-            user_id=user_id,
-            person_id=person.id,
-            embedding=embedding,
-            risk=person.riskLevel
-        )
-
-        # Actualizar seenCount
-        meta = person.metadata or {}
-        freq = meta.get("seenCount", 0) + 1
-        await self._person_service.update_field(person.id, "metadata.seenCount", freq)
+        # Embedding y seenCount se agregan en memoria y se guardan al cerrar la ventana
+        self._sightings.add(user_id=user_id, person_id=person_id, camera_id=camera_id, embedding=emb_dto)
+        freq = self._person_service.bump_seen(person_id) or person.seenCount + 1
 
         # Notificación para normales muy frecuentes
-        if person.riskLevel == RiskLevel.NORMAL and freq > 20:
+        if risk == RiskLevel.NORMAL and freq > 20:
             logger.info(f"[NORMAL FREQUENT] {person.displayName} visto {freq} veces")
         return
 
 
+    async def _flush_sightings(self, sightings: List[SightingDTO]) -> None:
+        """Un bulk_write por ventana y el mejor embedding de cada persona al índice en memoria."""
+        await self._person_service.record_sightings(sightings)
+        for sighting in sightings:
+            if sighting.embedding is None or sighting.userId not in self.embedding_index:
+                continue
+            entry = self.embedding_index[sighting.userId].entries.get(sighting.personId)
+            self._update_embedding_index(
+                user_id=sighting.userId,
+                person_id=sighting.personId,
+                embedding=sighting.embedding.embedding,
+                risk=entry.risk if entry is not None else None,
+                pose=sighting.embedding.pose
+            )
+
+
+    def _select_faces(self, faces, reused: List[object]) -> List[int]:
+        """Asigna track a cada rostro detectado y devuelve los índices que hay que reconocer.
+
+        Los rostros no elegidos cuyo track ya tiene identidad se agregan a
+        `reused`, para que seenCount y los avistamientos cuenten rostros vistos
+        y no solo frames reconocidos.
+        """
+        track_ids, recognize = self._tracker.update([face.bbox for face in faces], [face.det_score for face in faces])
+        for face, track_id, needed in zip(faces, track_ids, recognize):
+            face.track_id = track_id
+            if not needed:
+                person_id, _ = self._tracker.identity(track_id)
+                if person_id is not None:
+                    reused.append(person_id)
+        return [i for i, needed in enumerate(recognize) if needed]
+
+    def _process_frame(self, frame, camera_id: int, user_id: int, valid: Optional[Callable[[], bool]] = None) -> None:
+        reused: List[object] = []
+        select = (lambda faces: self._select_faces(faces, reused)) if self._tracker is not None else None
+        if self._inference is not None:
+            faces = self._inference.extract(frame, select)
+        else:
+            faces = self._face_engine.extract(frame, select)
+        if valid is not None and not valid():
+            # Frame del bus sobrescrito durante la inferencia: los rostros pueden venir de dos frames
+            logger.debug("Frame del bus sobrescrito durante la inferencia en cámara %s; descartado", camera_id)
+            return
+        logger.info(
+            "%s rostros reconocidos en cámara %s",
+            len(faces), camera_id
+        )
+
+        if not faces and not reused:
+            return
+
+        # Backpressure: si el event loop / Mongo no dan abasto no se acumulan tareas sin límite
+        while not self._inflight.acquire(timeout=1.0):
+            if self._stop_flag.is_set():
+                return
+        try:
+            task = asyncio.run_coroutine_threadsafe(
+                self.process_faces(
+                    user_id=user_id,
+                    camera_id=camera_id,
+                    faces=faces,
+                    reused=reused,
+                ),
+                self.main_loop,
+            )
+        except RuntimeError:
+            self._inflight.release()
+            raise
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: concurrent.futures.Future) -> None:
+        self._inflight.release()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error procesando rostros de la cámara %s: %s", self.camera_id, task.exception())
+
+    def _run_frame_bus(self):
+        subscription = FrameBusSubscription(frame_bus_name(self.camera_id, RENDITION_ANALYTICS))
+        try:
+            while not self._stop_flag.is_set():
+                item = subscription.next(timeout=1.0)
+                if item is None:
+                    continue
+                try:
+                    # Vista sin copia sobre el ring: se valida después de la inferencia
+                    self._process_frame(item.frame, camera_id=item.camera_id, user_id=item.user_id,
+                                        valid=lambda item=item: subscription.is_valid(item))
+                except Exception as e:
+                    logger.exception(
+                        "Error procesando frame del bus para cámara %s: %s",
+                        self.camera_id, e
+                    )
+        finally:
+            subscription.close()
+            logger.info("FaceIdentificationConsumer stopped for camera %s", self.camera_id)
+
     def run(self):
         logger.info("FaceIdentificationConsumer started for camera %s", self.camera_id)
+        if self._use_frame_bus:
+            self._run_frame_bus()
+            return
+
         self.connect()
         
-        queue_name = f"vision.face.detected.{self.camera_id}"
+        queue_name = frame_queue_name(self.camera_id, RENDITION_ANALYTICS)
 
         self._channel.exchange_declare(
             exchange=self._exchange,
             exchange_type="topic",
             durable=True
         )
-        self._channel.queue_declare(queue=queue_name, durable=False)
+        self._channel = declare_queue(
+            self._connection,
+            self._channel,
+            queue_name,
+            durable=False,
+            arguments=queue_arguments(
+                max_length=constants["FACE_QUEUE_MAX_LENGTH"],
+                overflow=constants["FACE_QUEUE_OVERFLOW"],
+                message_ttl_ms=constants["FACE_QUEUE_MESSAGE_TTL_MS"],
+            ),
+        )
+        # Sin prefetch el broker empuja toda la cola al consumer y su memoria crece
+        self._channel.basic_qos(prefetch_count=constants["CONSUMER_PREFETCH"])
         self._channel.queue_bind(
             exchange=self._exchange,
             queue=queue_name,
-            routing_key=f"camera.{self.camera_id}",
+            routing_key=frame_routing_key(self.camera_id, RENDITION_ANALYTICS),
         )
 
         def callback(ch, method, properties, body):
@@ -341,35 +490,18 @@ class RabbitConsumer(threading.Thread):
                 return
 
             try:
-                msg = json.loads(body)
+                msg = decode_frame(body, properties.content_type)
 
-                frame_b64 = msg["frame"]
-                camera_id = msg["camera_id"]
-                user_id = msg["user_id"]
+                camera_id = msg.camera_id
+                user_id = msg.user_id
 
-                frame_bytes = base64.b64decode(frame_b64)
-                arr = np.frombuffer(frame_bytes, np.uint8)
-                frame = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+                frame = decode_frame_image(msg)
                 if frame is None:
                     logger.warning("Frame inválido")
                     ch.basic_ack(method.delivery_tag)
                     return
 
-                faces = self._face_engine.extract(frame)
-                logger.info(
-                    "%s rostros detectados en cámara %s",
-                    len(faces), camera_id
-                )
-
-                for face in faces:
-                    self.main_loop.call_soon_threadsafe(
-                        asyncio.create_task,
-                        self.process_face(
-                            user_id=user_id,
-                            camera_id=camera_id,
-                            face=face
-                        )
-                    )
+                self._process_frame(frame, camera_id=camera_id, user_id=user_id)
                 ch.basic_ack(delivery_tag=method.delivery_tag)
             except Exception as e:
                 logger.exception(
@@ -1,21 +1,40 @@
 from __future__ import annotations
 import logging
-from typing import Dict, Optional
+import threading
+import concurrent.futures
+from typing import Dict, List, Optional
 from .consumer import RabbitConsumer
 from motor.motor_asyncio import AsyncIOMotorDatabase
 import asyncio
 from ...helpers.dto.api_dto import ApiReqDTO
-from ..recognition.face_engine import FaceEngine
+from ...helpers.utils.engine_pool import FaceEnginePool
+from ..recognition.inference_scheduler import InferenceScheduler
+from ..repository.write_behind import WriteBehindQueue
+from ..repository.person_repository import PersonRepository
+from ...helpers.constants.constants import constants
+from ...helpers.utils.person_cache import PersonCache
 
 logger = logging.getLogger(__name__)
 
 class FaceRecognitionRabbitManager:
 
-    def __init__(self, db: AsyncIOMotorDatabase, engine: FaceEngine, main_loop: asyncio.AbstractEventLoop):
+    def __init__(self, db: AsyncIOMotorDatabase, engine: FaceEnginePool, main_loop: asyncio.AbstractEventLoop):
         self.db = db
+        # start es check-then-act y se llama desde los threads de /start-batch
+        self._start_lock = threading.Lock()
         self.consumers: Dict[int, RabbitConsumer] = {}
         self._face_engine = engine
         self._main_loop: asyncio.AbstractEventLoop = main_loop
+        # Flushes de avistamientos de consumers detenidos que aún no terminaron
+        self._pending_flushes: List[concurrent.futures.Future] = []
+        # Un solo scheduler para que los frames de todas las cámaras compartan batch
+        self._inference: Optional[InferenceScheduler] = None
+        if constants["FACE_INFERENCE_BATCHING"]:
+            self._inference = InferenceScheduler(
+                engine,
+                max_batch_size=constants["FACE_INFERENCE_MAX_BATCH"],
+                max_wait_ms=constants["FACE_INFERENCE_MAX_WAIT_MS"],
+            )
 
     def is_running(self, camera_id: int) -> bool:
         consumer = self.consumers.get(camera_id)
@@ -24,19 +43,26 @@ class FaceRecognitionRabbitManager:
     def _safe_stop(self, consumer: RabbitConsumer):
         try:
             consumer.stop()
+            if consumer.flushed is not None:
+                self._pending_flushes.append(consumer.flushed)
             consumer.join(timeout=2)
             del self.consumers[consumer.camera_id]
         except Exception as e:
             logger.error("Error stopping consumer: %s", e)
 
     def start(self, req: ApiReqDTO):
+        with self._start_lock:
+            self._start(req)
+
+    def _start(self, req: ApiReqDTO):
         if req.cameraId in self.consumers and self.is_running(req.cameraId ):
             logger.warning("Consumer for camera %s already running.", req.cameraId )
             return
 
         logger.info("Starting consumer for camera %s …", req.cameraId )
 
-        consumer = RabbitConsumer(camera_id=req.cameraId, db=self.db, face_engine=self._face_engine, main_loop=self._main_loop)
+        consumer = RabbitConsumer(camera_id=req.cameraId, db=self.db, face_engine=self._face_engine, main_loop=self._main_loop,
+                                  inference=self._inference)
 
         try:
             consumer.start()
@@ -66,10 +92,29 @@ class FaceRecognitionRabbitManager:
 
         return "RUNNING" if self.is_running(req.cameraId) else "STOPPED"
 
+    def stats(self) -> dict:
+        return {
+            "inference": self._inference.stats() if self._inference is not None else None,
+            "engines": self._face_engine.stats(),
+            "writes": WriteBehindQueue.all_stats(),
+            "migrations": PersonRepository.migration_stats(),
+            "person_cache": PersonCache.shared().stats(),
+            "cameras": {camera_id: consumer.stats() for camera_id, consumer in list(self.consumers.items())},
+        }
+
+    async def flush(self):
+        """Espera a que los consumers detenidos guarden sus avistamientos y vacía la cola de escritura."""
+        pending, self._pending_flushes = self._pending_flushes, []
+        if pending:
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in pending), return_exceptions=True)
+        await WriteBehindQueue.close_all()
+
     def stop_all(self):
         logger.info("Stopping all consumers …")
         for cam_id, consumer in list(self.consumers.items()):
             self._safe_stop(consumer)
             logger.info("Consumer for camera %s stopped.", cam_id)
         self.consumers.clear()
+        if self._inference is not None:
+            self._inference.stop()
         logger.info("All consumers stopped.")
@@ -0,0 +1,325 @@
+from __future__ import annotations
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from .vector_index import ExactIndex, create_index
+from ...helpers.constants.constants import constants
+
+logger = logging.getLogger(__name__)
+
+# Embeddings recientes que se conservan por persona para calcular el centroide
+MAX_EMBEDDINGS_PER_PERSON = 50
+# Distancia devuelta cuando no hay con qué comparar
+NO_MATCH_DISTANCE = 999.0
+
+# Modos de matching (FACE_MATCH_MODE)
+# centroid = un centroide por persona
+# max = mejor similitud contra cualquier embedding guardado de la persona
+# topk = suma de las FACE_MATCH_TOPK mejores similitudes de la persona dividida por FACE_MATCH_TOPK
+#        (k fijo: una persona con menos de k embeddings no puede superar a otra con k parecidos)
+# pose = mejor similitud contra los centroides por pose (pose_bucket) de la persona
+MATCH_CENTROID = "centroid"
+MATCH_MAX = "max"
+MATCH_TOPK = "topk"
+MATCH_POSE = "pose"
+# Candidatos por rostro (múltiplo de k) que se re-puntúan en modo topk
+TOPK_SHORTLIST_FACTOR = 8
+
+
+def normalize(vector) -> Optional[np.ndarray]:
+    v = np.asarray(vector, dtype=np.float32).reshape(-1)
+    n = np.linalg.norm(v)
+    if v.size == 0 or n == 0 or not np.isfinite(n):
+        return None
+    return v / n
+
+
+@dataclass
+class GalleryEntry:
+    embeddings: List[np.ndarray] = field(default_factory=list)
+    # pose_bucket de cada embedding (paralelo a `embeddings`)
+    buckets: List[str] = field(default_factory=list)
+    centroid: Optional[np.ndarray] = None
+    risk: object = None
+    # Próxima posición del ring de embeddings en el tensor empaquetado (modos max/topk)
+    next_slot: int = 0
+    # Buckets con fila en el tensor empaquetado (modo pose)
+    indexed_buckets: List[str] = field(default_factory=list)
+
+
+class EmbeddingGallery:
+    """Galería de un usuario: un centroide L2-normalizado por persona en un índice vectorial.
+
+    El índice (FACE_MATCH_INDEX) es `exact` (matriz float32 contigua, GEMM +
+    argmax) o `ivf` (aproximado, para galerías de decenas de miles de
+    personas); en ambos casos el matching de todos los rostros de un frame es
+    una sola operación matricial.
+
+    En los modos max/topk/pose (FACE_MATCH_MODE) además se mantiene un tensor
+    empaquetado con todos los embeddings (o los centroides por pose) de todas
+    las personas, y `_owners` indica la persona de cada fila: el matching es un
+    único GEMM rostros x filas seguido de la agregación por persona.
+    """
+
+    def __init__(self, dim: Optional[int] = None, max_embeddings: int = MAX_EMBEDDINGS_PER_PERSON,
+                 index_kind: Optional[str] = None, match_mode: Optional[str] = None,
+                 top_k: Optional[int] = None) -> None:
+        # Dimensión fijada por el primer embedding si no se indica (512 en buffalo_l)
+        self.dim = dim
+        self.max_embeddings = max_embeddings
+        self.index_kind = index_kind or constants["FACE_MATCH_INDEX"]
+        self.match_mode = match_mode or constants["FACE_MATCH_MODE"]
+        self.top_k = max(1, top_k or constants["FACE_MATCH_TOPK"])
+        self.entries: Dict[object, GalleryEntry] = {}
+        self._index: Optional[ExactIndex] = self._create_index(dim) if dim else None
+        # Tensor empaquetado: claves (person_id, slot) en max/topk, (person_id, bucket) en pose
+        self._items: Optional[ExactIndex] = None
+        # Ordinal de la persona dueña de cada fila del tensor (paralelo a sus filas)
+        self._owners = np.zeros(0, dtype=np.int64)
+        self._ordinals: Dict[object, int] = {}
+        self._ordinal_ids: List[object] = []
+        self._free_ordinals: List[int] = []
+        # Filas agrupadas por dueño (CSR); se recalcula tras altas/bajas
+        self._owner_rows = np.zeros(0, dtype=np.int64)
+        self._owner_offsets = np.zeros(1, dtype=np.int64)
+        self._owners_dirty = True
+        if self.match_mode not in (MATCH_CENTROID, MATCH_MAX, MATCH_TOPK, MATCH_POSE):
+            logger.warning("Unknown face match mode '%s'; using centroid", self.match_mode)
+            self.match_mode = MATCH_CENTROID
+
+    def __len__(self) -> int:
+        return len(self._index) if self._index is not None else 0
+
+    def __contains__(self, person_id) -> bool:
+        return person_id in self.entries
+
+    @property
+    def index(self) -> Optional[ExactIndex]:
+        return self._index
+
+    def _create_index(self, dim: int) -> ExactIndex:
+        return create_index(
+            self.index_kind,
+            dim,
+            nlist=constants["FACE_MATCH_IVF_NLIST"],
+            nprobe=constants["FACE_MATCH_IVF_NPROBE"],
+            min_train_size=constants["FACE_MATCH_IVF_MIN_TRAIN_SIZE"],
+        )
+
+    def set_person(self, person_id, embeddings: Iterable, risk=None, buckets: Optional[Iterable[str]] = None) -> None:
+        """Reemplaza los embeddings de una persona (carga desde BD)."""
+        embeddings = list(embeddings)
+        buckets = list(buckets) if buckets is not None else ["UNKNOWN"] * len(embeddings)
+        pairs = [(v, b) for v, b in zip((normalize(e) for e in embeddings), buckets) if v is not None]
+        self.remove(person_id)
+        if not pairs:
+            return
+        pairs = pairs[-self.max_embeddings:]
+        entry = GalleryEntry(
+            embeddings=[v for v, _ in pairs],
+            buckets=[b for _, b in pairs],
+            risk=risk,
+            next_slot=len(pairs) % self.max_embeddings,
+        )
+        self.entries[person_id] = entry
+        self._refresh_centroid(person_id, entry)
+        if self.match_mode != MATCH_CENTROID:
+            if self.match_mode == MATCH_POSE:
+                self._refresh_pose_items(person_id, entry)
+            else:
+                for slot, vector in enumerate(entry.embeddings):
+                    self._upsert_item((person_id, slot), vector)
+
+    def add_embedding(self, person_id, embedding, risk=None, bucket: str = "UNKNOWN") -> None:
+        vector = normalize(embedding)
+        if vector is None:
+            return
+        entry = self.entries.setdefault(person_id, GalleryEntry(risk=risk))
+        entry.embeddings.append(vector)
+        entry.buckets.append(bucket)
+        if len(entry.embeddings) > self.max_embeddings:
+            entry.embeddings = entry.embeddings[-self.max_embeddings:]
+            entry.buckets = entry.buckets[-self.max_embeddings:]
+        entry.risk = risk
+        self._refresh_centroid(person_id, entry)
+
+        if self.match_mode == MATCH_POSE:
+            self._refresh_pose_items(person_id, entry)
+        elif self.match_mode != MATCH_CENTROID:
+            # Ring: el embedding nuevo ocupa la fila del más viejo
+            self._upsert_item((person_id, entry.next_slot), vector)
+            entry.next_slot = (entry.next_slot + 1) % self.max_embeddings
+
+    def remove(self, person_id) -> None:
+        entry = self.entries.pop(person_id, None)
+        if self._index is not None:
+            self._index.remove(person_id)
+        if entry is not None and self._items is not None:
+            for key in self._item_keys(person_id, entry):
+                self._remove_item(key)
+        ordinal = self._ordinals.pop(person_id, None)
+        if ordinal is not None:
+            self._ordinal_ids[ordinal] = None
+            self._free_ordinals.append(ordinal)
+
+    def match(self, embedding) -> Tuple[Optional[object], float]:
+        return self.match_many([embedding])[0]
+
+    def match_many(self, embeddings) -> List[Tuple[Optional[object], float]]:
+        """Mejor persona y distancia coseno (1 - sim) para cada embedding."""
+        results: List[Tuple[Optional[object], float]] = [(None, NO_MATCH_DISTANCE)] * len(embeddings)
+        if not results or self._index is None or len(self._index) == 0:
+            return results
+        queries, valid = self._queries(embeddings)
+        if not valid.any():
+            return results
+
+        if self.match_mode == MATCH_CENTROID or self._items is None or len(self._items) == 0:
+            matches = self._match_centroids(queries[valid])
+        elif self.match_mode == MATCH_TOPK:
+            matches = self._match_topk(queries[valid])
+        else:
+            matches = self._match_items_max(queries[valid])
+
+        for out_index, (person_id, sim) in zip(np.flatnonzero(valid), matches):
+            if person_id is not None:
+                results[out_index] = (person_id, float(1.0 - np.clip(sim, -1.0, 1.0)))
+        return results
+
+    def _match_centroids(self, queries: np.ndarray) -> List[Tuple[Optional[object], float]]:
+        rows, sims = self._index.search(queries, k=1)
+        keys = self._index.keys
+        return [(keys[row], sim) if row >= 0 else (None, -1.0) for row, sim in zip(rows[:, 0], sims[:, 0])]
+
+    def _match_items_max(self, queries: np.ndarray) -> List[Tuple[Optional[object], float]]:
+        # max por persona = la fila con mayor similitud; no hace falta agrupar
+        rows, sims = self._items.search(queries, k=1)
+        keys = self._items.keys
+        return [(keys[row][0], sim) if row >= 0 else (None, -1.0) for row, sim in zip(rows[:, 0], sims[:, 0])]
+
+    def _match_topk(self, queries: np.ndarray) -> List[Tuple[Optional[object], float]]:
+        """Suma de las k mejores similitudes por persona, dividida por k fijo.
+
+        Un solo GEMM contra el tensor empaquetado; las personas candidatas son
+        las dueñas de las `k * TOPK_SHORTLIST_FACTOR` mejores filas. Para cada
+        par (rostro, candidata) se juntan las filas de la persona en una matriz
+        rellena con -inf, se toma su top-k con `np.partition` y el mejor par de
+        cada rostro sale de una reducción por segmentos.
+        """
+        sims = queries @ self._items.matrix.T
+        n_rows = sims.shape[1]
+        shortlist = min(n_rows, self.top_k * TOPK_SHORTLIST_FACTOR)
+        top_rows = np.argpartition(-sims, shortlist - 1, axis=1)[:, :shortlist]
+
+        # Pares (rostro, persona) únicos, ordenados por rostro
+        n_people = len(self._ordinal_ids)
+        owners = self._owners[:n_rows]
+        pairs = np.unique(np.arange(sims.shape[0])[:, None] * n_people + owners[top_rows])
+        pair_query, pair_person = np.divmod(pairs, n_people)
+
+        owner_rows, offsets = self._rows_by_owner()
+        starts = offsets[pair_person]
+        counts = offsets[pair_person + 1] - starts
+        slots = np.arange(int(counts.max()))
+        present = slots[None, :] < counts[:, None]
+        rows = owner_rows[np.where(present, starts[:, None] + slots[None, :], 0)]
+        pair_sims = np.where(present, sims[pair_query[:, None], rows], -np.inf)
+
+        k = min(self.top_k, slots.shape[0])
+        best = -np.partition(-pair_sims, k - 1, axis=1)[:, :k]
+        scores = np.where(np.isfinite(best), best, 0.0).sum(axis=1) / self.top_k
+
+        # Último par de cada rostro tras ordenar por (rostro, score) = su mejor persona
+        order = np.lexsort((scores, pair_query))
+        grouped = pair_query[order]
+        winners = order[np.flatnonzero(np.append(grouped[1:] != grouped[:-1], True))]
+        return [(self._ordinal_ids[pair_person[w]], float(scores[w])) for w in winners]
+
+    def _rows_by_owner(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(filas del tensor ordenadas por dueño, offset de cada dueño)."""
+        if self._owners_dirty:
+            owners = self._owners[:len(self._items)]
+            self._owner_rows = np.argsort(owners, kind="stable").astype(np.int64)
+            counts = np.bincount(owners, minlength=len(self._ordinal_ids))
+            self._owner_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+            self._owners_dirty = False
+        return self._owner_rows, self._owner_offsets
+
+    def _ordinal(self, person_id) -> int:
+        ordinal = self._ordinals.get(person_id)
+        if ordinal is None:
+            if self._free_ordinals:
+                ordinal = self._free_ordinals.pop()
+                self._ordinal_ids[ordinal] = person_id
+            else:
+                ordinal = len(self._ordinal_ids)
+                self._ordinal_ids.append(person_id)
+            self._ordinals[person_id] = ordinal
+        return ordinal
+
+    def _item_keys(self, person_id, entry: GalleryEntry) -> List[Tuple[object, object]]:
+        if self.match_mode == MATCH_POSE:
+            return [(person_id, bucket) for bucket in entry.indexed_buckets]
+        return [(person_id, slot) for slot in range(len(entry.embeddings))]
+
+    def _upsert_item(self, key, vector: np.ndarray) -> None:
+        if self._items is None:
+            self._items = ExactIndex(vector.shape[0])
+        if vector.shape[0] != self._items.dim:
+            return
+        row = self._items.upsert(key, vector)
+        if row >= self._owners.shape[0]:
+            owners = np.zeros(max(16, self._owners.shape[0] * 2, row + 1), dtype=np.int64)
+            owners[:self._owners.shape[0]] = self._owners
+            self._owners = owners
+        self._owners[row] = self._ordinal(key[0])
+        self._owners_dirty = True
+
+    def _remove_item(self, key) -> None:
+        moved = self._items.remove(key)
+        if moved is not None:
+            # La última fila ocupa ahora `row` y conserva su dueño
+            row, last = moved
+            self._owners[row] = self._owners[last]
+            self._owners_dirty = True
+
+    def _refresh_pose_items(self, person_id, entry: GalleryEntry) -> None:
+        by_bucket: Dict[str, List[np.ndarray]] = {}
+        for vector, bucket in zip(entry.embeddings, entry.buckets):
+            by_bucket.setdefault(bucket, []).append(vector)
+        # Buckets que salieron de la ventana de embeddings
+        if self._items is not None:
+            for bucket in set(entry.indexed_buckets) - set(by_bucket):
+                self._remove_item((person_id, bucket))
+        entry.indexed_buckets = []
+        for bucket, vectors in by_bucket.items():
+            centroid = normalize(np.mean(vectors, axis=0))
+            if centroid is not None:
+                self._upsert_item((person_id, bucket), centroid)
+                entry.indexed_buckets.append(bucket)
+
+    def _queries(self, embeddings) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.zeros((len(embeddings), self.dim), dtype=np.float32)
+        for i, e in enumerate(embeddings):
+            v = np.asarray(e, dtype=np.float32).reshape(-1)
+            if v.shape[0] == self.dim:
+                queries[i] = v
+        norms = np.linalg.norm(queries, axis=1)
+        valid = (norms > 0) & np.isfinite(norms)
+        queries = queries / np.where(valid, norms, 1.0)[:, None]
+        return queries, valid
+
+    def _refresh_centroid(self, person_id, entry: GalleryEntry) -> None:
+        centroid = normalize(np.mean(entry.embeddings, axis=0))
+        entry.centroid = centroid
+        if centroid is None:
+            return
+        if self._index is None:
+            self.dim = self.dim or centroid.shape[0]
+            self._index = self._create_index(self.dim)
+        if centroid.shape[0] != self.dim:
+            logger.warning("Embedding dim %s does not match gallery dim %s; person %s skipped",
+                           centroid.shape[0], self.dim, person_id)
+            return
+        self._index.upsert(person_id, centroid)
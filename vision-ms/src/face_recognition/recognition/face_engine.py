@@ -3,47 +3,157 @@ import cv2
 import base64
 import insightface
 import logging
-from typing import List, Optional
+import numpy as np
+import onnxruntime
+from typing import Callable, List, Optional, Sequence, Tuple
+from insightface.app.common import Face
+from insightface.utils import face_align
 from ..dto.person_dto import PoseDTO, FaceExtractedDTO
 from ...helpers.constants.constants import constants
 
 logger = logging.getLogger(__name__)
 
+# Recibe los rostros detectados en un frame y devuelve los índices de los que hay que reconocer
+FaceSelector = Callable[[List[Face]], Sequence[int]]
+
+_GRAPH_OPTIMIZATION_LEVELS = {
+    "disabled": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+_EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def resolve_providers(names: str) -> List[str]:
+    """Providers pedidos (separados por coma) que existen en este onnxruntime, en orden de preferencia."""
+    available = set(onnxruntime.get_available_providers())
+    providers = [name.strip() for name in names.split(",") if name.strip() in available]
+    return providers or ["CPUExecutionProvider"]
+
+
+def build_session_options(intra_op_threads: Optional[int] = None) -> onnxruntime.SessionOptions:
+    """SessionOptions de onnxruntime a partir de FACE_ENGINE_*; 0 threads = lo decide onnxruntime."""
+    options = onnxruntime.SessionOptions()
+    intra = intra_op_threads if intra_op_threads is not None else constants["FACE_ENGINE_INTRA_OP_THREADS"]
+    options.intra_op_num_threads = max(0, intra)
+    options.inter_op_num_threads = max(0, constants["FACE_ENGINE_INTER_OP_THREADS"])
+    options.graph_optimization_level = _GRAPH_OPTIMIZATION_LEVELS.get(
+        constants["FACE_ENGINE_GRAPH_OPTIMIZATION"], onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    options.execution_mode = _EXECUTION_MODES.get(
+        constants["FACE_ENGINE_EXECUTION_MODE"], onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    )
+    options.enable_cpu_mem_arena = constants["FACE_ENGINE_CPU_MEM_ARENA"]
+    options.enable_mem_pattern = constants["FACE_ENGINE_MEM_PATTERN"]
+    return options
+
 class FaceEngine:
     
-    def __init__(self):
+    def __init__(self, intra_op_threads: Optional[int] = None):
         # Configuración
         self.jpeg_quality: int = constants["INGEST_JPEG_QUALITY"]
         self.thumbnail_width: int = constants["INGEST_THUMBNAIL_WIDTH"]
         self.thumbnail_height: int = constants["INGEST_THUMBNAIL_HEIGHT"]
+        self.providers: List[str] = resolve_providers(constants["FACE_ENGINE_PROVIDERS"])
+        self.session_options = build_session_options(intra_op_threads)
         # Inicializar InsightFace
         try:
-            self.model = insightface.app.FaceAnalysis(name="buffalo_l", allowed_modules=["detection", "recognition"])
-            self.model.providers = ["CoreMLExecutionProvider", "CPUExecutionProvider"]
-            self.model.prepare(ctx_id=-1, det_size=(512, 512))
-            logger.info("FaceEngine inicializado correctamente.")
+            # Los providers tienen que pasarse al construir FaceAnalysis: ahí se crean las sesiones ONNX
+            self.model = insightface.app.FaceAnalysis(
+                name="buffalo_l",
+                allowed_modules=["detection", "recognition"],
+                providers=self.providers,
+            )
+            # insightface 0.7.3 no propaga sess_options a onnxruntime: se recrean las sesiones con ellas
+            for model in self.model.models.values():
+                model.session = onnxruntime.InferenceSession(
+                    model.model_file,
+                    sess_options=self.session_options,
+                    providers=self.providers,
+                )
+            # ctx_id < 0 hace que insightface fuerce CPUExecutionProvider en cada modelo
+            ctx_id = -1 if self.providers[0] == "CPUExecutionProvider" else 0
+            self.model.prepare(ctx_id=ctx_id, det_size=(512, 512))
+            logger.info(
+                "FaceEngine inicializado correctamente (providers=%s, intra_op_threads=%s).",
+                self.providers, self.session_options.intra_op_num_threads,
+            )
         except Exception as e:
             logger.exception("Error inicializando FaceAnalysis: %s", str(e))
             raise e
 
-    def extract(self, frame_bgr) -> List[FaceExtractedDTO]:
+    def extract(self, frame_bgr, select: Optional[FaceSelector] = None) -> List[FaceExtractedDTO]:
+        return self.extract_batch([frame_bgr], [select])[0]
+
+    def extract_batch(self, frames_bgr: Sequence,
+                      selectors: Optional[Sequence[Optional[FaceSelector]]] = None) -> List[List[FaceExtractedDTO]]:
+        """Detecta en cada frame y calcula los embeddings de todos los rostros en una sola inferencia.
+
+        Si hay `selectors`, solo se reconocen (y devuelven) los rostros que elija
+        el selector de cada frame (p. ej. el tracker de la cámara).
+        """
+        detections = [self.detect(frame) for frame in frames_bgr]
+        if selectors is not None:
+            detections = [
+                (frame_rgb, [faces[i] for i in select(faces)] if select is not None else faces)
+                for (frame_rgb, faces), select in zip(detections, selectors)
+            ]
+        self.recognize(detections)
+        return [self.build_results(frame, faces) for frame, (_, faces) in zip(frames_bgr, detections)]
+
+    def detect(self, frame_bgr) -> Tuple[Optional[np.ndarray], List[Face]]:
+        """Detección de un frame. Devuelve (frame RGB de entrada del modelo, rostros sin embedding)."""
         if frame_bgr is None:
             logger.warning("Frame vacío recibido en extract()")
-            return []
+            return None, []
         # Convertir a RGB
         try:
             frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
         except Exception as e:
             logger.error("Error convirtiendo frame a RGB: %s", e)
-            return []
+            return None, []
 
         # Detección del modelo
         try:
-            faces = self.model.get(frame_rgb)
+            bboxes, kpss = self.model.det_model.detect(frame_rgb, max_num=0, metric="default")
         except Exception as e:
             logger.error("Error ejecutando face detection: %s", e)
-            return []
+            return frame_rgb, []
+
+        faces = [
+            Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+            for i in range(bboxes.shape[0])
+        ]
+        return frame_rgb, faces
+
+    def recognize(self, detections: Sequence[Tuple[Optional[np.ndarray], List[Face]]]) -> None:
+        """Embeddings de todos los rostros de todos los frames en un único get_feat (batch ONNX)."""
+        recognizer = self.model.models.get("recognition")
+        if recognizer is None:
+            return
+        crops, owners = [], []
+        for frame_rgb, faces in detections:
+            for face in faces:
+                if frame_rgb is None or face.kps is None:
+                    continue
+                crops.append(face_align.norm_crop(frame_rgb, landmark=face.kps, image_size=recognizer.input_size[0]))
+                owners.append(face)
+        if not crops:
+            return
+
+        try:
+            features = recognizer.get_feat(crops)
+        except Exception as e:
+            logger.error("Error ejecutando face recognition: %s", e)
+            return
+        for face, feature in zip(owners, features):
+            face.embedding = feature.flatten()
 
+    def build_results(self, frame_bgr, faces: List[Face]) -> List[FaceExtractedDTO]:
         results: list[FaceExtractedDTO] = []
         for face in faces:
 
@@ -68,7 +178,8 @@ class FaceEngine:
             
             logger.debug(f"Raw face.pose => {getattr(face, 'pose', None)}")
             
-            results.append(FaceExtractedDTO(score=score, pose=pose, bbox=bbox, embedding=emb, thumbnail=thumbnail_b64))
+            results.append(FaceExtractedDTO(score=score, pose=pose, bbox=bbox, embedding=emb, thumbnail=thumbnail_b64,
+                                            trackId=face.track_id))
         return results
 
 
@@ -0,0 +1,170 @@
+from __future__ import annotations
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Lado (px) a partir del cual un rostro tiene la resolución de entrada de ArcFace
+RECOGNITION_FACE_SIZE = 112.0
+
+
+def face_quality(bbox, score: float) -> float:
+    """Calidad para decidir si vale la pena re-reconocer: score de detección ponderado por tamaño."""
+    x1, y1, x2, y2 = [float(v) for v in bbox[:4]]
+    side = np.sqrt(max(0.0, x2 - x1) * max(0.0, y2 - y1))
+    return float(score) * min(1.0, float(side) / RECOGNITION_FACE_SIZE)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU de cada bbox de `a` (N, 4) contra cada bbox de `b` (M, 4)."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.where(union > 0, union, 1.0), 0.0)
+
+
+@dataclass
+class Track:
+    track_id: int
+    bbox: np.ndarray
+    quality: float
+    # Calidad del último rostro enviado a reconocimiento
+    recognized_quality: float = 0.0
+    frames_since_recognition: int = 0
+    missed: int = 0
+    hits: int = 1
+    recognitions: int = 0
+    # Resultado del último matching, reutilizado durante el resto del track
+    person_id: Optional[object] = None
+    distance: Optional[float] = None
+
+
+class FaceTracker:
+    """Tracker de rostros de una cámara por asociación IoU / centroide entre frames.
+
+    `update` recibe las detecciones de un frame, les asigna un track_id y dice
+    cuáles hay que reconocer: tracks nuevos, tracks cuya calidad mejoró
+    `quality_gain` veces respecto al último reconocimiento, o cada
+    `recognize_every` frames. El resto reutiliza el matching del track
+    (`identity`). Un track desaparece tras `max_missed` frames sin detección.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, centroid_ratio: float = 0.5, max_missed: int = 10,
+                 recognize_every: int = 25, quality_gain: float = 1.25) -> None:
+        self.iou_threshold = iou_threshold
+        self.centroid_ratio = centroid_ratio
+        self.max_missed = max(0, max_missed)
+        self.recognize_every = max(1, recognize_every)
+        self.quality_gain = max(1.0, quality_gain)
+        self.tracks: Dict[int, Track] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        # Métricas
+        self.detections = 0
+        self.recognitions = 0
+
+    def update(self, bboxes: Sequence, scores: Sequence[float]) -> Tuple[List[int], List[bool]]:
+        """Asocia las detecciones del frame; devuelve (track_id, reconocer?) por detección."""
+        boxes = np.asarray([np.asarray(b, dtype=np.float32)[:4] for b in bboxes], dtype=np.float32).reshape(-1, 4)
+        with self._lock:
+            assigned = self._associate(boxes)
+            track_ids: List[int] = []
+            recognize: List[bool] = []
+            for i, (box, score) in enumerate(zip(boxes, scores)):
+                quality = face_quality(box, score)
+                track = self.tracks.get(assigned[i]) if assigned[i] is not None else None
+                if track is None:
+                    track = Track(track_id=self._next_id, bbox=box, quality=quality)
+                    self._next_id += 1
+                    self.tracks[track.track_id] = track
+                    needs = True
+                else:
+                    track.bbox = box
+                    track.quality = quality
+                    track.missed = 0
+                    track.hits += 1
+                    track.frames_since_recognition += 1
+                    needs = (
+                        track.frames_since_recognition >= self.recognize_every
+                        or quality >= track.recognized_quality * self.quality_gain
+                    )
+                if needs:
+                    track.frames_since_recognition = 0
+                    track.recognized_quality = quality
+                    track.recognitions += 1
+                    self.recognitions += 1
+                track_ids.append(track.track_id)
+                recognize.append(bool(needs))
+
+            self.detections += len(track_ids)
+            self._expire(set(track_ids))
+            return track_ids, recognize
+
+    def set_identity(self, track_id: Optional[int], person_id, distance: float) -> None:
+        if track_id is None:
+            return
+        with self._lock:
+            track = self.tracks.get(track_id)
+            if track is not None:
+                track.person_id = person_id
+                track.distance = distance
+
+    def identity(self, track_id: int) -> Tuple[Optional[object], Optional[float]]:
+        with self._lock:
+            track = self.tracks.get(track_id)
+            return (track.person_id, track.distance) if track is not None else (None, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tracks": len(self.tracks),
+                "detections": self.detections,
+                "recognitions": self.recognitions,
+                "recognition_ratio": round(self.recognitions / self.detections, 3) if self.detections else 0.0,
+            }
+
+    def _associate(self, boxes: np.ndarray) -> List[Optional[int]]:
+        """Asignación greedy por IoU; si no solapan, por distancia de centroides relativa al tamaño."""
+        assigned: List[Optional[int]] = [None] * boxes.shape[0]
+        if not self.tracks or boxes.shape[0] == 0:
+            return assigned
+        track_ids = list(self.tracks.keys())
+        previous = np.stack([self.tracks[t].bbox for t in track_ids])
+
+        affinity = iou_matrix(boxes, previous)
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        prev_centers = (previous[:, :2] + previous[:, 2:]) / 2
+        sizes = np.maximum(previous[:, 2] - previous[:, 0], previous[:, 3] - previous[:, 1])
+        distance = np.linalg.norm(centers[:, None, :] - prev_centers[None, :, :], axis=2) / np.maximum(sizes, 1.0)
+        # Sin IoU suficiente pero cerca: afinidad menor que cualquier match por IoU
+        near = (affinity < self.iou_threshold) & (distance <= self.centroid_ratio)
+        affinity = np.where(affinity >= self.iou_threshold, 1.0 + affinity, 0.0)
+        affinity = np.where(near, 1.0 - distance / (2 * self.centroid_ratio), affinity)
+
+        used_tracks = set()
+        for flat in np.argsort(-affinity, axis=None):
+            det, col = np.unravel_index(flat, affinity.shape)
+            if affinity[det, col] <= 0:
+                break
+            if assigned[det] is not None or col in used_tracks:
+                continue
+            assigned[det] = track_ids[col]
+            used_tracks.add(col)
+        return assigned
+
+    def _expire(self, seen: set) -> None:
+        for track_id in list(self.tracks.keys()):
+            if track_id in seen:
+                continue
+            track = self.tracks[track_id]
+            track.missed += 1
+            if track.missed > self.max_missed:
+                del self.tracks[track_id]
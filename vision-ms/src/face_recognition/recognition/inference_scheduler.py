@@ -0,0 +1,136 @@
+from __future__ import annotations
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+from ...helpers.utils.engine_pool import FaceEnginePool
+from .face_engine import FaceSelector
+from ..dto.person_dto import FaceExtractedDTO
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceScheduler:
+    """Agrupa los frames de todas las cámaras en micro-batches para el FaceEngine.
+
+    Cada RabbitConsumer llama a `submit(frame)` y espera el Future. Un thread
+    toma el primer frame pendiente y sigue juntando hasta `max_batch_size`
+    frames o hasta que pasan `max_wait_ms`; luego detecta en cada frame y
+    calcula los embeddings de todos los rostros del batch en una sola
+    inferencia ONNX (FaceEngine.extract_batch), y resuelve el Future de cada
+    cámara con sus rostros. Hay un thread por engine del pool, de modo que
+    cada sesión ONNX procesa su propio batch en paralelo.
+    """
+
+    def __init__(self, engine: FaceEnginePool, max_batch_size: int, max_wait_ms: float,
+                 workers: Optional[int] = None) -> None:
+        self._engine = engine
+        self.workers = max(1, workers or engine.size)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_seconds = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[Optional[Tuple[object, Optional[FaceSelector], Future]]]" = queue.Queue()
+        self._stop_event = threading.Event()
+        self._metrics_lock = threading.Lock()
+        # Métricas
+        self.batches = 0
+        self.frames = 0
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+        self._threads = [
+            threading.Thread(target=self._run, name=f"face-inference-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, frame, select: Optional[FaceSelector] = None) -> "Future[List[FaceExtractedDTO]]":
+        future: "Future[List[FaceExtractedDTO]]" = Future()
+        if self._stop_event.is_set():
+            future.set_exception(RuntimeError("InferenceScheduler is stopped"))
+            return future
+        self._queue.put((frame, select, future))
+        return future
+
+    def extract(self, frame, select: Optional[FaceSelector] = None,
+                timeout: Optional[float] = None) -> List[FaceExtractedDTO]:
+        return self.submit(frame, select).result(timeout=timeout)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "avg_batch_size": round(self.frames / self.batches, 2) if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": round(self.last_batch_ms, 1),
+            "pending": self._queue.qsize(),
+        }
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        # Lo que quedó en cola no se procesa
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[2].set_exception(RuntimeError("InferenceScheduler is stopped"))
+
+    def _collect(self) -> List[Tuple[object, Optional[FaceSelector], Future]]:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Aviso de parada para otro worker: se devuelve a la cola
+                self._stop_event.set()
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        logger.info("InferenceScheduler worker started (max_batch=%s, max_wait=%.0fms)",
+                    self.max_batch_size, self.max_wait_seconds * 1000)
+        while not self._stop_event.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            # Frames cuyo consumer ya no espera (cancelados) no se procesan
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            try:
+                results = self._engine.extract_batch(
+                    [frame for frame, _, _ in batch],
+                    [select for _, select, _ in batch],
+                )
+            except Exception as e:
+                logger.exception("Error en inferencia por batch: %s", e)
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, _, future), faces in zip(batch, results):
+                future.set_result(faces)
+            with self._metrics_lock:
+                self.batches += 1
+                self.frames += len(batch)
+                self.last_batch_size = len(batch)
+                self.last_batch_ms = (time.perf_counter() - started) * 1000
+        logger.info("InferenceScheduler worker stopped")
@@ -0,0 +1,410 @@
+from __future__ import annotations
+import logging
+import math
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_EXACT = "exact"
+INDEX_IVF = "ivf"
+
+
+class ExactIndex:
+    """Vectores L2-normalizados en una matriz float32 contigua; búsqueda por fuerza bruta (GEMM).
+
+    La fila `i` pertenece a `keys[i]`. Las altas crecen la matriz por
+    duplicación (amortizado) y las bajas mueven la última fila al hueco.
+    """
+
+    def __init__(self, dim: int) -> None:
+        self.dim = dim
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        self._keys = np.empty(0, dtype=object)
+        self._rows: Dict[object, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key) -> bool:
+        return key in self._rows
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:self._size]
+
+    @property
+    def keys(self) -> np.ndarray:
+        return self._keys[:self._size]
+
+    def row_of(self, key) -> Optional[int]:
+        return self._rows.get(key)
+
+    def upsert(self, key, vector: np.ndarray) -> int:
+        row = self._rows.get(key)
+        if row is None:
+            row = self._append(key)
+        self._matrix[row] = vector
+        return row
+
+    def remove(self, key) -> Optional[Tuple[int, int]]:
+        """Elimina `key`; devuelve (fila liberada, fila movida a ella) o None."""
+        row = self._rows.pop(key, None)
+        if row is None:
+            return None
+        last = self._size - 1
+        if row != last:
+            moved = self._keys[last]
+            self._matrix[row] = self._matrix[last]
+            self._keys[row] = moved
+            self._rows[moved] = row
+        self._keys[last] = None
+        self._size = last
+        return row, last
+
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k por similitud coseno. Devuelve (filas, similitudes) de forma (Q, k); -1 = sin resultado."""
+        return _top_k(queries @ self.matrix.T, k)
+
+    def _append(self, key) -> int:
+        if self._size == self._matrix.shape[0]:
+            capacity = max(16, self._matrix.shape[0] * 2)
+            matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            keys = np.empty(capacity, dtype=object)
+            keys[:self._size] = self._keys[:self._size]
+            self._matrix, self._keys = matrix, keys
+        row = self._size
+        self._keys[row] = key
+        self._rows[key] = row
+        self._size += 1
+        return row
+
+
+class IVFIndex(ExactIndex):
+    """Índice IVF (inverted file) con cuantización gruesa por k-means esférico.
+
+    Los vectores se reparten en `nlist` listas según su centroide más cercano;
+    una búsqueda solo compara contra las `nprobe` listas más cercanas a la
+    consulta, así que `nprobe` es el control recall/latencia (nprobe = nlist
+    equivale a búsqueda exacta). Por debajo de `min_train_size` vectores se
+    busca por fuerza bruta. Las altas y bajas son incrementales; el k-means se
+    re-entrena cuando el índice creció `rebuild_growth` veces desde el último
+    entrenamiento, o cuando se eliminó la mitad de lo entrenado, para que las
+    listas no se desbalanceen.
+
+    Con `background_rebuild` el re-entrenamiento corre en un thread aparte sobre
+    una copia de la matriz: el índice se usa desde el event loop y un k-means
+    sobre decenas de miles de vectores tarda segundos. Mientras tanto las altas
+    van a las listas actuales y el resultado se instala en la siguiente
+    operación; las filas que cambiaron durante el entrenamiento se reasignan a
+    los centroides nuevos al instalarlo (`_origin`).
+
+    Las listas invertidas son arrays: `_assignment` (cluster de cada fila) y,
+    derivados de él al buscar si hubo cambios, las filas ordenadas por cluster
+    con el offset de cada lista (formato CSR). Así los candidatos de todas las
+    consultas se juntan con operaciones vectorizadas.
+    """
+
+    # Un solo thread para todos los índices: acota la CPU de los re-entrenamientos
+    _trainer: Optional[ThreadPoolExecutor] = None
+    _trainer_lock = threading.Lock()
+
+    def __init__(self, dim: int, nlist: int = 0, nprobe: int = 8, min_train_size: int = 2048,
+                 rebuild_growth: float = 2.0, kmeans_iterations: int = 10, max_train_samples: int = 32768,
+                 seed: int = 0, background_rebuild: bool = True) -> None:
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = max(1, nprobe)
+        self.min_train_size = min_train_size
+        self.rebuild_growth = max(1.1, rebuild_growth)
+        self.kmeans_iterations = kmeans_iterations
+        self.max_train_samples = max_train_samples
+        self._rng = np.random.default_rng(seed)
+        self._centroids: Optional[np.ndarray] = None
+        self._assignment = np.zeros(0, dtype=np.int32)
+        # CSR de las listas invertidas; se recalcula en la próxima búsqueda tras altas/bajas
+        self._list_rows = np.zeros(0, dtype=np.int64)
+        self._list_offsets = np.zeros(1, dtype=np.int64)
+        self._lists_dirty = True
+        self._trained_size = 0
+        self._removed_since_train = 0
+        self.rebuilds = 0
+        self.background_rebuild = background_rebuild
+        # Entrenamiento en curso y, por fila actual, la fila de la copia entrenada de la que
+        # viene su vector (-1 = alta o cambio posterior a la copia)
+        self._pending: Optional[Future] = None
+        self._origin: Optional[np.ndarray] = None
+        self._removed_at_snapshot = 0
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    @property
+    def nlist_trained(self) -> int:
+        """Cantidad de listas del último entrenamiento (0 sin entrenar)."""
+        return 0 if self._centroids is None else self._centroids.shape[0]
+
+    def list_sizes(self) -> np.ndarray:
+        """Vectores por lista invertida."""
+        if not self.trained:
+            return np.zeros(0, dtype=np.int64)
+        return np.diff(self._inverted_lists()[1])
+
+    def stats(self) -> dict:
+        sizes = self.list_sizes()
+        return {
+            "vectors": self._size,
+            "trained": self.trained,
+            "nlist": self.nlist_trained,
+            "nprobe": self.nprobe,
+            "rebuilds": self.rebuilds,
+            "rebuilding": self._pending is not None,
+            "list_size_min": int(sizes.min()) if sizes.size else 0,
+            "list_size_max": int(sizes.max()) if sizes.size else 0,
+            "list_size_mean": round(float(sizes.mean()), 1) if sizes.size else 0.0,
+        }
+
+    def upsert(self, key, vector: np.ndarray) -> int:
+        self._poll_rebuild()
+        row = super().upsert(key, vector)
+        self._assignment = _grow(self._assignment, self._matrix.shape[0])
+        if self._origin is not None:
+            self._origin = _grow(self._origin, self._matrix.shape[0])
+            self._origin[row] = -1
+
+        if self.trained:
+            self._assign_row(row, int(np.argmax(self._centroids @ vector)))
+            if self._size >= self._trained_size * self.rebuild_growth:
+                self._request_rebuild()
+        elif self._size >= self.min_train_size:
+            self._request_rebuild()
+        return row
+
+    def remove(self, key) -> Optional[Tuple[int, int]]:
+        self._poll_rebuild()
+        moved = super().remove(key)
+        if moved is None:
+            return moved
+        row, last = moved
+        # La última fila ocupa ahora `row` y conserva su cluster y su origen
+        if self._origin is not None:
+            self._origin[row] = self._origin[last]
+            self._origin[last] = -1
+        if not self.trained:
+            return moved
+        self._removed_since_train += 1
+        self._assignment[row] = self._assignment[last]
+        self._assignment[last] = -1
+        self._lists_dirty = True
+        # Muchas bajas dejan centroides sin respaldo: se re-entrena
+        if self._removed_since_train * 2 >= self._trained_size:
+            self._request_rebuild()
+        return moved
+
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        self._poll_rebuild()
+        if not self.trained or self.nprobe >= self.nlist_trained:
+            return super().search(queries, k)
+
+        n_queries = queries.shape[0]
+        coarse = queries @ self._centroids.T
+        probes = np.argpartition(-coarse, self.nprobe - 1, axis=1)[:, :self.nprobe]
+        list_rows, offsets = self._inverted_lists()
+
+        # Candidatos de todas las consultas en un array plano, agrupados por consulta
+        starts = offsets[probes].ravel()
+        lengths = offsets[probes + 1].ravel() - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return (np.full((n_queries, k), -1, dtype=np.int64),
+                    np.full((n_queries, k), -np.inf, dtype=np.float32))
+        flat = np.arange(total) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        candidates = list_rows[flat]
+        per_query = lengths.reshape(n_queries, -1).sum(axis=1)
+        query_of = np.repeat(np.arange(n_queries), per_query)
+        column = np.arange(total) - np.repeat(np.cumsum(per_query) - per_query, per_query)
+
+        # Similitud de cada candidato con su consulta, en una matriz (Q, max candidatos) rellena con -inf
+        width = int(per_query.max())
+        padded_rows = np.full((n_queries, width), -1, dtype=np.int64)
+        padded_sims = np.full((n_queries, width), -np.inf, dtype=np.float32)
+        padded_rows[query_of, column] = candidates
+        padded_sims[query_of, column] = np.einsum("ij,ij->i", self._matrix[candidates], queries[query_of])
+
+        top, sims = _top_k(padded_sims, k)
+        found = (top >= 0) & np.isfinite(sims)
+        rows = np.where(found, np.take_along_axis(padded_rows, np.maximum(top, 0), axis=1), -1)
+        return rows, np.where(found, sims, -np.inf).astype(np.float32)
+
+    def rebuild(self) -> None:
+        """Re-entrena el k-means sobre (una muestra de) los vectores y reasigna todas las filas.
+
+        Síncrono; si había un entrenamiento en segundo plano, su resultado se descarta.
+        """
+        if self._size < self.min_train_size:
+            return
+        self._pending = self._origin = None
+        data = self.matrix
+        centroids, assignment = _train(data, self._nlist_for(self._size), self.kmeans_iterations,
+                                       self.max_train_samples, self._train_seed())
+        self._install(centroids, assignment, np.arange(self._size), self._removed_since_train)
+
+    def wait_rebuild(self, timeout: Optional[float] = None) -> None:
+        """Espera el entrenamiento en segundo plano (si hay uno) y lo instala."""
+        if self._pending is not None:
+            try:
+                self._pending.result(timeout=timeout)
+            except Exception:
+                pass
+            self._poll_rebuild()
+
+    def _nlist_for(self, size: int) -> int:
+        return self.nlist or int(min(4096, max(16, 4 * math.sqrt(size))))
+
+    def _train_seed(self) -> int:
+        # El Generator no se comparte con el thread de entrenamiento
+        return int(self._rng.integers(1 << 63))
+
+    def _request_rebuild(self) -> None:
+        if self._pending is not None:
+            return
+        if not self.background_rebuild:
+            self.rebuild()
+            return
+        size = self._size
+        if size < self.min_train_size:
+            return
+        self._origin = np.full(self._matrix.shape[0], -1, dtype=np.int64)
+        self._origin[:size] = np.arange(size)
+        self._removed_at_snapshot = self._removed_since_train
+        self._pending = self._executor().submit(
+            _train, self.matrix.copy(), self._nlist_for(size), self.kmeans_iterations, self.max_train_samples,
+            self._train_seed(),
+        )
+
+    def _poll_rebuild(self) -> None:
+        """Instala el entrenamiento en segundo plano si ya terminó."""
+        pending = self._pending
+        if pending is None or not pending.done():
+            return
+        self._pending = None
+        origin, self._origin = self._origin, None
+        try:
+            centroids, assignment = pending.result()
+        except Exception as ex:
+            logger.error("IVF index rebuild failed: %s", ex)
+            return
+        self._install(centroids, assignment[origin[:self._size].clip(min=0)], origin[:self._size],
+                      self._removed_at_snapshot)
+
+    def _install(self, centroids: np.ndarray, assignment: np.ndarray, origin: np.ndarray, removed_before: int) -> None:
+        """Reemplaza centroides y listas de una vez. `assignment[i]` vale para la fila `i` si `origin[i] >= 0`;
+        las demás cambiaron después de la copia entrenada y se reasignan acá."""
+        fresh = np.full(self._matrix.shape[0], -1, dtype=np.int32)
+        fresh[:self._size] = assignment
+        stale = np.flatnonzero(origin < 0)
+        if stale.size:
+            fresh[stale] = np.argmax(self._matrix[stale] @ centroids.T, axis=1)
+
+        self._centroids = centroids
+        self._assignment = fresh
+        self._lists_dirty = True
+        self._trained_size = self._size
+        self._removed_since_train -= removed_before
+        self.rebuilds += 1
+        logger.info("IVF index rebuilt: vectors=%s, nlist=%s, nprobe=%s", self._size, centroids.shape[0], self.nprobe)
+
+    @classmethod
+    def _executor(cls) -> ThreadPoolExecutor:
+        with cls._trainer_lock:
+            if cls._trainer is None:
+                cls._trainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ivf-train")
+            return cls._trainer
+
+    def _assign_row(self, row: int, cluster: int) -> None:
+        if self._assignment[row] != cluster:
+            self._assignment[row] = cluster
+            self._lists_dirty = True
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(filas ordenadas por cluster, offset de cada lista); recalculado solo si hubo cambios."""
+        if self._lists_dirty:
+            assignment = self._assignment[:self._size]
+            self._list_rows = np.argsort(assignment, kind="stable").astype(np.int64)
+            counts = np.bincount(assignment, minlength=self.nlist_trained)
+            self._list_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+            self._lists_dirty = False
+        return self._list_rows, self._list_offsets
+
+
+def _grow(values: np.ndarray, capacity: int) -> np.ndarray:
+    """Extiende `values` a `capacity` rellenando con -1."""
+    if values.shape[0] >= capacity:
+        return values
+    grown = np.full(capacity, -1, dtype=values.dtype)
+    grown[:values.shape[0]] = values
+    return grown
+
+
+def _train(data: np.ndarray, nlist: int, iterations: int, max_samples: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """k-means sobre una muestra de `data` y cluster de cada fila. Corre fuera del event loop."""
+    rng = np.random.default_rng(seed)
+    sample = data
+    if data.shape[0] > max_samples:
+        sample = data[rng.choice(data.shape[0], max_samples, replace=False)]
+    centroids = _spherical_kmeans(sample, nlist, iterations, rng)
+    return centroids, np.argmax(data @ centroids.T, axis=1).astype(np.int32)
+
+
+def _top_k(sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    n = sims.shape[1]
+    if n == 0:
+        return (np.full((sims.shape[0], k), -1, dtype=np.int64),
+                np.full((sims.shape[0], k), -np.inf, dtype=np.float32))
+    if k == 1:
+        rows = np.argmax(sims, axis=1)[:, None]
+    else:
+        kk = min(k, n)
+        part = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+        order = np.argsort(-np.take_along_axis(sims, part, axis=1), axis=1)
+        rows = np.take_along_axis(part, order, axis=1)
+    out_sims = np.take_along_axis(sims, rows, axis=1).astype(np.float32)
+    if rows.shape[1] < k:
+        pad = k - rows.shape[1]
+        rows = np.pad(rows, ((0, 0), (0, pad)), constant_values=-1)
+        out_sims = np.pad(out_sims, ((0, 0), (0, pad)), constant_values=-np.inf)
+    return rows.astype(np.int64), out_sims
+
+
+def _spherical_kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    k = min(k, data.shape[0])
+    centroids = data[rng.choice(data.shape[0], k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        # Suma por cluster: ordenar por asignación y reducir por segmentos (np.add.at es muy lento)
+        order = np.argsort(assignment, kind="stable")
+        sorted_assignment = assignment[order]
+        starts = np.flatnonzero(np.r_[True, sorted_assignment[1:] != sorted_assignment[:-1]])
+        sums[sorted_assignment[starts]] = np.add.reduceat(data[order], starts, axis=0)
+        counts = np.bincount(assignment, minlength=k)
+        # Clusters vacíos: se re-siembran con vectores al azar
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(data.shape[0], int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms > 0, norms, 1.0)
+    return centroids.astype(np.float32)
+
+
+def create_index(kind: str, dim: int, nlist: int = 0, nprobe: int = 8, min_train_size: int = 2048) -> ExactIndex:
+    if kind == INDEX_IVF:
+        return IVFIndex(dim, nlist=nlist, nprobe=nprobe, min_train_size=min_train_size)
+    if kind != INDEX_EXACT:
+        logger.warning("Unknown face match index '%s'; using exact search", kind)
+    return ExactIndex(dim)
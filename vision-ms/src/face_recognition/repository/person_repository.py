@@ -1,48 +1,104 @@
 from __future__ import annotations
+import asyncio
 import logging
 from dataclasses import asdict
-from typing import Optional, List
+from collections.abc import Mapping
+from typing import Dict, Optional, List, Set, Union
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from pymongo import ReturnDocument
-from ..dto.person_dto import PersonDTO, FaceEmbeddingDTO, RiskLevel, FaceSource
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from ..dto.person_dto import PersonDTO, PersonIndexDTO, FaceEmbeddingDTO, PoseDTO, SightingDTO, RiskLevel, FaceSource
+from .write_behind import WriteBehindQueue
+from ...helpers.constants.constants import constants
+from ...helpers.dto.person_summary_dto import PersonSummaryDTO
+from ...helpers.utils.embedding_codec import (
+    decode_embedding, decode_embedding_list, embedding_header, encode_embedding_doc, encode_embeddings_doc,
+    legacy_migration,
+)
 from ...helpers.utils.utils import generate_unique_number
 
 logger = logging.getLogger(__name__)
 
+# Vistas de lectura (projection en Mongo + tipo devuelto):
+# full = PersonDTO con embeddings hidratados al acceder; identity = PersonSummaryDTO;
+# index = PersonIndexDTO (identidad + vectores y pose, sin thumbnails) para cargar la galería
+VIEW_FULL = "full"
+VIEW_IDENTITY = "identity"
+VIEW_INDEX = "index"
+
+# Campos de PersonSummaryDTO: identidad sin embeddings ni thumbnails
+IDENTITY_PROJECTION = {"userId": 1, "displayName": 1, "riskLevel": 1, "tags": 1, "metadata.seenCount": 1}
+INDEX_PROJECTION = {
+    **IDENTITY_PROJECTION,
+    **{
+        f"embeddings.{group}.{field}": 1
+        for group in ("manual", "auto")
+        for field in ("embedding", "pose", "metadata.poseBucket")
+    },
+}
+_PROJECTIONS = {VIEW_FULL: None, VIEW_IDENTITY: IDENTITY_PROJECTION, VIEW_INDEX: INDEX_PROJECTION}
+
+PersonView = Union[PersonDTO, PersonSummaryDTO, PersonIndexDTO]
+
 class PersonRepository:
 
+    # Migraciones de formato compartidas por todas las instancias del proceso: _id con la
+    # recodificación en vuelo (no se vuelve a encolar hasta que se confirme) y documentos confirmados
+    _migrating: Set[object] = set()
+    _migration_tasks: Set[asyncio.Task] = set()
+    migrated = 0
+
+    @classmethod
+    def migration_stats(cls) -> dict:
+        return {"in_flight": len(cls._migrating), "migrated_docs": cls.migrated}
+
     def __init__(self, db: AsyncIOMotorDatabase):
         self.col = db["vision_persons"]
+        # create / add_embedding(s) / record_sightings se escriben en bulk_write por detrás
+        self._writes = WriteBehindQueue.for_collection(self.col)
         logger.info("PersonRepository inicializado con colección 'vision_persons'")
 
 
-    async def create(self, dto: PersonDTO) -> int:
+    async def create(self, dto: PersonDTO, new_id: Optional[int] = None) -> int:
+        """Inserta por la cola write-behind y espera el bulk_write; RuntimeError si no se aplicó.
+
+        `new_id` permite al caller conocer el _id antes de la escritura (si no, se genera aquí).
+        """
         logger.info("Creando nueva registro...")
         try:
             doc = asdict(dto)
-            new_id = generate_unique_number()
+            new_id = new_id if new_id is not None else generate_unique_number()
             doc["_id"] = new_id
             doc.pop("id", None)
             doc.setdefault("embeddings", {"manual": [], "auto": []})
-            
-            await self.col.insert_one(doc)
+            encode_embeddings_doc(doc["embeddings"])
+
+            # El _id no lo asigna Mongo, así que el insert puede ir por la cola write-behind
+            if not await self._writes.enqueue(InsertOne(doc), key=new_id, wait=True):
+                raise RuntimeError(f"No se pudo insertar el registro ID={new_id}")
             logger.info(f"Registro creada con ID={new_id}")
             return new_id
         except Exception as e:
             logger.exception(f"Error creando el registro: {e}")
             raise e
 
-    async def get(self, id: int) -> Optional[PersonDTO]:
+    async def get(self, id: int, view: str = VIEW_FULL) -> Optional[PersonView]:
         logger.debug(f"Obteniendo el registro ID={id}")
-        doc = await self.col.find_one({"_id": id})
+        doc = await self.col.find_one({"_id": id}, _PROJECTIONS[view])
         if not doc:
             logger.warning(f"ID={id} no encontrada")
             return None
-        return self._to_dto(doc)
+        await self._migrate(doc, view)
+        return self._convert(doc, view)
+
+    async def get_identity(self, id: int) -> Optional[PersonSummaryDTO]:
+        return await self.get(id, view=VIEW_IDENTITY)
 
-    async def list(self) -> List[PersonDTO]:
-        cursor = self.col.find({})
-        out = [self._to_dto(doc) async for doc in cursor]
+    async def list(self, view: str = VIEW_FULL) -> list[PersonView]:
+        cursor = self.col.find({}, _PROJECTIONS[view])
+        out = []
+        async for doc in cursor:
+            await self._migrate(doc, view)
+            out.append(self._convert(doc, view))
         return out
 
     async def update(self, id: int, dto: PersonDTO) -> Optional[PersonDTO]:
@@ -50,6 +106,7 @@ class PersonRepository:
         try:
             data = asdict(dto)
             data.pop("id", None)            
+            encode_embeddings_doc(data.get("embeddings"))
             result = await self.col.find_one_and_update(
                 {"_id": id},
                 {"$set": data},
@@ -61,15 +118,16 @@ class PersonRepository:
             logger.exception(f"Error actualizando el registro ID={id}: {e}")
             raise e
         
-    async def update_field(self, id: int, field: str, value) -> Optional[PersonDTO]:
+    async def update_field(self, id: int, field: str, value) -> bool:
+        """$set directo (sin write-behind); devuelve si la persona existía."""
         try:
             result = await self.col.find_one_and_update(
                 {"_id": id},
                 {"$set": {field: value}},
+                projection={"_id": 1},
                 upsert=False,
-                return_document=ReturnDocument.AFTER
             )
-            return self._to_dto(result) if result else None
+            return result is not None
         except Exception as e:
             logger.exception(f"Error actualizando campo '{field}' para el ID {id}: {e}")
             raise e
@@ -78,13 +136,17 @@ class PersonRepository:
         result = await self.col.delete_one({"_id": id})
         return result.deleted_count > 0
 
-    async def list_by_user(self, user_id: int) -> list[PersonDTO]:
-        cursor = self.col.find({"userId": user_id})
-        return [self._to_dto(doc) async for doc in cursor]
+    async def list_by_user(self, user_id: int, view: str = VIEW_FULL) -> list[PersonView]:
+        cursor = self.col.find({"userId": user_id}, _PROJECTIONS[view])
+        out = []
+        async for doc in cursor:
+            await self._migrate(doc, view)
+            out.append(self._convert(doc, view))
+        return out
 
     async def add_embedding(self, person_id: int, embedding: FaceEmbeddingDTO) -> Optional[FaceEmbeddingDTO]:
         embedding.id = generate_unique_number()
-        emb_dict = asdict(embedding)
+        emb_dict = encode_embedding_doc(asdict(embedding))
 
         if embedding.source == FaceSource.MANUAL_UPLOAD:
             update = {
@@ -102,8 +164,14 @@ class PersonRepository:
                 }
             }
 
-        result = await self.col.update_one({"_id": person_id}, update)
-        if result.modified_count == 0:
+        # Por la cola (queda ordenado tras un create aún pendiente de la misma persona) y esperando
+        # la escritura; el bulk_write no informa matched por operación, así que sin documento se
+        # detecta leyendo el _id una vez aplicada
+        if not await self._writes.enqueue(UpdateOne({"_id": person_id}, update), key=person_id, wait=True):
+            logger.error("No se pudo agregar el embedding al ID=%s", person_id)
+            return None
+        if await self.col.find_one({"_id": person_id}, {"_id": 1}) is None:
+            logger.warning("No se agregó el embedding: persona %s no existe", person_id)
             return None
         return embedding
 
@@ -115,9 +183,9 @@ class PersonRepository:
         for emb in embeddings:
             emb.id = generate_unique_number()
             if emb.source == FaceSource.MANUAL_UPLOAD:
-                manual_list.append(asdict(emb))
+                manual_list.append(encode_embedding_doc(asdict(emb)))
             else:
-                auto_list.append(asdict(emb))
+                auto_list.append(encode_embedding_doc(asdict(emb)))
 
         updates = {}
 
@@ -135,45 +203,116 @@ class PersonRepository:
         if not updates:
             return embeddings
 
-        await self.col.update_one({"_id": person_id}, updates)
+        if not await self._writes.enqueue(UpdateOne({"_id": person_id}, updates), key=person_id, wait=True):
+            logger.error("No se pudieron agregar %s embeddings al ID=%s", len(embeddings), person_id)
+            return None
         return embeddings
 
 
-    def _to_dto(self, doc) -> PersonDTO:
+    async def record_sightings(self, sightings: List[SightingDTO]) -> int:
+        """Un UpdateOne por persona ($inc de seenCount y $push del mejor embedding) a la cola write-behind."""
+        for sighting in sightings:
+            update = {
+                "$inc": {"metadata.seenCount": sighting.count},
+                "$set": {
+                    "metadata.lastSeenAt": sighting.lastSeenAt,
+                    "metadata.lastCameraId": sighting.cameraId,
+                },
+            }
+            if sighting.embedding is not None:
+                sighting.embedding.id = generate_unique_number()
+                update["$push"] = {
+                    "embeddings.auto": {
+                        "$each": [encode_embedding_doc(asdict(sighting.embedding))],
+                        "$slice": -50   # solo últimos 50 automáticos
+                    }
+                }
+            await self._writes.enqueue(UpdateOne({"_id": sighting.personId}, update), key=sighting.personId)
+        return len(sightings)
 
-        emb_manual = []
-        emb_auto = []
-
-        emb_doc = doc.get("embeddings", {"manual": [], "auto": []})
-
-        for e in emb_doc.get("manual", []):
-            emb_manual.append(
-                FaceEmbeddingDTO(
-                    id=e.get("id"),
-                    embedding=e.get("embedding", []),
-                    source=FaceSource(e.get("source", FaceSource.MANUAL_UPLOAD.value)),
-                    cameraId=e.get("cameraId"),
-                    createdAt=e.get("createdAt"),
-                    qualityScore=e.get("qualityScore", 0.0),
-                    thumbnail=e.get("thumbnail"),
-                    metadata=e.get("metadata", {})
-                )
-            )
+    async def flush(self) -> None:
+        await self._writes.flush()
+
+    def write_stats(self) -> dict:
+        return {**self._writes.stats(), **self.migration_stats()}
+
+    async def _migrate(self, doc, view: str) -> None:
+        """Recodifica por detrás los embeddings guardados como lista de doubles (formato anterior).
+
+        Una sola migración en vuelo por documento: mientras no se confirme, las
+        lecturas siguientes del mismo documento no encolan otro UpdateOne. La
+        lectura no espera la escritura (ni el backpressure de la cola).
+        """
+        if view == VIEW_IDENTITY or not constants["FACE_EMBEDDING_MIGRATE_ON_READ"]:
+            return
+        doc_id = doc["_id"]
+        if doc_id in self._migrating:
+            return
+        op = legacy_migration(doc)
+        if op is None:
+            return
+        self._migrating.add(doc_id)
+        task = asyncio.get_running_loop().create_task(self._apply_migration(doc_id, op))
+        self._migration_tasks.add(task)
+        task.add_done_callback(self._migration_tasks.discard)
 
-        for e in emb_doc.get("auto", []):
-            emb_auto.append(
-                FaceEmbeddingDTO(
-                    id=e.get("id"),
-                    embedding=e.get("embedding", []),
-                    source=FaceSource(e.get("source", FaceSource.CAMERA.value)),
-                    cameraId=e.get("cameraId"),
-                    createdAt=e.get("createdAt"),
-                    qualityScore=e.get("qualityScore", 0.0),
-                    thumbnail=e.get("thumbnail"),
-                    metadata=e.get("metadata", {})
-                )
+    async def _apply_migration(self, doc_id, op) -> None:
+        try:
+            if await self._writes.enqueue(op, key=doc_id, wait=True):
+                PersonRepository.migrated += 1
+        except Exception as e:
+            logger.exception("Error recodificando embeddings de ID=%s: %s", doc_id, e)
+        finally:
+            # Si falló, la próxima lectura lo vuelve a intentar
+            self._migrating.discard(doc_id)
+
+
+    def _convert(self, doc, view: str) -> PersonView:
+        if view == VIEW_IDENTITY:
+            return self.to_summary(doc)
+        if view == VIEW_INDEX:
+            return self._to_index(doc)
+        return self._to_dto(doc)
+
+    @staticmethod
+    def to_summary(doc) -> PersonSummaryDTO:
+        """PersonSummaryDTO desde un documento (completo o con IDENTITY_PROJECTION) o un PersonDTO."""
+        if isinstance(doc, PersonDTO):
+            return PersonSummaryDTO(
+                id=doc.id,
+                userId=doc.userId,
+                displayName=doc.displayName,
+                riskLevel=doc.riskLevel,
+                tags=list(doc.tags or []),
+                seenCount=(doc.metadata or {}).get("seenCount", 0),
             )
+        return PersonSummaryDTO(
+            id=doc["_id"],
+            userId=doc.get("userId"),
+            displayName=doc.get("displayName"),
+            riskLevel=RiskLevel(doc.get("riskLevel", RiskLevel.UNKNOWN.value)),
+            tags=doc.get("tags") or [],
+            seenCount=(doc.get("metadata") or {}).get("seenCount", 0),
+        )
 
+    def _to_index(self, doc) -> PersonIndexDTO:
+        record = PersonIndexDTO(summary=self.to_summary(doc))
+        groups = doc.get("embeddings") or {}
+        model_version = constants["FACE_EMBEDDING_MODEL_VERSION"]
+        for e in (groups.get("manual") or []) + (groups.get("auto") or []):
+            value = e.get("embedding")
+            header = embedding_header(value)
+            if header is not None and header.model_version != model_version:
+                # Vectores de otro modelo no son comparables con los del engine actual
+                logger.debug("Embedding de ID=%s con modelo %s ignorado", doc["_id"], header.model_version)
+                continue
+            # float32: vista sobre el buffer del documento, sin copiar
+            record.embeddings.append(decode_embedding(value))
+            record.poseBuckets.append((e.get("metadata") or {}).get("poseBucket"))
+            record.poses.append(e.get("pose"))
+        return record
+
+    def _to_dto(self, doc) -> PersonDTO:
         return PersonDTO(
             id=doc["_id"],
             userId=doc["userId"],
@@ -181,8 +320,71 @@ class PersonRepository:
             tags=doc["tags"],
             riskLevel=RiskLevel(doc["riskLevel"]),
             metadata=doc["metadata"],
-            embeddings={
-                "manual": emb_manual,
-                "auto": emb_auto
-            }
-        )
\ No newline at end of file
+            # Los FaceEmbeddingDTO se construyen recién al acceder a cada grupo
+            embeddings=LazyEmbeddings(doc.get("embeddings") or {}),
+        )
+
+
+class LazyEmbeddings(dict):
+    """`PersonDTO.embeddings` ({"manual": [...], "auto": [...]}) que hidrata cada grupo al accederlo.
+
+    Es un dict: hasta que se lee, cada grupo guarda los subdocumentos crudos de
+    Mongo y al accederlo (`[]`, get, values, items) se reemplazan, una sola
+    vez, por los FaceEmbeddingDTO (con sus thumbnails). Como items() hidrata,
+    asdict / copy lo materializan igual que a un dict de DTOs; construido con
+    pares (lo que hace asdict) es un dict común ya hidratado.
+    """
+
+    GROUPS = ("manual", "auto")
+
+    def __init__(self, raw=()) -> None:
+        if isinstance(raw, Mapping):
+            super().__init__((group, list(raw.get(group) or [])) for group in self.GROUPS)
+            self._pending = set(self.GROUPS)
+        else:
+            super().__init__(raw)
+            self._pending = set()
+
+    def __getitem__(self, group: str) -> List[FaceEmbeddingDTO]:
+        value = super().__getitem__(group)
+        if group in self._pending:
+            self._pending.discard(group)
+            default_source = FaceSource.MANUAL_UPLOAD if group == "manual" else FaceSource.CAMERA
+            value = [_to_embedding_dto(e, default_source) for e in value]
+            super().__setitem__(group, value)
+        return value
+
+    def __setitem__(self, group: str, value) -> None:
+        self._pending.discard(group)
+        super().__setitem__(group, value)
+
+    def get(self, group: str, default=None):
+        return self[group] if group in self else default
+
+    def values(self) -> List[List[FaceEmbeddingDTO]]:
+        return [self[group] for group in self]
+
+    def items(self) -> List[tuple]:
+        return [(group, self[group]) for group in self]
+
+    def copy(self) -> "LazyEmbeddings":
+        return LazyEmbeddings(self.items())
+
+    def count(self, group: str) -> int:
+        """Cantidad de embeddings del grupo sin hidratarlo."""
+        return len(super().get(group) or [])
+
+
+def _to_embedding_dto(e: dict, default_source: FaceSource) -> FaceEmbeddingDTO:
+    pose = e.get("pose")
+    return FaceEmbeddingDTO(
+        id=e.get("id"),
+        embedding=decode_embedding_list(e.get("embedding")),
+        source=FaceSource(e.get("source", default_source.value)),
+        cameraId=e.get("cameraId"),
+        createdAt=e.get("createdAt"),
+        qualityScore=e.get("qualityScore", 0.0),
+        thumbnail=e.get("thumbnail"),
+        pose=PoseDTO(yaw=pose.get("yaw"), pitch=pose.get("pitch"), roll=pose.get("roll")) if isinstance(pose, dict) else pose,
+        metadata=e.get("metadata", {})
+    )
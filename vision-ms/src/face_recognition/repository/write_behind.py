@@ -0,0 +1,189 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from pymongo.errors import BulkWriteError
+from ...helpers.constants.constants import constants
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorCollection
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PendingWrite:
+    op: object
+    # _id del documento afectado: dos escrituras al mismo documento fuerzan un batch ordenado
+    key: object = None
+    future: Optional[asyncio.Future] = None
+
+
+class WriteBehindQueue:
+    """Cola write-behind de una colección Mongo.
+
+    Las escrituras (InsertOne / UpdateOne ...) se encolan en una asyncio.Queue
+    acotada y un flusher las agrupa en un bulk_write cuando junta `max_batch`
+    operaciones o pasan `max_latency_ms` desde la primera. El batch es
+    unordered salvo que contenga dos operaciones sobre el mismo documento, en
+    cuyo caso es ordered para respetar el orden de llegada. Con la cola llena
+    `enqueue` espera (backpressure). Una cola por colección y event loop
+    (`for_collection`); `close_all` vacía todas al apagar el servicio.
+    """
+
+    _instances: Dict[Tuple[str, str], "WriteBehindQueue"] = {}
+
+    @classmethod
+    def for_collection(cls, collection: AsyncIOMotorCollection) -> "WriteBehindQueue":
+        key = (collection.database.name, collection.name)
+        instance = cls._instances.get(key)
+        if instance is None:
+            instance = cls._instances[key] = cls(
+                collection,
+                max_batch=constants["PERSON_WRITE_BATCH_SIZE"],
+                max_latency_ms=constants["PERSON_WRITE_MAX_LATENCY_MS"],
+                max_queue=constants["PERSON_WRITE_QUEUE_SIZE"],
+            )
+        return instance
+
+    @classmethod
+    def all_stats(cls) -> Dict[str, dict]:
+        return {f"{db}.{name}": instance.stats() for (db, name), instance in cls._instances.items()}
+
+    @classmethod
+    async def close_all(cls) -> None:
+        instances = list(cls._instances.values())
+        cls._instances.clear()
+        for instance in instances:
+            await instance.close()
+
+    def __init__(self, collection: AsyncIOMotorCollection, max_batch: int, max_latency_ms: float,
+                 max_queue: int) -> None:
+        self.col = collection
+        self.max_batch = max(1, max_batch)
+        self.max_latency_seconds = max(0.0, max_latency_ms) / 1000.0
+        self._queue: "asyncio.Queue[_PendingWrite]" = asyncio.Queue(maxsize=max(0, max_queue))
+        self._task: Optional[asyncio.Task] = None
+        # get() pendiente que sobrevive a la ventana de un batch (ver `_next`)
+        self._getter: Optional[asyncio.Future] = None
+        # Métricas
+        self.batches = 0
+        self.ops = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    async def enqueue(self, op, key=None, wait: bool = False) -> bool:
+        """Encola `op`. Con `wait` espera a que se escriba y devuelve si se aplicó sin error."""
+        future = asyncio.get_running_loop().create_future() if wait else None
+        await self._queue.put(_PendingWrite(op=op, key=key, future=future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if future is None:
+            return True
+        return await future
+
+    async def flush(self) -> None:
+        """Espera a que todo lo encolado hasta ahora esté escrito."""
+        if self._task is None or self._task.done():
+            if self._queue.empty():
+                return
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        await self._queue.join()
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._getter is not None:
+            self._getter.cancel()
+            self._getter = None
+
+    def stats(self) -> dict:
+        return {
+            "depth": self._queue.qsize(),
+            "batches": self.batches,
+            "ops": self.ops,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+            "avg_flush_ms": round(self._total_flush_ms / self.batches, 1) if self.batches else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 1),
+        }
+
+    async def _collect(self) -> List[_PendingWrite]:
+        batch = [await self._next(None)]
+        deadline = time.monotonic() + self.max_latency_seconds
+        while len(batch) < self.max_batch:
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.max_batch or remaining <= 0:
+                break
+            item = await self._next(remaining)
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    async def _next(self, timeout: Optional[float]) -> Optional[_PendingWrite]:
+        """Espera el próximo elemento hasta `timeout` (None = sin límite); None si no llegó.
+
+        El get() no se cancela al vencer (un cancel justo al llegar el elemento
+        lo puede perder): queda pendiente y lo retoma la próxima llamada.
+        """
+        if self._getter is None:
+            self._getter = asyncio.ensure_future(self._queue.get())
+        done, _ = await asyncio.wait({self._getter}, timeout=timeout)
+        if not done:
+            return None
+        getter, self._getter = self._getter, None
+        return getter.result()
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch: List[_PendingWrite]) -> None:
+        keys = [item.key for item in batch if item.key is not None]
+        ordered = len(keys) != len(set(keys))
+        failed: Dict[int, str] = {}
+        started = time.perf_counter()
+        try:
+            await self.col.bulk_write([item.op for item in batch], ordered=ordered)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed[error["index"]] = error.get("errmsg", "write error")
+            if ordered and failed:
+                # En un batch ordenado no se ejecuta nada después del primer error
+                first = min(failed)
+                failed.update({i: "not executed" for i in range(first + 1, len(batch)) if i not in failed})
+            logger.error("bulk_write en '%s': %s de %s operaciones fallaron", self.col.name, len(failed), len(batch))
+        except Exception as e:
+            failed = {i: str(e) for i in range(len(batch))}
+            logger.exception("bulk_write en '%s' falló (%s operaciones): %s", self.col.name, len(batch), e)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.ops += len(batch)
+        self.errors += len(failed)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+        logger.debug("bulk_write en '%s': %s operaciones (ordered=%s) en %.1fms",
+                     self.col.name, len(batch), ordered, elapsed_ms)
+
+        for index, item in enumerate(batch):
+            if item.future is not None and not item.future.done():
+                item.future.set_result(index not in failed)
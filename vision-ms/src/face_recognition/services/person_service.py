@@ -3,27 +3,50 @@ import logging
 import numpy as np
 import datetime
 import cv2
+from typing import List
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from ..dto.person_dto import PersonDTO, FaceEmbeddingDTO
-from ..recognition.face_engine import FaceEngine
-from ..repository.person_repository import PersonRepository
+from ..dto.person_dto import PersonDTO, FaceEmbeddingDTO, SightingDTO
+from ...helpers.dto.person_summary_dto import PersonSummaryDTO
+from ...helpers.utils.engine_pool import FaceEnginePool
+from ..repository.person_repository import PersonRepository, PersonView, VIEW_FULL, VIEW_IDENTITY
 from ...helpers.utils.enums import FaceSource
+from ...helpers.utils.person_cache import PersonCache
 
 logger = logging.getLogger(__name__)
 
 class PersonService:
 
-    def __init__(self, db: AsyncIOMotorDatabase, engine: FaceEngine):
+    def __init__(self, db: AsyncIOMotorDatabase, engine: FaceEnginePool):
         self.engine = engine
         self._repo = PersonRepository(db)
+        # Identidades compartidas con el resto de PersonService del proceso
+        self._cache = PersonCache.shared()
         logger.info("PersonService inicializado con colección 'vision_persons'")
 
-    async def create(self, dto: PersonDTO) -> int:
+    async def create(self, dto: PersonDTO, new_id: int | None = None) -> int:
         logger.info("Creando persona '%s' …", dto.displayName)
-        return await self._repo.create(dto)
+        return await self._repo.create(dto, new_id=new_id)
 
-    async def get(self, person_id: int) -> PersonDTO | None:
-        return await self._repo.get(person_id)
+    async def get(self, person_id: int, view: str = VIEW_FULL) -> PersonView | None:
+        return await self._repo.get(person_id, view=view)
+
+    async def get_identity(self, person_id: int) -> PersonSummaryDTO | None:
+        """Identidad (nombre, riesgo, seenCount) desde la caché; solo va a Mongo si no está."""
+        summary = self._cache.get(person_id)
+        if summary is None:
+            summary = await self._repo.get_identity(person_id)
+            if summary is not None:
+                self._cache.put(summary)
+        return summary
+
+    def cache_identity(self, person: PersonDTO | PersonSummaryDTO) -> None:
+        self._cache.put(person if isinstance(person, PersonSummaryDTO) else self._repo.to_summary(person))
+
+    def forget_identity(self, person_id: int) -> None:
+        self._cache.invalidate(person_id)
+
+    def bump_seen(self, person_id: int, count: int = 1) -> int | None:
+        return self._cache.bump_seen(person_id, count)
 
     async def list(self):
         return await self._repo.list()
@@ -31,13 +54,16 @@ class PersonService:
     async def update(self, person_id: int, dto: PersonDTO):
         logger.info("Actualizando persona ID=%s", person_id)
         updated = await self._repo.update(person_id, dto)
+        self._cache.invalidate(person_id)
         if not updated:
             logger.warning("Intento de actualización fallido: persona %s no existe", person_id)
         return updated
     
     async def update_field(self, person_id: int, field: str, value):
         logger.info("Actualizando campo '%s' de persona ID=%s", field, person_id)
+        # $set directo: la caché no recarga el valor viejo y se sabe si la persona existe
         updated = await self._repo.update_field(person_id, field, value)
+        self._cache.invalidate(person_id)
         if not updated:
             logger.warning("Intento de actualización fallido: persona %s no existe", person_id)
         return updated
@@ -45,6 +71,7 @@ class PersonService:
     async def delete(self, person_id: int) -> bool:
         logger.info("Eliminando persona ID=%s", person_id)
         deleted = await self._repo.delete(person_id)
+        self._cache.invalidate(person_id)
         if not deleted:
             logger.warning("Intento de borrar fallido: persona %s no existe", person_id)
         return deleted
@@ -52,13 +79,17 @@ class PersonService:
     async def add_embedding(self, person_id: int, embedding: FaceEmbeddingDTO):
         logger.info("Agregando embedding a persona ID=%s", person_id)
 
-        person = await self._repo.get(person_id)
+        person = await self._repo.get(person_id, view=VIEW_IDENTITY)
         if not person:
             logger.error("No se puede agregar embedding: persona %s no existe", person_id)
             return None
 
         return await self._repo.add_embedding(person_id, embedding)
 
+    async def record_sightings(self, sightings: List[SightingDTO]) -> int:
+        logger.info("Guardando avistamientos de %s personas", len(sightings))
+        return await self._repo.record_sightings(sightings)
+
     def pose_bucket(self, pose: dict) -> str:
         if not pose:
             return "UNKNOWN"
@@ -94,7 +125,7 @@ class PersonService:
     async def add_embeddings_from_bytes(self, person_id: int, file_bytes: bytes):
         logger.info("Procesando imagen para embeddings de persona ID=%s", person_id)
         # Verificar existencia de persona
-        person = await self._repo.get(person_id)
+        person = await self._repo.get(person_id, view=VIEW_IDENTITY)
         if not person:
             logger.error("Persona %s no existe — no se pueden agregar embeddings", person_id)
             return []
@@ -133,5 +164,5 @@ class PersonService:
 
         return await self._repo.add_embeddings(person_id, embeddings)
 
-    async def list_by_user(self, user_id: int):
-        return await self._repo.list_by_user(user_id)
+    async def list_by_user(self, user_id: int, view: str = VIEW_FULL):
+        return await self._repo.list_by_user(user_id, view=view)
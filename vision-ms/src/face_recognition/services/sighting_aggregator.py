@@ -0,0 +1,107 @@
+from __future__ import annotations
+import asyncio
+import datetime
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+from ..dto.person_dto import FaceEmbeddingDTO, SightingDTO
+
+logger = logging.getLogger(__name__)
+
+
+class SightingAggregator:
+    """Agrega los avistamientos de cada persona durante `window_seconds`.
+
+    En lugar de leer la persona, hacer `$push` del embedding y actualizar
+    `seenCount` por cada rostro de cada frame, se acumula en memoria un
+    SightingDTO por persona (conteo y el embedding de mejor calidad, con su
+    thumbnail) y al cerrar la ventana `flush` entrega todos juntos para que se
+    escriban en un único bulk_write. Con `window_seconds` = 0 se escribe en
+    cuanto el loop queda libre, pero igual desde una sola tarea: los add del
+    mismo instante van en el mismo flush. Se usa desde el event loop principal.
+    """
+
+    def __init__(self, flush: Callable[[List[SightingDTO]], Awaitable[None]], window_seconds: float) -> None:
+        self._flush = flush
+        self.window_seconds = max(0.0, window_seconds)
+        self._pending: Dict[int, SightingDTO] = {}
+        self._task: Optional[asyncio.Task] = None
+        # Despierta a la tarea antes de que venza la ventana (close)
+        self._wake = asyncio.Event()
+        # Métricas
+        self.sightings = 0
+        self.flushes = 0
+        self.flushed_persons = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, user_id: Optional[int], person_id: int, camera_id: Optional[int],
+            embedding: Optional[FaceEmbeddingDTO]) -> SightingDTO:
+        now = datetime.datetime.utcnow()
+        sighting = self._pending.get(person_id)
+        if sighting is None:
+            sighting = self._pending[person_id] = SightingDTO(
+                personId=person_id,
+                userId=user_id,
+                cameraId=camera_id,
+                count=0,
+                firstSeenAt=now,
+                lastSeenAt=now,
+            )
+        sighting.count += 1
+        sighting.lastSeenAt = now
+        sighting.cameraId = camera_id
+        if embedding is not None and (
+            sighting.embedding is None
+            or (embedding.qualityScore or 0.0) > (sighting.embedding.qualityScore or 0.0)
+        ):
+            sighting.embedding = embedding
+        self.sightings += 1
+
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return sighting
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        sightings = list(self._pending.values())
+        self._pending = {}
+        try:
+            await self._flush(sightings)
+            self.flushes += 1
+            self.flushed_persons += len(sightings)
+        except Exception as e:
+            logger.exception("Error guardando %s avistamientos: %s", len(sightings), e)
+
+    async def close(self) -> None:
+        # Sin cancelar: un cancel a mitad del flush perdería los avistamientos ya sacados de `_pending`
+        task = self._task
+        if task is not None:
+            self._wake.set()
+            await asyncio.gather(task, return_exceptions=True)
+            self._wake.clear()
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "sightings": self.sightings,
+            "flushes": self.flushes,
+            "flushed_persons": self.flushed_persons,
+        }
+
+    async def _run(self) -> None:
+        # Termina cuando una ventana no dejó nada pendiente; el próximo add lo vuelve a lanzar
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.window_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                await self.flush()
+                if not self._pending:
+                    break
+        finally:
+            if self._task is asyncio.current_task():
+                self._task = None
@@ -16,6 +16,8 @@ class FaceExtractedDTO:
     score: float
     thumbnail: Optional[str]
     pose: Optional[PoseDTO]
+    # Track del rostro en la cámara (FaceTracker); None sin tracking
+    trackId: Optional[int] = None
     
 @dataclass
 class FaceEmbeddingDTO:
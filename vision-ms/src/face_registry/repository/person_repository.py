@@ -1,16 +1,26 @@
 from __future__ import annotations
+import asyncio
 import logging
 from dataclasses import asdict
-from typing import Optional, List
+from typing import Optional, List, Set
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pymongo import ReturnDocument
 from ..dto.person_dto import PersonDTO, FaceEmbeddingDTO, RiskLevel, FaceSource
+from ...helpers.constants.constants import constants
+from ...helpers.utils.embedding_codec import (
+    decode_embedding_list, encode_embedding_doc, encode_embeddings_doc, legacy_migration,
+)
 from ...helpers.utils.utils import generate_unique_number
 
 logger = logging.getLogger(__name__)
 
 class PersonRepository:
 
+    # _id con recodificación en vuelo (compartido por las instancias) y tareas de migración pendientes
+    _migrating: Set[object] = set()
+    _migration_tasks: Set[asyncio.Task] = set()
+    migrated = 0
+
     def __init__(self, db: AsyncIOMotorDatabase):
         self.col = db["vision_persons"]
         logger.info("PersonRepository inicializado con colección 'vision_persons'")
@@ -24,6 +34,7 @@ class PersonRepository:
             doc["_id"] = new_id
             doc.pop("id", None)
             doc.setdefault("embeddings", {"manual": [], "auto": []})
+            encode_embeddings_doc(doc["embeddings"])
             
             await self.col.insert_one(doc)
             logger.info(f"Registro creada con ID={new_id}")
@@ -38,18 +49,20 @@ class PersonRepository:
         if not doc:
             logger.warning(f"ID={id} no encontrada")
             return None
+        await self._migrate([doc])
         return self._to_dto(doc)
 
     async def list(self) -> List[PersonDTO]:
-        cursor = self.col.find({})
-        out = [self._to_dto(doc) async for doc in cursor]
-        return out
+        docs = await self.col.find({}).to_list(length=None)
+        await self._migrate(docs)
+        return [self._to_dto(doc) for doc in docs]
 
     async def update(self, id: int, dto: PersonDTO) -> Optional[PersonDTO]:
         logger.info(f"Actualizando ID={id}")
         try:
             data = asdict(dto)
             data.pop("id", None)            
+            encode_embeddings_doc(data.get("embeddings"))
             result = await self.col.find_one_and_update(
                 {"_id": id},
                 {"$set": data},
@@ -79,12 +92,13 @@ class PersonRepository:
         return result.deleted_count > 0
 
     async def list_by_user(self, user_id: int) -> list[PersonDTO]:
-        cursor = self.col.find({"userId": user_id})
-        return [self._to_dto(doc) async for doc in cursor]
+        docs = await self.col.find({"userId": user_id}).to_list(length=None)
+        await self._migrate(docs)
+        return [self._to_dto(doc) for doc in docs]
 
     async def add_embedding(self, person_id: int, embedding: FaceEmbeddingDTO) -> Optional[FaceEmbeddingDTO]:
         embedding.id = generate_unique_number()
-        emb_dict = asdict(embedding)
+        emb_dict = encode_embedding_doc(asdict(embedding))
 
         if embedding.source == FaceSource.MANUAL_UPLOAD:
             update = {
@@ -115,9 +129,9 @@ class PersonRepository:
         for emb in embeddings:
             emb.id = generate_unique_number()
             if emb.source == FaceSource.MANUAL_UPLOAD:
-                manual_list.append(asdict(emb))
+                manual_list.append(encode_embedding_doc(asdict(emb)))
             else:
-                auto_list.append(asdict(emb))
+                auto_list.append(encode_embedding_doc(asdict(emb)))
 
         updates = {}
 
@@ -139,6 +153,37 @@ class PersonRepository:
         return embeddings
 
 
+    async def _migrate(self, docs) -> None:
+        """Recodifica por detrás, en un bulk_write, los embeddings guardados como lista de doubles
+        (formato anterior). La lectura no espera la escritura; un documento con migración en
+        vuelo no se vuelve a incluir."""
+        if not constants["FACE_EMBEDDING_MIGRATE_ON_READ"]:
+            return
+        ops = {}
+        for doc in docs:
+            if doc["_id"] in self._migrating or doc["_id"] in ops:
+                continue
+            op = legacy_migration(doc)
+            if op is not None:
+                ops[doc["_id"]] = op
+        if not ops:
+            return
+        self._migrating.update(ops)
+        task = asyncio.get_running_loop().create_task(self._apply_migrations(ops))
+        self._migration_tasks.add(task)
+        task.add_done_callback(self._migration_tasks.discard)
+
+    async def _apply_migrations(self, ops: dict) -> None:
+        try:
+            await self.col.bulk_write(list(ops.values()), ordered=False)
+            PersonRepository.migrated += len(ops)
+            logger.info(f"Embeddings recodificados en {len(ops)} registros")
+        except Exception as e:
+            # La lectura no depende de la migración: se reintenta en la próxima
+            logger.exception(f"Error recodificando embeddings: {e}")
+        finally:
+            self._migrating.difference_update(ops)
+
     def _to_dto(self, doc) -> PersonDTO:
 
         emb_manual = []
@@ -150,7 +195,7 @@ class PersonRepository:
             emb_manual.append(
                 FaceEmbeddingDTO(
                     id=e.get("id"),
-                    embedding=e.get("embedding", []),
+                    embedding=decode_embedding_list(e.get("embedding")),
                     source=FaceSource(e.get("source", FaceSource.MANUAL_UPLOAD.value)),
                     cameraId=e.get("cameraId"),
                     createdAt=e.get("createdAt"),
@@ -164,7 +209,7 @@ class PersonRepository:
             emb_auto.append(
                 FaceEmbeddingDTO(
                     id=e.get("id"),
-                    embedding=e.get("embedding", []),
+                    embedding=decode_embedding_list(e.get("embedding")),
                     source=FaceSource(e.get("source", FaceSource.CAMERA.value)),
                     cameraId=e.get("cameraId"),
                     createdAt=e.get("createdAt"),
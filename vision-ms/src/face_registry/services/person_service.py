@@ -5,17 +5,20 @@ import datetime
 import cv2
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from ..dto.person_dto import PersonDTO, FaceEmbeddingDTO
-from ..recognition.face_engine import FaceEngine
+from ...helpers.utils.engine_pool import FaceEnginePool
 from ..repository.person_repository import PersonRepository
 from ...helpers.utils.enums import FaceSource
+from ...helpers.utils.person_cache import PersonCache
 
 logger = logging.getLogger(__name__)
 
 class PersonService:
 
-    def __init__(self, db: AsyncIOMotorDatabase, engine: FaceEngine):
+    def __init__(self, db: AsyncIOMotorDatabase, engine: FaceEnginePool):
         self.engine = engine
         self._repo = PersonRepository(db)
+        # Identidades compartidas con el resto de PersonService del proceso
+        self._cache = PersonCache.shared()
         logger.info("PersonService inicializado con colección 'vision_persons'")
 
     async def create(self, dto: PersonDTO) -> int:
@@ -31,6 +34,7 @@ class PersonService:
     async def update(self, person_id: int, dto: PersonDTO):
         logger.info("Actualizando persona ID=%s", person_id)
         updated = await self._repo.update(person_id, dto)
+        self._cache.invalidate(person_id)
         if not updated:
             logger.warning("Intento de actualización fallido: persona %s no existe", person_id)
         return updated
@@ -38,6 +42,7 @@ class PersonService:
     async def update_field(self, person_id: int, field: str, value):
         logger.info("Actualizando campo '%s' de persona ID=%s", field, person_id)
         updated = await self._repo.update_field(person_id, field, value)
+        self._cache.invalidate(person_id)
         if not updated:
             logger.warning("Intento de actualización fallido: persona %s no existe", person_id)
         return updated
@@ -45,6 +50,7 @@ class PersonService:
     async def delete(self, person_id: int) -> bool:
         logger.info("Eliminando persona ID=%s", person_id)
         deleted = await self._repo.delete(person_id)
+        self._cache.invalidate(person_id)
         if not deleted:
             logger.warning("Intento de borrar fallido: persona %s no existe", person_id)
         return deleted
@@ -33,6 +33,16 @@ constants = {
     
     "INGEST_JPEG_QUALITY": int(os.getenv("INGEST_JPEG_QUALITY", 80)),
     "INGEST_RECONNECT_DELAY_SECONDS": int(os.getenv("INGEST_RECONNECT_DELAY_SECONDS", 5)),
+    # Reconexión: backoff exponencial con jitter desde BASE hasta MAX segundos y como mucho
+    # INGEST_MAX_CONCURRENT_OPENS aperturas RTSP simultáneas (límite global, compartido por todos los procesos de ingest)
+    "INGEST_RECONNECT_BASE_DELAY_SECONDS": float(os.getenv("INGEST_RECONNECT_BASE_DELAY_SECONDS", 1)),
+    "INGEST_RECONNECT_MAX_DELAY_SECONDS": float(os.getenv("INGEST_RECONNECT_MAX_DELAY_SECONDS", 60)),
+    "INGEST_RECONNECT_JITTER": float(os.getenv("INGEST_RECONNECT_JITTER", 0.5)),
+    "INGEST_MAX_CONCURRENT_OPENS": int(os.getenv("INGEST_MAX_CONCURRENT_OPENS", 4)),
+    "INGEST_OPEN_TIMEOUT_MS": int(os.getenv("INGEST_OPEN_TIMEOUT_MS", 10000)),
+    "INGEST_READ_TIMEOUT_MS": int(os.getenv("INGEST_READ_TIMEOUT_MS", 10000)),
+    # /start-batch y /stop-batch: cámaras procesadas en paralelo (probe RTSP + arranque)
+    "INGEST_BATCH_CONCURRENCY": int(os.getenv("INGEST_BATCH_CONCURRENCY", 16)),
     "INGEST_THUMBNAIL_WIDTH": int(os.getenv("INGEST_THUMBNAIL_WIDTH", 150)),
     "INGEST_THUMBNAIL_HEIGHT": int(os.getenv("INGEST_THUMBNAIL_HEIGHT", 150)),
     "INGEST_IDLE_ON_MOTION_SECONDS": int(os.getenv("INGEST_IDLE_ON_MOTION_SECONDS", 30)),
@@ -40,7 +50,137 @@ constants = {
     # 240P = 320X240, 360P = 640X360, 480P = 640X480, 720P = 1280X720, 1080P = 1920X1080
     "INGEST_VIDEO_WIDTH": int(os.getenv("INGEST_VIDEO_WIDTH", 640)),
     "INGEST_VIDEO_HEIGHT": int(os.getenv("INGEST_VIDEO_HEIGHT", 480)),
+    # thread = un CameraWorker (thread) por cámara en el proceso de la API
+    # process = cámaras repartidas en INGEST_PROCESSES procesos de ingest controlados por IPC
+    "INGEST_MODE": os.getenv("INGEST_MODE", "thread"),
+    "INGEST_PROCESSES": int(os.getenv("INGEST_PROCESSES", os.cpu_count() or 1)),
+    "INGEST_HEALTH_INTERVAL_SECONDS": float(os.getenv("INGEST_HEALTH_INTERVAL_SECONDS", 5)),
+    "INGEST_IPC_TIMEOUT_SECONDS": float(os.getenv("INGEST_IPC_TIMEOUT_SECONDS", 10)),
+    # Espera máxima a que termine el worker anterior al reiniciar una cámara (menor que el timeout de IPC)
+    "INGEST_STOP_TIMEOUT_SECONDS": float(os.getenv("INGEST_STOP_TIMEOUT_SECONDS", 5)),
+
+    # Rendition de analítica (reconocimiento facial): más pequeña y con menor calidad.
+    # La rendition de archivo (grabaciones) usa INGEST_VIDEO_WIDTH/HEIGHT e INGEST_JPEG_QUALITY.
+    "INGEST_ANALYTICS_WIDTH": int(os.getenv("INGEST_ANALYTICS_WIDTH", 480)),
+    "INGEST_ANALYTICS_HEIGHT": int(os.getenv("INGEST_ANALYTICS_HEIGHT", 360)),
+    "INGEST_ANALYTICS_JPEG_QUALITY": int(os.getenv("INGEST_ANALYTICS_JPEG_QUALITY", 70)),
+    # fps de análisis por defecto: se hace grab() de todos los frames y retrieve() (decode) solo
+    # de los que se publican. 0 = decodificar todos. Se puede sobrescribir por cámara (analyticsFps).
+    "INGEST_TARGET_FPS": float(os.getenv("INGEST_TARGET_FPS", 0)),
+    # Gate de movimiento en ingest: en escena estática solo se publica un keep-alive cada
+    # INGEST_MOTION_GATE_KEEPALIVE_SECONDS; con movimiento (y HOLD_SECONDS después) a tasa completa
+    "INGEST_MOTION_GATE_ENABLED": os.getenv("INGEST_MOTION_GATE_ENABLED", "false").lower() == "true",
+    "INGEST_MOTION_GATE_WIDTH": int(os.getenv("INGEST_MOTION_GATE_WIDTH", 160)),
+    "INGEST_MOTION_GATE_MIN_AREA": float(os.getenv("INGEST_MOTION_GATE_MIN_AREA", 0.005)),
+    "INGEST_MOTION_GATE_KEEPALIVE_SECONDS": float(os.getenv("INGEST_MOTION_GATE_KEEPALIVE_SECONDS", 5)),
+    "INGEST_MOTION_GATE_HOLD_SECONDS": float(os.getenv("INGEST_MOTION_GATE_HOLD_SECONDS", 2)),
+    # Hibernación (opt-in) de cámaras sin consumers (ni cola con consumers ni lector del frame bus):
+    # tras GRACE segundos solo grab(), tras DISCONNECT segundos se cierra el RTSP (0 = nunca)
+    "INGEST_HIBERNATE_ENABLED": os.getenv("INGEST_HIBERNATE_ENABLED", "false").lower() == "true",
+    "INGEST_HIBERNATE_GRACE_SECONDS": float(os.getenv("INGEST_HIBERNATE_GRACE_SECONDS", 30)),
+    "INGEST_HIBERNATE_DISCONNECT_SECONDS": float(os.getenv("INGEST_HIBERNATE_DISCONNECT_SECONDS", 300)),
+    "INGEST_DEMAND_CHECK_INTERVAL_SECONDS": float(os.getenv("INGEST_DEMAND_CHECK_INTERVAL_SECONDS", 5)),
+    # binary = JPEG crudo + cabecera struct (application/x-vision-frame), json = formato legado base64
+    "INGEST_WIRE_FORMAT": os.getenv("INGEST_WIRE_FORMAT", "binary"),
     
+    # Bus local de frames en memoria compartida (ingest y consumers en el mismo host).
+    # Cada cámara usa un ring por rendition de FRAME_BUS_SLOTS * ancho * alto * 3 bytes en /dev/shm.
+    # FRAME_BUS_PUBLISH_AMQP=true mantiene además la publicación en RabbitMQ para consumers remotos.
+    "FRAME_BUS_ENABLED": os.getenv("FRAME_BUS_ENABLED", "false").lower() == "true",
+    "FRAME_BUS_SLOTS": int(os.getenv("FRAME_BUS_SLOTS", 8)),
+    "FRAME_BUS_PUBLISH_AMQP": os.getenv("FRAME_BUS_PUBLISH_AMQP", "false").lower() == "true",
+
     "AMQP_EXCHANGE": os.getenv("AMQP_EXCHANGE"),
     "AMQP_URL": os.getenv("AMQP_URL"),
+    # pipelined = confirms asíncronos con ventana acotada, none = fire-and-forget (delivery_mode=1)
+    "AMQP_PUBLISH_CONFIRM_MODE": os.getenv("AMQP_PUBLISH_CONFIRM_MODE", "pipelined"),
+    # Máximo de mensajes en vuelo (encolados + sin confirmar) por canal de cámara
+    "AMQP_PUBLISH_WINDOW": int(os.getenv("AMQP_PUBLISH_WINDOW", 32)),
+
+    # Límites de las colas de frames (0 = sin límite). drop-head descarta los frames más viejos.
+    "FACE_QUEUE_MAX_LENGTH": int(os.getenv("FACE_QUEUE_MAX_LENGTH", 50)),
+    "FACE_QUEUE_OVERFLOW": os.getenv("FACE_QUEUE_OVERFLOW", "drop-head"),
+    "FACE_QUEUE_MESSAGE_TTL_MS": int(os.getenv("FACE_QUEUE_MESSAGE_TTL_MS", 2000)),
+    "ARCHIVE_QUEUE_MAX_LENGTH": int(os.getenv("ARCHIVE_QUEUE_MAX_LENGTH", 500)),
+    "ARCHIVE_QUEUE_OVERFLOW": os.getenv("ARCHIVE_QUEUE_OVERFLOW", "drop-head"),
+    "ARCHIVE_QUEUE_MESSAGE_TTL_MS": int(os.getenv("ARCHIVE_QUEUE_MESSAGE_TTL_MS", 30000)),
+    "CONSUMER_PREFETCH": int(os.getenv("CONSUMER_PREFETCH", 4)),
+
+    # Reducción adaptativa (AIMD) de la tasa de publicación cuando el broker bloquea la conexión
+    # o los confirms se atrasan (latencia > INGEST_BACKPRESSURE_LATENCY_MS)
+    "INGEST_ADAPTIVE_RATE_ENABLED": os.getenv("INGEST_ADAPTIVE_RATE_ENABLED", "true").lower() == "true",
+    "INGEST_MIN_PUBLISH_FPS": float(os.getenv("INGEST_MIN_PUBLISH_FPS", 1)),
+    "INGEST_BACKPRESSURE_LATENCY_MS": float(os.getenv("INGEST_BACKPRESSURE_LATENCY_MS", 250)),
+
+    # transcode = los frames de archivo se re-codifican con MP4Writer (mp4v)
+    # remux = ffmpeg copia los paquetes RTSP a segmentos MP4 sin decodificar; los frames de archivo
+    # solo se usan para detectar movimiento. Si ffmpeg no está instalado se usa transcode.
+    "RECORDING_MODE": os.getenv("RECORDING_MODE", "transcode"),
+    "RECORDING_FFMPEG_BINARY": os.getenv("RECORDING_FFMPEG_BINARY", "ffmpeg"),
+    "RECORDING_SEGMENT_SECONDS": int(os.getenv("RECORDING_SEGMENT_SECONDS", 10)),
+    # Segundos de video previos al movimiento que se incluyen en la grabación (modo remux)
+    "RECORDING_PREROLL_SECONDS": float(os.getenv("RECORDING_PREROLL_SECONDS", 5)),
+
+    # Índice de matching facial por usuario: exact = fuerza bruta (GEMM), ivf = aproximado (k-means + listas invertidas).
+    # FACE_MATCH_IVF_NPROBE es el control recall/latencia; NLIST=0 lo calcula según el tamaño de la galería.
+    "FACE_MATCH_INDEX": os.getenv("FACE_MATCH_INDEX", "exact"),
+    "FACE_MATCH_IVF_NLIST": int(os.getenv("FACE_MATCH_IVF_NLIST", 0)),
+    "FACE_MATCH_IVF_NPROBE": int(os.getenv("FACE_MATCH_IVF_NPROBE", 8)),
+    "FACE_MATCH_IVF_MIN_TRAIN_SIZE": int(os.getenv("FACE_MATCH_IVF_MIN_TRAIN_SIZE", 2048)),
+    # Matching facial: centroid (un centroide por persona), max / topk (contra todos los embeddings
+    # guardados, agregando por persona con el máximo o la suma de los FACE_MATCH_TOPK mejores / FACE_MATCH_TOPK)
+    # o pose (contra un centroide por pose_bucket)
+    "FACE_MATCH_MODE": os.getenv("FACE_MATCH_MODE", "centroid"),
+    "FACE_MATCH_TOPK": int(os.getenv("FACE_MATCH_TOPK", 3)),
+
+    # Inferencia facial en micro-batches compartidos por todas las cámaras: se juntan hasta
+    # FACE_INFERENCE_MAX_BATCH frames o se espera como máximo FACE_INFERENCE_MAX_WAIT_MS
+    "FACE_INFERENCE_BATCHING": os.getenv("FACE_INFERENCE_BATCHING", "true").lower() == "true",
+    "FACE_INFERENCE_MAX_BATCH": int(os.getenv("FACE_INFERENCE_MAX_BATCH", 16)),
+    "FACE_INFERENCE_MAX_WAIT_MS": float(os.getenv("FACE_INFERENCE_MAX_WAIT_MS", 10)),
+
+    # Pool de FaceEngine: FACE_ENGINE_POOL_SIZE sesiones ONNX independientes (0 = núcleos / INTRA_OP_THREADS).
+    # INTRA_OP_THREADS = threads de cada sesión (0 = núcleos / POOL_SIZE, o 4 si ambos son 0)
+    "FACE_ENGINE_POOL_SIZE": int(os.getenv("FACE_ENGINE_POOL_SIZE", 0)),
+    "FACE_ENGINE_INTRA_OP_THREADS": int(os.getenv("FACE_ENGINE_INTRA_OP_THREADS", 0)),
+    "FACE_ENGINE_INTER_OP_THREADS": int(os.getenv("FACE_ENGINE_INTER_OP_THREADS", 1)),
+    # sequential | parallel (parallel solo ayuda en grafos con ramas independientes)
+    "FACE_ENGINE_EXECUTION_MODE": os.getenv("FACE_ENGINE_EXECUTION_MODE", "sequential"),
+    # disabled | basic | extended | all
+    "FACE_ENGINE_GRAPH_OPTIMIZATION": os.getenv("FACE_ENGINE_GRAPH_OPTIMIZATION", "all"),
+    "FACE_ENGINE_CPU_MEM_ARENA": os.getenv("FACE_ENGINE_CPU_MEM_ARENA", "true").lower() == "true",
+    "FACE_ENGINE_MEM_PATTERN": os.getenv("FACE_ENGINE_MEM_PATTERN", "true").lower() == "true",
+    # Providers de onnxruntime en orden de preferencia; se ignoran los que no estén disponibles
+    "FACE_ENGINE_PROVIDERS": os.getenv("FACE_ENGINE_PROVIDERS", "CoreMLExecutionProvider,CPUExecutionProvider"),
+
+    # Tracking de rostros por cámara: solo se reconoce un track nuevo, cuando su calidad mejora
+    # FACE_TRACK_QUALITY_GAIN veces o cada FACE_TRACK_RECOGNIZE_EVERY frames; el resto reutiliza el matching
+    "FACE_TRACKING_ENABLED": os.getenv("FACE_TRACKING_ENABLED", "true").lower() == "true",
+    "FACE_TRACK_IOU_THRESHOLD": float(os.getenv("FACE_TRACK_IOU_THRESHOLD", 0.3)),
+    # Distancia máxima entre centroides (en tamaños de rostro) para asociar sin solapamiento
+    "FACE_TRACK_CENTROID_RATIO": float(os.getenv("FACE_TRACK_CENTROID_RATIO", 0.5)),
+    "FACE_TRACK_MAX_MISSED_FRAMES": int(os.getenv("FACE_TRACK_MAX_MISSED_FRAMES", 10)),
+    "FACE_TRACK_RECOGNIZE_EVERY": int(os.getenv("FACE_TRACK_RECOGNIZE_EVERY", 25)),
+    "FACE_TRACK_QUALITY_GAIN": float(os.getenv("FACE_TRACK_QUALITY_GAIN", 1.25)),
+    # Avistamientos de personas conocidas agregados por persona durante la ventana (mejor embedding y
+    # conteo) y guardados en un bulk_write al cerrarla; 0 = guardar cada avistamiento
+    "FACE_SIGHTING_WINDOW_SECONDS": float(os.getenv("FACE_SIGHTING_WINDOW_SECONDS", 5)),
+    # Tareas process_faces en vuelo por cámara antes de que su consumer espere
+    "FACE_MAX_INFLIGHT_TASKS": int(os.getenv("FACE_MAX_INFLIGHT_TASKS", 8)),
+    # Espera máxima al detener un consumer a que terminen sus tareas en vuelo antes de guardar los avistamientos
+    "FACE_STOP_DRAIN_TIMEOUT_SECONDS": float(os.getenv("FACE_STOP_DRAIN_TIMEOUT_SECONDS", 10)),
+    # Escrituras de personas (write-behind): bulk_write de hasta BATCH_SIZE operaciones o cada
+    # MAX_LATENCY_MS; con QUEUE_SIZE operaciones pendientes los productores esperan
+    "PERSON_WRITE_BATCH_SIZE": int(os.getenv("PERSON_WRITE_BATCH_SIZE", 500)),
+    "PERSON_WRITE_MAX_LATENCY_MS": float(os.getenv("PERSON_WRITE_MAX_LATENCY_MS", 50)),
+    "PERSON_WRITE_QUEUE_SIZE": int(os.getenv("PERSON_WRITE_QUEUE_SIZE", 10000)),
+    # Caché LRU de identidades de personas (sin embeddings) compartida por consumers y API
+    "PERSON_CACHE_MAX_SIZE": int(os.getenv("PERSON_CACHE_MAX_SIZE", 20000)),
+    "PERSON_CACHE_TTL_SECONDS": float(os.getenv("PERSON_CACHE_TTL_SECONDS", 300)),
+    # Embeddings guardados como Binary (float32 o float16) con cabecera dtype/dim/versión de modelo.
+    # La galería ignora los de otra versión de modelo; los documentos con listas de doubles se
+    # recodifican al leerlos si MIGRATE_ON_READ está activo
+    "FACE_EMBEDDING_STORAGE_DTYPE": os.getenv("FACE_EMBEDDING_STORAGE_DTYPE", "float32"),
+    "FACE_EMBEDDING_MODEL_VERSION": int(os.getenv("FACE_EMBEDDING_MODEL_VERSION", 1)),
+    "FACE_EMBEDDING_MIGRATE_ON_READ": os.getenv("FACE_EMBEDDING_MIGRATE_ON_READ", "true").lower() == "true",
 }
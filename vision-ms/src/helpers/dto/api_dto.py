@@ -5,4 +5,8 @@ from dataclasses import dataclass
 class ApiReqDTO:
     userId: Optional[int]
     cameraId: Optional[int]
-    rtspUrl: Optional[str]
\ No newline at end of file
+    rtspUrl: Optional[str]
+    # fps de análisis de la cámara (decode decimado); None = INGEST_TARGET_FPS
+    analyticsFps: Optional[float] = None
+    # URL del sub-stream (baja resolución) para analítica; el stream principal queda para grabación
+    subStreamUrl: Optional[str] = None
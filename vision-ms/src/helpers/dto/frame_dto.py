@@ -0,0 +1,13 @@
+from typing import Optional, Union
+from dataclasses import dataclass
+
+@dataclass
+class FrameMessageDTO:
+    camera_id: Optional[int]
+    user_id: Optional[int]
+    timestamp: float
+    fps: float
+    width: int
+    height: int
+    # JPEG sin base64. En formato binario es una vista (memoryview) sobre el body AMQP.
+    frame: Union[bytes, memoryview]
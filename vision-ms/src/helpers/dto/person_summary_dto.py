@@ -0,0 +1,13 @@
+from typing import List, Optional
+from dataclasses import dataclass, field
+from ..utils.enums import RiskLevel
+
+@dataclass
+class PersonSummaryDTO:
+    """Datos de identidad de una persona, sin embeddings ni thumbnails (PersonCache)."""
+    id: int
+    userId: Optional[int]
+    displayName: Optional[str]
+    riskLevel: RiskLevel
+    tags: List[str] = field(default_factory=list)
+    seenCount: int = 0
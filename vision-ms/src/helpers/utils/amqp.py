@@ -0,0 +1,39 @@
+from __future__ import annotations
+import logging
+from typing import Dict, Optional
+import pika
+
+logger = logging.getLogger(__name__)
+
+
+def queue_arguments(max_length: int = 0, overflow: Optional[str] = None, message_ttl_ms: int = 0) -> Dict[str, object]:
+    """Argumentos x-* de una cola de frames; 0/None deja el límite sin configurar."""
+    arguments: Dict[str, object] = {}
+    if max_length > 0:
+        arguments["x-max-length"] = max_length
+        if overflow:
+            arguments["x-overflow"] = overflow
+    if message_ttl_ms > 0:
+        arguments["x-message-ttl"] = message_ttl_ms
+    return arguments
+
+
+def declare_queue(connection: pika.BlockingConnection, channel, queue_name: str, durable: bool, arguments: Dict[str, object]):
+    """Declara la cola con sus límites y devuelve el canal a usar.
+
+    Si la cola ya existe con otros argumentos el broker cierra el canal con
+    406 PRECONDITION_FAILED; en ese caso se reabre el canal y se usa la cola
+    existente tal cual (hay que borrarla o aplicar una policy para que tome
+    los límites nuevos).
+    """
+    try:
+        channel.queue_declare(queue=queue_name, durable=durable, arguments=arguments or None)
+        return channel
+    except pika.exceptions.ChannelClosedByBroker as ex:
+        if ex.reply_code != 406:
+            raise
+        logger.warning("Queue '%s' already exists with different arguments (%s). Using it as is; "
+                       "delete it or apply a broker policy to enable %s", queue_name, ex.reply_text, arguments)
+        channel = connection.channel()
+        channel.queue_declare(queue=queue_name, passive=True)
+        return channel
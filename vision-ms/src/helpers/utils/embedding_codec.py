@@ -0,0 +1,128 @@
+from __future__ import annotations
+import struct
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from bson.binary import Binary, USER_DEFINED_SUBTYPE
+from pymongo import UpdateOne
+from ..constants.constants import constants
+
+# Embeddings en Mongo como Binary (subtype definido por el usuario) en lugar de un array de doubles:
+# magic(2) version(1) dtype(1) dim(H) model_version(H) + vector little-endian.
+# 512 float32 = 2 KB (1 KB en float16) contra ~4.6 KB del array BSON.
+_HEADER = struct.Struct("<2sBBHH")
+_MAGIC = b"FE"
+_VERSION = 1
+
+HEADER_SIZE = _HEADER.size
+EMBEDDING_SUBTYPE = USER_DEFINED_SUBTYPE
+
+DTYPE_FLOAT32 = "float32"
+DTYPE_FLOAT16 = "float16"
+
+_DTYPE_CODES = {DTYPE_FLOAT32: 1, DTYPE_FLOAT16: 2}
+_CODE_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+
+# Grupos de PersonDTO.embeddings
+EMBEDDING_GROUPS = ("manual", "auto")
+
+
+@dataclass
+class EmbeddingHeader:
+    dtype: str
+    dim: int
+    model_version: int
+
+
+def encode_embedding(vector, dtype: Optional[str] = None, model_version: Optional[int] = None) -> Binary:
+    """Empaqueta un vector (lista o ndarray) como Binary con cabecera dtype/dim/versión de modelo."""
+    dtype = dtype or constants["FACE_EMBEDDING_STORAGE_DTYPE"]
+    if dtype not in _DTYPE_CODES:
+        raise ValueError(f"dtype de embedding no soportado: {dtype}")
+    code = _DTYPE_CODES[dtype]
+    array = np.asarray(vector, dtype=_CODE_DTYPES[code]).reshape(-1)
+    header = _HEADER.pack(
+        _MAGIC,
+        _VERSION,
+        code,
+        array.size,
+        constants["FACE_EMBEDDING_MODEL_VERSION"] if model_version is None else model_version,
+    )
+    return Binary(header + array.tobytes(), EMBEDDING_SUBTYPE)
+
+
+def is_encoded(value) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:2]) == _MAGIC
+
+
+def embedding_header(value) -> Optional[EmbeddingHeader]:
+    """Cabecera de un embedding codificado; None para el formato legado (lista de doubles)."""
+    if not is_encoded(value):
+        return None
+    if len(value) < HEADER_SIZE:
+        raise ValueError("Embedding truncado")
+    _, version, code, dim, model_version = _HEADER.unpack_from(value, 0)
+    if version != _VERSION or code not in _CODE_DTYPES:
+        raise ValueError(f"Embedding con versión {version} / dtype {code} no soportado")
+    return EmbeddingHeader(dtype=_CODE_DTYPES[code].name, dim=dim, model_version=model_version)
+
+
+def decode_embedding(value) -> np.ndarray:
+    """Vector float32 de un embedding codificado o legado.
+
+    En float32 es una vista de solo lectura sobre el buffer del documento
+    (np.frombuffer, sin copia); float16 se convierte a float32. Las listas del
+    formato anterior se convierten con np.asarray.
+    """
+    if value is None:
+        return np.empty(0, dtype=np.float32)
+    if isinstance(value, np.ndarray):
+        return value.astype(np.float32, copy=False).reshape(-1)
+    header = embedding_header(value)
+    if header is None:
+        return np.asarray(value, dtype=np.float32).reshape(-1)
+    array = np.frombuffer(value, dtype=_CODE_DTYPES[_DTYPE_CODES[header.dtype]], count=header.dim, offset=HEADER_SIZE)
+    return array if header.dtype == DTYPE_FLOAT32 else array.astype(np.float32)
+
+
+def decode_embedding_list(value) -> List[float]:
+    """Vector como lista de floats (DTOs que se serializan a JSON en la API)."""
+    return decode_embedding(value).tolist()
+
+
+def encode_embedding_doc(emb: dict) -> dict:
+    """Subdocumento de FaceEmbeddingDTO (asdict) con el vector codificado."""
+    if emb.get("embedding") is not None and not is_encoded(emb["embedding"]):
+        emb["embedding"] = encode_embedding(emb["embedding"])
+    return emb
+
+
+def encode_embeddings_doc(embeddings: Optional[Dict[str, List[dict]]]) -> Optional[Dict[str, List[dict]]]:
+    """{"manual": [...], "auto": [...]} con todos los vectores codificados."""
+    for group in EMBEDDING_GROUPS:
+        for emb in (embeddings or {}).get(group) or []:
+            encode_embedding_doc(emb)
+    return embeddings
+
+
+def legacy_migration(doc: dict) -> Optional[UpdateOne]:
+    """UpdateOne que recodifica los embeddings legados (listas) de `doc`; None si no hay.
+
+    Cada vector se ubica con un arrayFilter sobre su propio valor, no por
+    posición: un $push con $slice concurrente puede desplazar los índices del
+    grupo auto entre la lectura y la escritura. Si el vector ya no está, el
+    filtro no coincide y no se modifica nada.
+    """
+    sets = {}
+    array_filters = []
+    for group in EMBEDDING_GROUPS:
+        for emb in ((doc.get("embeddings") or {}).get(group) or []):
+            value = emb.get("embedding")
+            if not isinstance(value, Sequence) or isinstance(value, (str, bytes)) or not value:
+                continue
+            name = f"e{len(array_filters)}"
+            sets[f"embeddings.{group}.$[{name}].embedding"] = encode_embedding(value)
+            array_filters.append({f"{name}.embedding": value})
+    if not sets:
+        return None
+    return UpdateOne({"_id": doc["_id"]}, {"$set": sets}, array_filters=array_filters)
@@ -0,0 +1,81 @@
+from __future__ import annotations
+import logging
+import os
+import queue
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+from ..constants.constants import constants
+
+logger = logging.getLogger(__name__)
+
+# Threads por sesión cuando ni el tamaño del pool ni los threads están configurados
+DEFAULT_INTRA_OP_THREADS = 4
+
+
+def resolve_pool_sizing(size: int, intra_op_threads: int, cores: Optional[int] = None) -> Tuple[int, int]:
+    """(sesiones, threads por sesión) repartiendo los núcleos; 0 = calcular a partir del otro valor."""
+    cores = cores or os.cpu_count() or 1
+    if size <= 0 and intra_op_threads <= 0:
+        intra_op_threads = min(DEFAULT_INTRA_OP_THREADS, cores)
+    if size <= 0:
+        size = max(1, cores // intra_op_threads)
+    if intra_op_threads <= 0:
+        intra_op_threads = max(1, cores // size)
+    return size, intra_op_threads
+
+
+class FaceEnginePool:
+    """N FaceEngine con sesiones ONNX independientes.
+
+    Compartido por face_registry y face_recognition (main crea uno solo). Los
+    engines se construyen con `engine_factory(intra_op_threads=...)`, así el
+    pool no depende del paquete que define el FaceEngine.
+
+    Un único FaceAnalysis compartido serializa a todas las cámaras; el pool
+    reparte los núcleos entre FACE_ENGINE_POOL_SIZE sesiones de
+    FACE_ENGINE_INTRA_OP_THREADS threads cada una. Quien necesita inferir hace
+    `checkout()` de un engine libre (bloquea si están todos ocupados);
+    `extract` / `extract_batch` lo hacen por el caller, así el pool se puede
+    usar donde antes se pasaba un FaceEngine.
+    """
+
+    def __init__(self, engine_factory: Callable[..., Any], size: Optional[int] = None,
+                 intra_op_threads: Optional[int] = None) -> None:
+        self.size, self.intra_op_threads = resolve_pool_sizing(
+            size if size is not None else constants["FACE_ENGINE_POOL_SIZE"],
+            intra_op_threads if intra_op_threads is not None else constants["FACE_ENGINE_INTRA_OP_THREADS"],
+        )
+        self._engines: List[Any] = []
+        self._idle: "queue.Queue[Any]" = queue.Queue()
+        for _ in range(self.size):
+            engine = engine_factory(intra_op_threads=self.intra_op_threads)
+            self._engines.append(engine)
+            self._idle.put(engine)
+        logger.info("FaceEnginePool inicializado: %s sesiones x %s threads", self.size, self.intra_op_threads)
+
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        try:
+            engine = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No hay FaceEngine libre en el pool")
+        try:
+            yield engine
+        finally:
+            self._idle.put(engine)
+
+    def extract(self, frame_bgr, select: Optional[Callable] = None) -> List[Any]:
+        with self.checkout() as engine:
+            return engine.extract(frame_bgr, select)
+
+    def extract_batch(self, frames_bgr: Sequence,
+                      selectors: Optional[Sequence[Optional[Callable]]] = None) -> List[List[Any]]:
+        with self.checkout() as engine:
+            return engine.extract_batch(frames_bgr, selectors)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "intra_op_threads": self.intra_op_threads,
+            "idle": self._idle.qsize(),
+        }
@@ -0,0 +1,331 @@
+from __future__ import annotations
+import logging
+import os
+import secrets
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bus local de frames BGR crudos sobre multiprocessing.shared_memory.
+#
+# Un ring por cámara y rendition. Layout:
+#   [cabecera global 64B][slot 0: cabecera 64B + datos][slot 1] ...
+# La cabecera global guarda el último seq escrito, el heartbeat de lectores y
+# el dueño del segmento (pid y token del writer que lo creó).
+# Cada slot guarda su seq; el writer lo pone a 0 mientras copia, así un lector
+# detecta un slot a medio escribir o ya sobrescrito.
+_GLOBAL = struct.Struct("<4sBIQQdIQ")   # magic, version, slots, slot_capacity, write_seq, reader_heartbeat, owner_pid, owner_token
+_SLOT = struct.Struct("<QdfIIIqq")      # seq, timestamp, fps, width, height, channels, camera_id, user_id
+_MAGIC = b"VBUS"
+_VERSION = 2
+_HEADER_SIZE = 64
+_WRITE_SEQ_OFFSET = 4 + 1 + 4 + 8
+_HEARTBEAT_OFFSET = _WRITE_SEQ_OFFSET + 8
+_OWNER_OFFSET = _HEARTBEAT_OFFSET + 8
+_OWNER = struct.Struct("<IQ")
+_NONE_ID = -1
+
+
+def frame_bus_name(camera_id, rendition: str) -> str:
+    return f"vision_bus_{camera_id}_{rendition}"
+
+
+@dataclass
+class FrameBusItem:
+    seq: int
+    camera_id: Optional[int]
+    user_id: Optional[int]
+    timestamp: float
+    fps: float
+    width: int
+    height: int
+    # Vista numpy (sin copia) sobre la memoria compartida
+    frame: np.ndarray
+
+
+class _Ring:
+
+    def __init__(self, shm: shared_memory.SharedMemory) -> None:
+        self.shm = shm
+        self.buf = shm.buf
+
+    def read_global(self):
+        return _GLOBAL.unpack_from(self.buf, 0)
+
+    def write_seq(self) -> int:
+        return struct.unpack_from("<Q", self.buf, _WRITE_SEQ_OFFSET)[0]
+
+    def slot_offset(self, index: int, slot_capacity: int) -> int:
+        return _HEADER_SIZE + index * (_HEADER_SIZE + slot_capacity)
+
+
+def _read_owner(name: str):
+    """(pid, token) del writer dueño del segmento `name`; None si no existe o no es un ring."""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return None
+    try:
+        if shm.size < _HEADER_SIZE or bytes(shm.buf[:4]) != _MAGIC or shm.buf[4] != _VERSION:
+            return None
+        return _OWNER.unpack_from(shm.buf, _OWNER_OFFSET)
+    finally:
+        shm.close()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class FrameBusWriter:
+    """Escribe frames BGR en un ring de memoria compartida (lado ingest).
+
+    Solo el writer que creó el segmento lo borra: la cabecera lleva su pid y
+    un token, y `close` no hace unlink si el nombre ya apunta al segmento de
+    otro writer. Un segmento existente se reemplaza si su dueño murió (ring
+    huérfano) o es de este mismo proceso (un worker anterior de la cámara que
+    todavía no terminó: el writer nuevo toma el nombre y el viejo, al cerrar,
+    ya no lo borra). Si lo tiene otro proceso vivo se rechaza.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, name: str, slots: int, max_width: int, max_height: int, channels: int = 3) -> None:
+        self.name = name
+        self.slots = slots
+        self.slot_capacity = max_width * max_height * channels
+        self.token = secrets.randbits(63) or 1
+        size = _HEADER_SIZE + slots * (_HEADER_SIZE + self.slot_capacity)
+
+        with self._lock:
+            owner = _read_owner(name)
+            if owner is not None:
+                pid, _ = owner
+                if pid != os.getpid() and _pid_alive(pid):
+                    raise FileExistsError(f"El ring '{name}' pertenece a un writer vivo (pid={pid})")
+                if pid == os.getpid():
+                    logger.warning("FrameBus ring '%s' de un writer anterior de este proceso; se reemplaza", name)
+            try:
+                # Un ring huérfano de una ejecución anterior (p.ej. proceso de ingest muerto)
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+
+            self._ring = _Ring(shared_memory.SharedMemory(name=name, create=True, size=size))
+            _GLOBAL.pack_into(self._ring.buf, 0, _MAGIC, _VERSION, slots, self.slot_capacity, 0, 0.0,
+                              os.getpid(), self.token)
+        self._seq = 0
+        logger.info("FrameBus ring '%s' creado (slots=%s, slotCapacity=%s bytes)", name, slots, self.slot_capacity)
+
+    def write(self, frame: np.ndarray, timestamp: float, fps: float, camera_id=None, user_id=None) -> int:
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        nbytes = height * width * channels
+        if nbytes > self.slot_capacity:
+            raise ValueError(f"Frame {width}x{height} no cabe en el ring '{self.name}'")
+
+        seq = self._seq + 1
+        offset = self._ring.slot_offset(seq % self.slots, self.slot_capacity)
+        buf = self._ring.buf
+
+        # Invalidar el slot mientras se copia
+        struct.pack_into("<Q", buf, offset, 0)
+        dst = np.ndarray((height, width, channels), dtype=np.uint8, buffer=buf, offset=offset + _HEADER_SIZE)
+        np.copyto(dst, frame.reshape(height, width, channels))
+        _SLOT.pack_into(
+            buf, offset, seq, float(timestamp), float(fps or 0), width, height, channels,
+            _NONE_ID if camera_id is None else int(camera_id),
+            _NONE_ID if user_id is None else int(user_id),
+        )
+        struct.pack_into("<Q", buf, _WRITE_SEQ_OFFSET, seq)
+        self._seq = seq
+        return seq
+
+    def reader_heartbeat(self) -> float:
+        return struct.unpack_from("<d", self._ring.buf, _HEARTBEAT_OFFSET)[0]
+
+    def has_readers(self, max_age_seconds: float) -> bool:
+        return time.time() - self.reader_heartbeat() <= max_age_seconds
+
+    def owns_segment(self) -> bool:
+        """True si el nombre del ring todavía apunta al segmento creado por este writer."""
+        return _read_owner(self.name) == (os.getpid(), self.token)
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                if self.owns_segment():
+                    self._ring.shm.unlink()
+                else:
+                    logger.info("FrameBus ring '%s' ya pertenece a otro writer; no se borra", self.name)
+            except FileNotFoundError:
+                pass
+        try:
+            self._ring.shm.close()
+        except BufferError:
+            # Aún hay vistas numpy vivas; el segmento se libera al recolectarlas
+            pass
+        except Exception as ex:
+            logger.warning("Error cerrando ring '%s': %s", self.name, ex)
+
+
+class FrameBusReader:
+    """Lee frames de un ring como vistas numpy sin copia (lado consumer).
+
+    Cada lector mantiene su propio cursor (último seq leído). Si se atrasa más
+    de `slots - 1` frames salta al más reciente y cuenta los perdidos en
+    `dropped`. La vista devuelta es válida hasta que el writer da la vuelta al
+    ring; `is_valid(item)` permite comprobarlo después de usarla.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        shm = shared_memory.SharedMemory(name=name)
+        # En Python < 3.13 el resource_tracker borra el segmento al salir aunque
+        # solo nos hayamos adjuntado; el dueño del ring es el writer.
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        self._ring = _Ring(shm)
+        magic, version, self.slots, self.slot_capacity, _, _, _, _ = self._ring.read_global()
+        if magic != _MAGIC or version != _VERSION:
+            shm.close()
+            raise ValueError(f"Ring '{name}' con formato no soportado")
+        self.cursor = 0
+        self.dropped = 0
+
+    def _heartbeat(self) -> None:
+        struct.pack_into("<d", self._ring.buf, _HEARTBEAT_OFFSET, time.time())
+
+    def read(self) -> Optional[FrameBusItem]:
+        self._heartbeat()
+        latest = self._ring.write_seq()
+        if latest <= self.cursor:
+            return None
+
+        wanted = self.cursor + 1
+        if self.cursor == 0 or latest - self.cursor >= self.slots:
+            # Primer frame o lector demasiado atrasado: saltar al último
+            if self.cursor:
+                self.dropped += latest - self.cursor - 1
+            wanted = latest
+
+        buf = self._ring.buf
+        offset = self._ring.slot_offset(wanted % self.slots, self.slot_capacity)
+        seq, timestamp, fps, width, height, channels, camera_id, user_id = _SLOT.unpack_from(buf, offset)
+        if seq != wanted:
+            # Slot sobrescrito o a medio escribir; se reintenta en la próxima lectura
+            self.cursor = max(self.cursor, latest - 1)
+            return None
+
+        self.cursor = wanted
+        frame = np.ndarray((height, width, channels), dtype=np.uint8, buffer=buf, offset=offset + _HEADER_SIZE)
+        return FrameBusItem(
+            seq=seq,
+            camera_id=None if camera_id == _NONE_ID else camera_id,
+            user_id=None if user_id == _NONE_ID else user_id,
+            timestamp=timestamp,
+            fps=fps,
+            width=width,
+            height=height,
+            frame=frame,
+        )
+
+    def wait(self, timeout: float, poll_interval: float = 0.005) -> Optional[FrameBusItem]:
+        deadline = time.time() + timeout
+        while True:
+            item = self.read()
+            if item is not None or time.time() >= deadline:
+                return item
+            time.sleep(poll_interval)
+
+    def is_valid(self, item: FrameBusItem) -> bool:
+        offset = self._ring.slot_offset(item.seq % self.slots, self.slot_capacity)
+        return struct.unpack_from("<Q", self._ring.buf, offset)[0] == item.seq
+
+    def close(self) -> None:
+        try:
+            self._ring.shm.close()
+        except BufferError:
+            pass
+        except Exception as ex:
+            logger.warning("Error cerrando ring '%s': %s", self.name, ex)
+
+
+class FrameBusSubscription:
+    """Lectura continua de un ring: se adjunta cuando el writer lo crea y se
+    re-adjunta si deja de recibir frames (p.ej. el ingest se reinició y creó
+    un segmento nuevo con el mismo nombre)."""
+
+    def __init__(self, name: str, reattach_seconds: float = 5.0) -> None:
+        self.name = name
+        self.reattach_seconds = reattach_seconds
+        self.dropped = 0
+        # Frames descartados porque el writer sobrescribió el slot mientras se usaban
+        self.torn = 0
+        self._reader: Optional[FrameBusReader] = None
+        self._last_item_ts = 0.0
+
+    def next(self, timeout: float, copy: bool = False) -> Optional[FrameBusItem]:
+        """Próximo frame; con `copy` el frame se copia fuera del ring (y se valida después de copiarlo).
+
+        Sin `copy` el frame es una vista sobre el ring: quien la usa debe
+        comprobar `is_valid(item)` al terminar y descartar el resultado si el
+        writer ya reutilizó el slot.
+        """
+        if self._reader is None:
+            try:
+                self._reader = FrameBusReader(self.name)
+                self._last_item_ts = time.time()
+                logger.info("FrameBus: adjuntado al ring '%s'", self.name)
+            except FileNotFoundError:
+                time.sleep(timeout)
+                return None
+
+        item = self._reader.wait(timeout)
+        if item is not None:
+            self._last_item_ts = time.time()
+            if copy:
+                item.frame = item.frame.copy()
+                if not self.is_valid(item):
+                    return None
+            return item
+
+        if time.time() - self._last_item_ts > self.reattach_seconds:
+            logger.info("FrameBus: sin frames en '%s' por %ss, re-adjuntando", self.name, self.reattach_seconds)
+            self._release()
+        return None
+
+    def is_valid(self, item: FrameBusItem) -> bool:
+        """True si el slot de `item` no se sobrescribió desde que se leyó; cuenta los descartes."""
+        if self._reader is not None and self._reader.is_valid(item):
+            return True
+        self.torn += 1
+        return False
+
+    def _release(self) -> None:
+        if self._reader is not None:
+            self.dropped += self._reader.dropped
+            self._reader.close()
+            self._reader = None
+
+    def close(self) -> None:
+        self._release()
+        if self.dropped or self.torn:
+            logger.info("FrameBus '%s': %s frames perdidos por atraso, %s sobrescritos durante su uso",
+                        self.name, self.dropped, self.torn)
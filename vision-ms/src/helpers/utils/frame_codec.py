@@ -0,0 +1,108 @@
+from __future__ import annotations
+import base64
+import json
+import struct
+from typing import Optional, Tuple
+import cv2
+import numpy as np
+from ..dto.frame_dto import FrameMessageDTO
+
+# Formatos soportados en el exchange camera.*
+# - binary: prefijo struct fijo + bytes JPEG crudos (sin base64, sin JSON).
+# - json: formato legado {"frame": "<JPEG_BASE64>", ...}.
+WIRE_FORMAT_BINARY = "binary"
+WIRE_FORMAT_JSON = "json"
+
+CONTENT_TYPE_FRAME = "application/x-vision-frame"
+CONTENT_TYPE_JSON = "application/json"
+
+# Prefijo: magic(4) version(1) camera_id(q) user_id(q) timestamp(d) fps(f) width(H) height(H)
+_HEADER = struct.Struct(">4sBqqdfHH")
+_MAGIC = b"VFRM"
+_VERSION = 1
+_NONE_ID = -1
+
+HEADER_SIZE = _HEADER.size
+
+# Renditions publicadas por ingest: cada una con su routing key camera.<id>.<rendition>
+RENDITION_ANALYTICS = "analytics"
+RENDITION_ARCHIVE = "archive"
+
+
+def frame_routing_key(camera_id, rendition: str) -> str:
+    return f"camera.{camera_id}.{rendition}"
+
+
+def frame_queue_name(camera_id, rendition: str) -> str:
+    """Cola del consumer de cada rendition (reconocimiento facial / grabaciones)."""
+    if rendition == RENDITION_ANALYTICS:
+        return f"vision.face.detected.{camera_id}"
+    return f"video-archive.{camera_id}"
+
+
+def encode_frame(msg: FrameMessageDTO, wire_format: str = WIRE_FORMAT_BINARY) -> Tuple[bytes, str]:
+    """Serializa un frame JPEG y devuelve (body, content_type)."""
+    if wire_format == WIRE_FORMAT_JSON:
+        payload = {
+            "camera_id": msg.camera_id,
+            "user_id": msg.user_id,
+            "timestamp": msg.timestamp,
+            "frame": base64.b64encode(msg.frame).decode("utf-8"),
+            "fps": msg.fps,
+            "width": msg.width,
+            "height": msg.height,
+        }
+        return json.dumps(payload).encode("utf-8"), CONTENT_TYPE_JSON
+
+    header = _HEADER.pack(
+        _MAGIC,
+        _VERSION,
+        _NONE_ID if msg.camera_id is None else int(msg.camera_id),
+        _NONE_ID if msg.user_id is None else int(msg.user_id),
+        float(msg.timestamp),
+        float(msg.fps or 0),
+        int(msg.width),
+        int(msg.height),
+    )
+    # join acepta cualquier buffer (ndarray de cv2.imencode) sin copia intermedia
+    return b"".join((header, msg.frame)), CONTENT_TYPE_FRAME
+
+
+def decode_frame(body: bytes, content_type: Optional[str] = None) -> FrameMessageDTO:
+    """Decodifica un mensaje del exchange camera.* negociando por content-type.
+
+    Los mensajes sin content-type (publicados por versiones anteriores) se
+    tratan como JSON + base64.
+    """
+    if content_type == CONTENT_TYPE_FRAME:
+        if len(body) < HEADER_SIZE:
+            raise ValueError("Mensaje de frame truncado")
+        magic, version, camera_id, user_id, timestamp, fps, width, height = _HEADER.unpack_from(body, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Cabecera de frame no soportada: magic={magic!r} version={version}")
+        return FrameMessageDTO(
+            camera_id=None if camera_id == _NONE_ID else camera_id,
+            user_id=None if user_id == _NONE_ID else user_id,
+            timestamp=timestamp,
+            fps=fps,
+            width=width,
+            height=height,
+            frame=memoryview(body)[HEADER_SIZE:],
+        )
+
+    msg = json.loads(body)
+    return FrameMessageDTO(
+        camera_id=msg["camera_id"],
+        user_id=msg["user_id"],
+        timestamp=float(msg.get("timestamp", 0)),
+        fps=msg.get("fps"),
+        width=msg.get("width"),
+        height=msg.get("height"),
+        frame=base64.b64decode(msg["frame"]),
+    )
+
+
+def decode_frame_image(msg: FrameMessageDTO):
+    """Decodifica el JPEG del mensaje a un frame BGR (None si es inválido)."""
+    arr = np.frombuffer(msg.frame, np.uint8)
+    return cv2.imdecode(arr, cv2.IMREAD_COLOR)
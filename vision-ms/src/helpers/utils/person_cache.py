@@ -0,0 +1,100 @@
+from __future__ import annotations
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from ..constants.constants import constants
+from ..dto.person_summary_dto import PersonSummaryDTO
+
+logger = logging.getLogger(__name__)
+
+
+class PersonCache:
+    """Caché LRU con TTL de PersonSummaryDTO, compartida por todo el proceso.
+
+    El camino de reconocimiento resuelve la identidad (nombre, riesgo,
+    seenCount) de una persona matcheada sin leer de Mongo el documento
+    completo con sus embeddings. Los PersonService invalidan la entrada en
+    cada update / update_field / delete, así que un cambio de riesgo hecho por
+    la API se ve en el siguiente avistamiento; el TTL acota lo que puedan
+    desfasar escrituras hechas por fuera del servicio.
+    """
+
+    _shared: Optional["PersonCache"] = None
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "PersonCache":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(
+                    max_size=constants["PERSON_CACHE_MAX_SIZE"],
+                    ttl_seconds=constants["PERSON_CACHE_TTL_SECONDS"],
+                )
+            return cls._shared
+
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # person_id -> (expira, resumen); el orden es el de uso (LRU al principio)
+        self._entries: "OrderedDict[int, Tuple[float, PersonSummaryDTO]]" = OrderedDict()
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, person_id: int) -> Optional[PersonSummaryDTO]:
+        with self._lock:
+            item = self._entries.get(person_id)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, summary = item
+            if self.ttl_seconds > 0 and expires_at < time.monotonic():
+                del self._entries[person_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(person_id)
+            self.hits += 1
+            return summary
+
+    def put(self, summary: PersonSummaryDTO) -> None:
+        with self._lock:
+            self._entries[summary.id] = (time.monotonic() + self.ttl_seconds, summary)
+            self._entries.move_to_end(summary.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def bump_seen(self, person_id: int, count: int = 1) -> Optional[int]:
+        """Suma `count` al seenCount en caché (el $inc en Mongo va aparte); None si no está."""
+        with self._lock:
+            item = self._entries.get(person_id)
+            if item is None:
+                return None
+            item[1].seenCount += count
+            return item[1].seenCount
+
+    def invalidate(self, person_id: int) -> None:
+        with self._lock:
+            self._entries.pop(person_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+            }
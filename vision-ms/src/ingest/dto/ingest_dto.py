@@ -1,5 +1,37 @@
-from typing import Optional
-from dataclasses import dataclass
+from typing import List, Optional
+from dataclasses import dataclass, field
+
+@dataclass
+class RenditionConfig:
+    # Nombre de la rendition; define la routing key camera.<id>.<name>
+    name: str
+    # Tamaño máximo; el frame se reduce si la fuente es más grande
+    width: int
+    height: int
+    jpeg_quality: int
+
+@dataclass
+class MotionGateConfig:
+    enabled: bool = False
+    # Ancho del frame reducido sobre el que se mide el movimiento
+    width: int = 160
+    # Fracción mínima de píxeles cambiados para considerar movimiento
+    min_area_ratio: float = 0.005
+    # En escena estática se publica un frame cada keepalive_seconds
+    keepalive_seconds: float = 5.0
+    # Se sigue publicando a tasa completa hold_seconds después del último movimiento
+    hold_seconds: float = 2.0
+
+@dataclass
+class HibernationConfig:
+    # Baja el costo de cámaras cuyas renditions no tiene nadie consumiendo
+    enabled: bool = False
+    # Sin consumers durante grace_seconds -> solo grab(); durante disconnect_seconds -> se cierra el stream
+    grace_seconds: float = 30.0
+    disconnect_seconds: float = 300.0
+    # Cada cuánto se consulta el número de consumers de las colas en RabbitMQ
+    check_interval_seconds: float = 5.0
+
 
 @dataclass
 class CameraConfig:
@@ -8,9 +40,34 @@ class CameraConfig:
     rtsp_url: str
     amqp_url: str
     exchange: str
-    jpeg_quality: int
     reconnect_delay_seconds: int
-    frame_width: int
-    frame_height: int
-    
-    
\ No newline at end of file
+    # Timeouts de apertura y lectura del VideoCapture (0 = default del backend)
+    open_timeout_ms: int = 0
+    read_timeout_ms: int = 0
+    renditions: List[RenditionConfig] = field(default_factory=list)
+    # fps objetivo de decode/publicación (0 = todos los frames de la fuente)
+    target_fps: float = 0.0
+    sub_stream_url: Optional[str] = None
+    wire_format: str = "binary"
+    # Bus local en memoria compartida (ver helpers/utils/frame_bus.py)
+    frame_bus: bool = False
+    frame_bus_slots: int = 8
+    # Si es False y hay frame bus, no se codifica JPEG ni se publica en RabbitMQ
+    publish_amqp: bool = True
+    # Reducción adaptativa de la tasa de publicación ante presión del broker
+    adaptive_rate: bool = True
+    min_publish_fps: float = 1.0
+    backpressure_latency_ms: float = 250.0
+    motion_gate: MotionGateConfig = field(default_factory=MotionGateConfig)
+    hibernation: HibernationConfig = field(default_factory=HibernationConfig)
+
+
+@dataclass
+class StreamProbeDTO:
+    url: str
+    ok: bool
+    elapsed_ms: float
+    fps: float = 0.0
+    width: int = 0
+    height: int = 0
+    error: Optional[str] = None
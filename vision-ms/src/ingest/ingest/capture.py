@@ -0,0 +1,236 @@
+from __future__ import annotations
+import logging
+import threading
+import time
+from typing import Optional
+import cv2
+from .frame_slot import LatestFrameSlot
+from .reconnect_scheduler import ReconnectScheduler
+
+logger = logging.getLogger(__name__)
+
+# Modos de hibernación (los fija CameraWorker cuando ninguna rendition tiene consumers)
+HIBERNATE_OFF = "off"
+HIBERNATE_GRAB_ONLY = "grab_only"
+HIBERNATE_DISCONNECTED = "disconnected"
+
+class CaptureStream(threading.Thread):
+    """Etapa de captura: solo lee del RTSP y deja el último frame en el slot.
+
+    No hace resize, encode ni publish, así que un broker o encoder lento nunca
+    llena el buffer interno de OpenCV con frames viejos.
+
+    Con `target_fps` > 0 se hace grab() de todos los frames (para mantener el
+    stream sincronizado) pero retrieve() (decode + conversión de color) solo
+    de los que se van a publicar.
+
+    Las aperturas y los reintentos pasan por un ReconnectScheduler (compartido
+    por el CameraManager); sin scheduler se reintenta cada
+    `reconnect_delay_seconds`, sin límite de aperturas concurrentes.
+
+    `hibernation` permite al worker bajar el costo cuando nadie consume los
+    frames: grab_only mantiene la sesión RTSP con grab() sin retrieve(), y
+    disconnected libera el VideoCapture hasta que vuelva a haber demanda.
+    """
+
+    def __init__(self, camera_id: int, rtsp_url: str, reconnect_delay_seconds: int,
+                 slot: LatestFrameSlot, stop_event: threading.Event, target_fps: float = 0.0,
+                 stream_name: str = "main", scheduler: Optional[ReconnectScheduler] = None,
+                 open_timeout_ms: int = 0, read_timeout_ms: int = 0) -> None:
+        super().__init__(daemon=True)
+        self.camera_id = camera_id
+        self.stream_name = stream_name
+        self.rtsp_url = rtsp_url
+        self.reconnect_delay_seconds = reconnect_delay_seconds
+        self.scheduler = scheduler or ReconnectScheduler(
+            max_concurrent_opens=1 << 16,
+            base_delay_seconds=reconnect_delay_seconds,
+            max_delay_seconds=reconnect_delay_seconds,
+            jitter_ratio=0.0,
+        )
+        self.scheduler_key = f"{camera_id}/{stream_name}"
+        self.open_timeout_ms = open_timeout_ms
+        self.read_timeout_ms = read_timeout_ms
+        self.hibernation = HIBERNATE_OFF
+        self._slot = slot
+        self._stop_event = stop_event
+        self.target_fps = target_fps
+        self._decimation_acc = 0.0
+        self._next_decode_ts = 0.0
+        # Propiedades del stream abierto
+        self.fps: float = 0.0
+        self.width: int = 0
+        self.height: int = 0
+        # Contadores
+        self.frames_grabbed = 0
+        self.frames_captured = 0
+        self.read_failures = 0
+        self.reconnects = 0
+
+    def is_int(self, value: str) -> bool:
+        try:
+            int(value)
+            return True
+        except ValueError:
+            return False
+
+    @property
+    def effective_fps(self) -> float:
+        """fps de los frames que realmente se decodifican y publican."""
+        if self.target_fps > 0 and (not self.fps or self.target_fps < self.fps):
+            return self.target_fps
+        return self.fps
+
+    def stats(self) -> dict:
+        return {
+            "fps": self.fps,
+            "target_fps": self.target_fps,
+            "width": self.width,
+            "height": self.height,
+            "frames_grabbed": self.frames_grabbed,
+            "frames_captured": self.frames_captured,
+            "read_failures": self.read_failures,
+            "reconnects": self.reconnects,
+            "hibernation": self.hibernation,
+            "connection": self.scheduler.state(self.scheduler_key),
+        }
+
+    def run(self) -> None:
+        camera_id = self.camera_id if self.stream_name == "main" else f"{self.camera_id}/{self.stream_name}"
+        cap = None
+
+        logger.info("CaptureStream STARTED for camera %s", camera_id)
+        key = self.scheduler_key
+        self.scheduler.claim(key, self)
+        first_frame = False
+        hibernating = False
+        while not self._stop_event.is_set():
+            try:
+                if self.hibernation == HIBERNATE_DISCONNECTED:
+                    if not hibernating:
+                        logger.info("Camera %s: No consumers. Releasing stream until demand returns.", camera_id)
+                        hibernating = True
+                        self.scheduler.mark_hibernating(key)
+                    if cap is not None:
+                        cap.release()
+                        cap = None
+                    self._stop_event.wait(0.5)
+                    continue
+                hibernating = False
+
+                if cap is None or not cap.isOpened():
+                    logger.info("Camera %s: No active capture. Trying to open stream: %s", camera_id, self.rtsp_url)
+
+                    if not self.scheduler.acquire_open(key, self._stop_event):
+                        break
+                    try:
+                        cap = self._open_capture()
+                    finally:
+                        self.scheduler.release_open(key, opened=cap is not None)
+                    if cap is None:
+                        delay = self.scheduler.mark_failed(key, "open failed")
+                        logger.warning("Camera %s: Failed to open stream. Retrying in %.1f seconds...", camera_id, delay)
+                        self._stop_event.wait(delay)
+                        continue
+
+                    self.fps, self.width, self.height = self._read_video_properties(cap)
+                    self._decimation_acc = 0.0
+                    self._next_decode_ts = 0.0
+                    self.reconnects += 1
+                    first_frame = True
+                    logger.info("Camera %s: Stream opened (fps=%s, resolution=%sx%s)", camera_id, self.fps, self.width, self.height)
+
+                ok = cap.grab()
+                frame = None
+                if ok:
+                    self.frames_grabbed += 1
+                    if first_frame:
+                        self.scheduler.mark_streaming(key)
+                        first_frame = False
+                    if self.hibernation == HIBERNATE_GRAB_ONLY or not self._should_decode():
+                        continue
+                    ok, frame = cap.retrieve()
+
+                if not ok or frame is None:
+                    self.read_failures += 1
+                    cap.release()
+                    cap = None
+                    delay = self.scheduler.mark_failed(key, "read failed")
+                    logger.warning("Camera %s: Frame read failed. Releasing and reconnecting in %.1f seconds.", camera_id, delay)
+                    self._stop_event.wait(delay)
+                    continue
+
+                self.frames_captured += 1
+                self._slot.put(frame, time.time())
+
+            except Exception as ex:
+                logger.exception("Camera %s: Unexpected capture error: %s", camera_id, ex)
+                if cap is not None:
+                    cap.release()
+                    cap = None
+                try:
+                    delay = self.scheduler.mark_failed(key, str(ex))
+                except Exception as mark_ex:
+                    # Un error acá no puede terminar el thread: la cámara no volvería a reconectar
+                    logger.exception("Camera %s: Error scheduling reconnect: %s", camera_id, mark_ex)
+                    delay = self.reconnect_delay_seconds
+                self._stop_event.wait(delay)
+
+        if cap is not None:
+            cap.release()
+            logger.debug("Camera %s: VideoCapture released on shutdown.", camera_id)
+
+        # Si la cámara se reinició, la clave ya es del stream nuevo
+        self.scheduler.remove(key, owner=self)
+        logger.info("CaptureStream for camera %s STOPPED", camera_id)
+
+    def _should_decode(self) -> bool:
+        if self.target_fps <= 0:
+            return True
+        if self.fps and self.fps > 0:
+            # Decimación por conteo de frames: proporción exacta target/fuente
+            if self.target_fps >= self.fps:
+                return True
+            self._decimation_acc += self.target_fps / self.fps
+            if self._decimation_acc >= 1.0:
+                self._decimation_acc -= 1.0
+                return True
+            return False
+        # fps desconocido: por reloj
+        now = time.monotonic()
+        if now < self._next_decode_ts:
+            return False
+        interval = 1.0 / self.target_fps
+        self._next_decode_ts += interval
+        if self._next_decode_ts <= now:
+            self._next_decode_ts = now + interval
+        return True
+
+    def _open_capture(self):
+        logger.info("Opening RTSP for camera %s: %s", self.camera_id, self.rtsp_url)
+        rtsp_url = int(self.rtsp_url) if self.is_int(self.rtsp_url) else self.rtsp_url
+        params = []
+        if self.open_timeout_ms > 0:
+            params += [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, self.open_timeout_ms]
+        if self.read_timeout_ms > 0:
+            params += [cv2.CAP_PROP_READ_TIMEOUT_MSEC, self.read_timeout_ms]
+        # Sin timeouts una cámara caída bloquea el open (y su cupo) durante el timeout del backend
+        cap = cv2.VideoCapture(rtsp_url, cv2.CAP_ANY, params) if params else cv2.VideoCapture(rtsp_url)
+        if not cap.isOpened():
+            logger.error("Failed to open RTSP stream for camera %s", self.camera_id)
+            return None
+        # Minimizar el buffer interno del backend (no todos lo respetan)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _read_video_properties(self, cap):
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        if width == 0 or height == 0:
+            ok, frame = cap.read()
+            if ok and frame is not None:
+                height, width = frame.shape[:2]
+
+        return fps, width, height
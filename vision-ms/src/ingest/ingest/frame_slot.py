@@ -0,0 +1,51 @@
+from __future__ import annotations
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional
+
+@dataclass
+class CapturedFrame:
+    frame: Any
+    # time.time() en el momento de la captura (para medir latencia glass-to-broker)
+    timestamp: float
+    seq: int
+
+
+class LatestFrameSlot:
+    """Slot de un único frame: el productor siempre sobrescribe con el más reciente.
+
+    Si el consumidor (encode/publish) no alcanza a tomar un frame antes de que
+    llegue el siguiente, el anterior se descarta y se contabiliza en `dropped`.
+    Varios slots pueden compartir la misma Condition para que un único
+    consumidor espere frames de cualquiera de ellos.
+    """
+
+    def __init__(self, cond: Optional[threading.Condition] = None) -> None:
+        self._cond = cond or threading.Condition()
+        self._item: Optional[CapturedFrame] = None
+        self._seq = 0
+        self.dropped = 0
+
+    def put(self, frame, timestamp: float) -> None:
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._seq += 1
+            self._item = CapturedFrame(frame=frame, timestamp=timestamp, seq=self._seq)
+            self._cond.notify()
+
+    def take(self, timeout: float) -> Optional[CapturedFrame]:
+        with self._cond:
+            if self._item is None:
+                self._cond.wait(timeout)
+            item, self._item = self._item, None
+            return item
+
+    def take_nowait(self) -> Optional[CapturedFrame]:
+        with self._cond:
+            item, self._item = self._item, None
+            return item
+
+    def clear(self) -> None:
+        with self._cond:
+            self._item = None
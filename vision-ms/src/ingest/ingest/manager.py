@@ -1,50 +1,132 @@
 from __future__ import annotations
 import logging
 import threading
-from typing import Dict
+from typing import Dict, Optional
 from .worker import CameraWorker
-from ..dto.ingest_dto import CameraConfig
+from .process_pool import IngestProcessPool
+from .reconnect_scheduler import ReconnectScheduler
+from ..publishers.connection import SharedAmqpConnection
+from ..publishers.demand_monitor import ConsumerDemandMonitor
+from ..dto.ingest_dto import CameraConfig, HibernationConfig, MotionGateConfig, RenditionConfig
 from ...helpers.constants.constants import constants
+from ...helpers.utils.frame_codec import RENDITION_ANALYTICS, RENDITION_ARCHIVE
 
 logger = logging.getLogger(__name__)
 
+# thread = un CameraWorker por cámara dentro del proceso de uvicorn
+# process = cámaras repartidas en un pool de procesos de ingest (INGEST_PROCESSES)
+INGEST_MODE_THREAD = "thread"
+INGEST_MODE_PROCESS = "process"
+
 class CameraManager:
 
-    def __init__(self) -> None:
+    def __init__(self, mode: Optional[str] = None, max_concurrent_opens: Optional[int] = None,
+                 open_slots=None) -> None:
         self._lock = threading.Lock()
+        self._mode = mode or constants["INGEST_MODE"]
+        max_concurrent_opens = max_concurrent_opens or constants["INGEST_MAX_CONCURRENT_OPENS"]
+        # Compartido por todas las cámaras del proceso: escalona las reconexiones.
+        # En un shard del pool, `open_slots` es el semáforo global de todos los procesos
+        self._reconnects = ReconnectScheduler(
+            max_concurrent_opens=max_concurrent_opens,
+            base_delay_seconds=constants["INGEST_RECONNECT_BASE_DELAY_SECONDS"],
+            max_delay_seconds=constants["INGEST_RECONNECT_MAX_DELAY_SECONDS"],
+            jitter_ratio=constants["INGEST_RECONNECT_JITTER"],
+            open_slots=open_slots,
+        )
         self._workers: Dict[int, CameraWorker] = {}
-        self._rtsp_urls: Dict[int, str] = {}
-        logger.info("CameraManager initialized")
+        # Workers parados que aún no terminaron: un start de la misma cámara los espera
+        self._stopping: Dict[int, CameraWorker] = {}
+        self._configs: Dict[int, CameraConfig] = {}
+        self._pool: Optional[IngestProcessPool] = None
+        if self._mode == INGEST_MODE_PROCESS:
+            self._pool = IngestProcessPool(
+                size=constants["INGEST_PROCESSES"],
+                health_interval_seconds=constants["INGEST_HEALTH_INTERVAL_SECONDS"],
+                request_timeout_seconds=constants["INGEST_IPC_TIMEOUT_SECONDS"],
+                max_concurrent_opens=max_concurrent_opens,
+            )
+        logger.info("CameraManager initialized (mode=%s)", self._mode)
 
-    def start_camera(self, camera_id: int, user_id: int, rtsp_url: str) -> None:
-        logger.debug("Request to START camera '%s' with RTSP='%s', user_id=%s", camera_id, rtsp_url, user_id)
+    def _build_config(self, camera_id: int, user_id: int, rtsp_url: str, target_fps: Optional[float] = None,
+                      sub_stream_url: Optional[str] = None) -> CameraConfig:
+        return CameraConfig(
+            user_id=user_id,
+            camera_id=camera_id,
+            rtsp_url=rtsp_url,
+            sub_stream_url=sub_stream_url or None,
+            target_fps=target_fps if target_fps is not None else constants["INGEST_TARGET_FPS"],
+            amqp_url=constants["AMQP_URL"],
+            exchange=constants["AMQP_EXCHANGE"],
+            reconnect_delay_seconds=constants["INGEST_RECONNECT_DELAY_SECONDS"],
+            open_timeout_ms=constants["INGEST_OPEN_TIMEOUT_MS"],
+            read_timeout_ms=constants["INGEST_READ_TIMEOUT_MS"],
+            renditions=[
+                RenditionConfig(
+                    name=RENDITION_ANALYTICS,
+                    width=constants["INGEST_ANALYTICS_WIDTH"],
+                    height=constants["INGEST_ANALYTICS_HEIGHT"],
+                    jpeg_quality=constants["INGEST_ANALYTICS_JPEG_QUALITY"],
+                ),
+                RenditionConfig(
+                    name=RENDITION_ARCHIVE,
+                    width=constants["INGEST_VIDEO_WIDTH"],
+                    height=constants["INGEST_VIDEO_HEIGHT"],
+                    jpeg_quality=constants["INGEST_JPEG_QUALITY"],
+                ),
+            ],
+            wire_format=constants["INGEST_WIRE_FORMAT"],
+            frame_bus=constants["FRAME_BUS_ENABLED"],
+            frame_bus_slots=constants["FRAME_BUS_SLOTS"],
+            publish_amqp=not constants["FRAME_BUS_ENABLED"] or constants["FRAME_BUS_PUBLISH_AMQP"],
+            adaptive_rate=constants["INGEST_ADAPTIVE_RATE_ENABLED"],
+            min_publish_fps=constants["INGEST_MIN_PUBLISH_FPS"],
+            backpressure_latency_ms=constants["INGEST_BACKPRESSURE_LATENCY_MS"],
+            motion_gate=MotionGateConfig(
+                enabled=constants["INGEST_MOTION_GATE_ENABLED"],
+                width=constants["INGEST_MOTION_GATE_WIDTH"],
+                min_area_ratio=constants["INGEST_MOTION_GATE_MIN_AREA"],
+                keepalive_seconds=constants["INGEST_MOTION_GATE_KEEPALIVE_SECONDS"],
+                hold_seconds=constants["INGEST_MOTION_GATE_HOLD_SECONDS"],
+            ),
+            hibernation=HibernationConfig(
+                enabled=constants["INGEST_HIBERNATE_ENABLED"],
+                grace_seconds=constants["INGEST_HIBERNATE_GRACE_SECONDS"],
+                disconnect_seconds=constants["INGEST_HIBERNATE_DISCONNECT_SECONDS"],
+                check_interval_seconds=constants["INGEST_DEMAND_CHECK_INTERVAL_SECONDS"],
+            ),
+        )
 
-        with self._lock:
+    def start_camera(self, camera_id: int, user_id: int, rtsp_url: str, target_fps: Optional[float] = None,
+                     sub_stream_url: Optional[str] = None) -> None:
+        logger.debug("Request to START camera '%s' with RTSP='%s', sub-stream='%s', user_id=%s, target_fps=%s",
+                     camera_id, rtsp_url, sub_stream_url, user_id, target_fps)
 
-            if not rtsp_url.startswith("rtsp://"):
-                logger.warning("RTSP URL may be invalid: %s", rtsp_url)
-
-            if camera_id in self._workers and self._workers[camera_id].is_alive():
-                logger.warning("Camera '%s' is already running.", camera_id)
-                raise ValueError(f"Camera {camera_id} is already running")
-
-            cfg = CameraConfig(
-                user_id=user_id,
-                camera_id=camera_id,
-                rtsp_url=rtsp_url,
-                amqp_url=constants["AMQP_URL"],
-                exchange=constants["AMQP_EXCHANGE"],
-                jpeg_quality=constants["INGEST_JPEG_QUALITY"],
-                reconnect_delay_seconds=constants["INGEST_RECONNECT_DELAY_SECONDS"],
-                frame_width=constants["INGEST_VIDEO_WIDTH"],
-                frame_height=constants["INGEST_VIDEO_HEIGHT"]
-            )
+        for url in (rtsp_url, sub_stream_url):
+            if url and not url.startswith("rtsp://"):
+                logger.warning("RTSP URL may be invalid: %s", url)
+
+        cfg = self._build_config(camera_id=camera_id, user_id=user_id, rtsp_url=rtsp_url, target_fps=target_fps,
+                                 sub_stream_url=sub_stream_url)
+        logger.debug("CameraConfig generated: %s", cfg)
+        self.start_config(cfg)
 
-            logger.debug("CameraConfig generated: %s", cfg)
+    def start_config(self, cfg: CameraConfig) -> None:
+        if self._pool is not None:
+            self._pool.start_camera(cfg)
+            return
 
-            worker = CameraWorker(cfg)
+        self._join_stopping(cfg.camera_id)
+
+        with self._lock:
+
+            if cfg.camera_id in self._workers and self._workers[cfg.camera_id].is_alive():
+                logger.warning("Camera '%s' is already running.", cfg.camera_id)
+                raise ValueError(f"Camera {cfg.camera_id} is already running")
+
+            worker = CameraWorker(cfg, scheduler=self._reconnects)
             self._workers[cfg.camera_id] = worker
-            self._rtsp_urls[cfg.camera_id] = cfg.rtsp_url
+            self._configs[cfg.camera_id] = cfg
 
             logger.info("Starting CameraWorker thread for camera '%s'...", cfg.camera_id)
             worker.start()
@@ -53,6 +135,11 @@ class CameraManager:
     def stop_camera(self, camera_id: str) -> None:
         logger.debug("Request to STOP camera '%s'", camera_id)
 
+        if self._pool is not None:
+            self._pool.stop_camera(camera_id)
+            logger.info("Camera '%s' stopped successfully.", camera_id)
+            return
+
         with self._lock:
             worker = self._workers.get(camera_id)
 
@@ -65,31 +152,75 @@ class CameraManager:
 
             # Limpieza
             self._workers.pop(camera_id, None)
-            self._rtsp_urls.pop(camera_id, None)
+            self._configs.pop(camera_id, None)
+            self._stopping = {k: w for k, w in self._stopping.items() if w.is_alive()}
+            self._stopping[camera_id] = worker
 
             logger.info("Camera '%s' stopped successfully.", camera_id)
 
+    def _join_stopping(self, camera_id) -> None:
+        """Espera a que termine el worker anterior de la cámara antes de lanzar otro.
+
+        El worker viejo libera al salir el estado de reconexión y los rings del
+        frame bus de la cámara; si el nuevo ya arrancó, se los quitaría.
+        """
+        with self._lock:
+            worker = self._stopping.pop(camera_id, None)
+        if worker is None or not worker.is_alive():
+            return
+        worker.join(timeout=constants["INGEST_STOP_TIMEOUT_SECONDS"])
+        if worker.is_alive():
+            # El worker viejo solo libera lo que sigue siendo suyo, así que se arranca igual
+            logger.warning("Camera '%s': previous worker still running after %ss; starting anyway.",
+                           camera_id, constants["INGEST_STOP_TIMEOUT_SECONDS"])
+
     def status(self) -> dict:
+        if self._pool is not None:
+            status = self._pool.status()
+            logger.debug("CameraManager status requested: %s", status)
+            return status
+
         with self._lock:
             status = {
                 camera_id: {
                     "camera_id": camera_id,
                     "running": worker.is_alive(),
-                    "rtsp_url": self._rtsp_urls.get(camera_id, ""),
+                    "rtsp_url": self._configs[camera_id].rtsp_url if camera_id in self._configs else "",
+                    "sub_stream_url": self._configs[camera_id].sub_stream_url if camera_id in self._configs else None,
+                    "state": self._reconnects.state(f"{camera_id}/main")["state"] if worker.is_alive() else "stopped",
+                    "stats": worker.stats(),
                 }
                 for camera_id, worker in self._workers.items()
             }
 
         logger.debug("CameraManager status requested: %s", status)
         return status
+
+    def health(self) -> list:
+        if self._pool is not None:
+            return self._pool.health()
+        return []
     
     def restart_camera(self, camera_id: str) -> None:
+        if self._pool is not None:
+            cfg = self._pool.get_config(camera_id)
+        else:
+            with self._lock:
+                cfg = self._configs.get(camera_id)
+        if cfg is None:
+            raise KeyError(f"Camera {camera_id} not found")
+
         self.stop_camera(camera_id=camera_id)
-        self.start_camera(camera_id=camera_id)
+        self.start_config(cfg)
 
     def stop_all(self) -> None:
         logger.info("Request received to STOP ALL cameras.")
 
+        if self._pool is not None:
+            self._pool.stop_all()
+            logger.info("All cameras have been stopped successfully.")
+            return
+
         with self._lock:
             if not self._workers:
                 logger.info("No cameras running. Nothing to stop.")
@@ -105,9 +236,21 @@ class CameraManager:
                 worker = self._workers[camera_id]
                 logger.debug("Stopping worker for camera '%s'...", camera_id)
                 worker.stop()
+                self._stopping[camera_id] = worker
 
             # Limpieza global
             self._workers.clear()
-            self._rtsp_urls.clear()
+            self._configs.clear()
 
         logger.info("All %d cameras have been stopped successfully.", total)
+
+    def shutdown(self, join_timeout: float = 5.0) -> None:
+        with self._lock:
+            workers = list(self._workers.values()) + list(self._stopping.values())
+        self.stop_all()
+        if self._pool is not None:
+            self._pool.shutdown()
+        for worker in workers:
+            worker.join(timeout=join_timeout)
+        ConsumerDemandMonitor.close_all()
+        SharedAmqpConnection.close_all()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+import cv2
+import numpy as np
+from ..dto.ingest_dto import MotionGateConfig
+
+class MotionGate:
+    """Chequeo de movimiento barato antes del encode.
+
+    Trabaja sobre una versión reducida en gris del frame (ancho `config.width`)
+    con un fondo de media móvil. Los frames con movimiento se publican siempre;
+    tras el último movimiento se sigue publicando `hold_seconds` y, en escena
+    estática, solo un frame keep-alive cada `keepalive_seconds`.
+    """
+
+    def __init__(self, config: MotionGateConfig, threshold: int = 25, alpha: float = 0.1) -> None:
+        self.config = config
+        self.threshold = threshold
+        self.alpha = alpha
+        self.background = None
+        self.last_motion_ts: float = 0.0
+        self.last_published_ts: float = 0.0
+        self.last_score: float = 0.0
+        self.suppressed = 0
+
+    def motion_score(self, frame) -> float:
+        height, width = frame.shape[:2]
+        if width > self.config.width:
+            small = cv2.resize(frame, (self.config.width, max(1, height * self.config.width // width)), interpolation=cv2.INTER_NEAREST)
+        else:
+            small = frame
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype("float")
+            return 1.0
+
+        cv2.accumulateWeighted(gray, self.background, self.alpha)
+        diff = cv2.absdiff(cv2.convertScaleAbs(self.background), gray)
+        return float(np.count_nonzero(diff > self.threshold)) / diff.size
+
+    def should_publish(self, frame, now: float) -> bool:
+        """Decide si el frame pasa el gate. El keep-alive cuenta desde el último
+        frame realmente publicado: quien publica lo confirma con `mark_published`."""
+        self.last_score = self.motion_score(frame)
+        if self.last_score >= self.config.min_area_ratio:
+            self.last_motion_ts = now
+        elif now - self.last_motion_ts >= self.config.hold_seconds and now - self.last_published_ts < self.config.keepalive_seconds:
+            self.suppressed += 1
+            return False
+        return True
+
+    def mark_published(self, now: float) -> None:
+        self.last_published_ts = now
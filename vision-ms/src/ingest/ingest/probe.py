@@ -0,0 +1,39 @@
+from __future__ import annotations
+import logging
+import time
+import cv2
+from ..dto.ingest_dto import StreamProbeDTO
+
+logger = logging.getLogger(__name__)
+
+
+def probe_stream(url: str, timeout_ms: int) -> StreamProbeDTO:
+    """Abre el stream, lee un frame y lo cierra. Sirve para validar una URL antes de arrancar la cámara."""
+    started = time.monotonic()
+    source = int(url) if url.isdigit() else url
+    cap = None
+    try:
+        params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms]
+        cap = cv2.VideoCapture(source, cv2.CAP_ANY, params) if timeout_ms > 0 else cv2.VideoCapture(source)
+        if not cap.isOpened():
+            return StreamProbeDTO(url=url, ok=False, elapsed_ms=(time.monotonic() - started) * 1000, error="open failed")
+
+        ok, frame = cap.read()
+        if not ok or frame is None:
+            return StreamProbeDTO(url=url, ok=False, elapsed_ms=(time.monotonic() - started) * 1000, error="no frames")
+
+        height, width = frame.shape[:2]
+        return StreamProbeDTO(
+            url=url,
+            ok=True,
+            elapsed_ms=(time.monotonic() - started) * 1000,
+            fps=cap.get(cv2.CAP_PROP_FPS),
+            width=width,
+            height=height,
+        )
+    except Exception as ex:
+        logger.warning("Probe failed for %s: %s", url, ex)
+        return StreamProbeDTO(url=url, ok=False, elapsed_ms=(time.monotonic() - started) * 1000, error=str(ex))
+    finally:
+        if cap is not None:
+            cap.release()
@@ -0,0 +1,292 @@
+from __future__ import annotations
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from ..dto.ingest_dto import CameraConfig
+
+logger = logging.getLogger(__name__)
+
+# Errores que se re-lanzan en el proceso padre con el mismo tipo
+_ERROR_TYPES = {"ValueError": ValueError, "KeyError": KeyError}
+
+
+def _shard_main(shard_id: int, conn, max_concurrent_opens: int, open_slots) -> None:
+    """Entrada de cada proceso de ingest: un CameraManager en modo thread controlado por IPC."""
+    from .manager import CameraManager, INGEST_MODE_THREAD
+    from ...helpers.utils.logger import configure_logging
+
+    configure_logging()
+    manager = CameraManager(mode=INGEST_MODE_THREAD, max_concurrent_opens=max_concurrent_opens, open_slots=open_slots)
+    logger.info("Ingest shard %s started (pid=%s)", shard_id, os.getpid())
+    shutdown_id = None
+
+    while True:
+        try:
+            if not conn.poll(1.0):
+                continue
+            request = conn.recv()
+        except (EOFError, OSError):
+            # El padre murió o cerró el pipe
+            break
+
+        op = request.get("op")
+        reply: Dict[str, Any] = {"id": request.get("id"), "ok": True}
+        try:
+            if op == "start":
+                manager.start_config(request["config"])
+            elif op == "stop":
+                manager.stop_camera(request["camera_id"])
+            elif op == "status":
+                reply["data"] = manager.status()
+            elif op == "ping":
+                reply["data"] = {"pid": os.getpid(), "cameras": manager.status()}
+            elif op == "stop_all":
+                manager.stop_all()
+            elif op == "shutdown":
+                shutdown_id = request.get("id")
+                break
+            else:
+                raise ValueError(f"Unknown op {op}")
+        except Exception as ex:
+            reply.update(ok=False, error=str(ex), type=type(ex).__name__)
+
+        try:
+            conn.send(reply)
+        except (EOFError, OSError):
+            break
+
+    manager.shutdown()
+    if shutdown_id is not None:
+        try:
+            conn.send({"id": shutdown_id, "ok": True})
+        except (EOFError, OSError):
+            pass
+    logger.info("Ingest shard %s stopped (pid=%s)", shard_id, os.getpid())
+
+
+class _Shard:
+
+    def __init__(self, shard_id: int) -> None:
+        self.shard_id = shard_id
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn = None
+        self.lock = threading.Lock()
+        self.configs: Dict[int, CameraConfig] = {}
+        self.last_heartbeat: Optional[float] = None
+        self.missed_heartbeats = 0
+        self.respawns = 0
+        self.cameras: Dict[Any, dict] = {}
+
+
+class IngestProcessPool:
+    """Reparte las cámaras entre N procesos de ingest para no competir por el GIL
+    con FastAPI y los consumers.
+
+    Cada proceso hospeda un CameraManager en modo thread y se controla por un
+    Pipe (start/stop/status/stop_all). Un thread monitor hace ping periódico a
+    cada proceso y, si muere o deja de responder, lo vuelve a lanzar y
+    re-arranca las cámaras que tenía asignadas.
+    """
+
+    def __init__(self, size: int, health_interval_seconds: float, request_timeout_seconds: float, max_missed_heartbeats: int = 3,
+                 max_concurrent_opens: int = 4) -> None:
+        self._ctx = multiprocessing.get_context("spawn")
+        # Límite global de aperturas RTSP: un semáforo entre procesos compartido por todos los shards
+        self._max_concurrent_opens = max(1, max_concurrent_opens)
+        self._open_slots = self._ctx.Semaphore(self._max_concurrent_opens)
+        self._health_interval = health_interval_seconds
+        self._request_timeout = request_timeout_seconds
+        self._max_missed = max_missed_heartbeats
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._shards: List[_Shard] = [_Shard(i) for i in range(max(1, size))]
+        self._stop_event = threading.Event()
+
+        for shard in self._shards:
+            self._spawn(shard)
+
+        self._monitor = threading.Thread(target=self._monitor_loop, name="ingest-pool-monitor", daemon=True)
+        self._monitor.start()
+        logger.info("IngestProcessPool started with %d processes", len(self._shards))
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def start_camera(self, config: CameraConfig) -> None:
+        with self._lock:
+            if self._shard_of(config.camera_id) is not None:
+                raise ValueError(f"Camera {config.camera_id} is already running")
+            shard = min(self._shards, key=lambda s: len(s.configs))
+            shard.configs[config.camera_id] = config
+
+        try:
+            self._request(shard, {"op": "start", "config": config})
+        except Exception:
+            with self._lock:
+                shard.configs.pop(config.camera_id, None)
+            raise
+        logger.info("Camera '%s' assigned to ingest process %s", config.camera_id, shard.shard_id)
+
+    def stop_camera(self, camera_id) -> None:
+        with self._lock:
+            shard = self._shard_of(camera_id)
+            if shard is None:
+                raise KeyError(f"Camera {camera_id} not found")
+            shard.configs.pop(camera_id, None)
+        self._request(shard, {"op": "stop", "camera_id": camera_id})
+
+    def get_config(self, camera_id) -> Optional[CameraConfig]:
+        with self._lock:
+            shard = self._shard_of(camera_id)
+            return shard.configs.get(camera_id) if shard else None
+
+    def status(self) -> dict:
+        out = {}
+        for shard in self._shards:
+            try:
+                cameras = self._request(shard, {"op": "status"})
+            except Exception as ex:
+                logger.warning("Ingest process %s did not answer status: %s", shard.shard_id, ex)
+                cameras = {camera_id: {"camera_id": camera_id, "running": False} for camera_id in shard.configs}
+            for camera_id, camera_status in cameras.items():
+                camera_status["process"] = shard.shard_id
+                out[camera_id] = camera_status
+        return out
+
+    def health(self) -> list:
+        return [
+            {
+                "process": shard.shard_id,
+                "pid": shard.process.pid if shard.process else None,
+                "alive": bool(shard.process and shard.process.is_alive()),
+                "cameras": len(shard.configs),
+                "running": sum(1 for c in shard.cameras.values() if c.get("running")),
+                "last_heartbeat": shard.last_heartbeat,
+                "missed_heartbeats": shard.missed_heartbeats,
+                "respawns": shard.respawns,
+            }
+            for shard in self._shards
+        ]
+
+    def stop_all(self) -> None:
+        with self._lock:
+            for shard in self._shards:
+                shard.configs.clear()
+        for shard in self._shards:
+            try:
+                self._request(shard, {"op": "stop_all"})
+            except Exception as ex:
+                logger.warning("Ingest process %s did not answer stop_all: %s", shard.shard_id, ex)
+
+    def shutdown(self) -> None:
+        self._stop_event.set()
+        for shard in self._shards:
+            try:
+                self._request(shard, {"op": "shutdown"})
+            except Exception:
+                pass
+            if shard.process is not None:
+                shard.process.join(timeout=self._request_timeout)
+                if shard.process.is_alive():
+                    shard.process.terminate()
+        logger.info("IngestProcessPool shut down")
+
+    # ------------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------------
+    def _shard_of(self, camera_id) -> Optional[_Shard]:
+        for shard in self._shards:
+            if camera_id in shard.configs:
+                return shard
+        return None
+
+    def _spawn(self, shard: _Shard) -> None:
+        parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+        process = self._ctx.Process(
+            target=_shard_main,
+            args=(shard.shard_id, child_conn, self._max_concurrent_opens, self._open_slots),
+            name=f"ingest-shard-{shard.shard_id}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        shard.process = process
+        shard.conn = parent_conn
+        shard.missed_heartbeats = 0
+        shard.last_heartbeat = time.time()
+        logger.info("Ingest process %s spawned (pid=%s)", shard.shard_id, process.pid)
+
+    def _request(self, shard: _Shard, request: Dict[str, Any]):
+        request_id = next(self._ids)
+        request["id"] = request_id
+        with shard.lock:
+            shard.conn.send(request)
+            deadline = time.time() + self._request_timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not shard.conn.poll(remaining):
+                    raise TimeoutError(f"Ingest process {shard.shard_id} did not answer '{request['op']}'")
+                reply = shard.conn.recv()
+                # Respuestas tardías de requests que ya expiraron
+                if reply.get("id") == request_id:
+                    break
+
+        if not reply.get("ok"):
+            error_type = _ERROR_TYPES.get(reply.get("type"), RuntimeError)
+            raise error_type(reply.get("error"))
+        return reply.get("data")
+
+    def _respawn(self, shard: _Shard) -> None:
+        logger.error("Ingest process %s unhealthy (alive=%s, missed=%s). Respawning...",
+                     shard.shard_id, shard.process.is_alive() if shard.process else False, shard.missed_heartbeats)
+        # Un proceso matado en medio de una apertura RTSP no devuelve su cupo del semáforo global
+        with shard.lock:
+            try:
+                if shard.process is not None and shard.process.is_alive():
+                    shard.process.terminate()
+                    shard.process.join(timeout=self._request_timeout)
+                    if shard.process.is_alive():
+                        shard.process.kill()
+                        shard.process.join(timeout=self._request_timeout)
+                shard.conn.close()
+            except Exception as ex:
+                logger.warning("Error terminating ingest process %s: %s", shard.shard_id, ex)
+            # El proceso nuevo recrea los rings del frame bus con los mismos nombres:
+            # se lanza recién cuando el anterior terminó para que no se pisen
+            if shard.process is not None and shard.process.is_alive():
+                logger.error("Ingest process %s (pid=%s) did not exit; respawning anyway",
+                             shard.shard_id, shard.process.pid)
+            self._spawn(shard)
+        shard.respawns += 1
+
+        with self._lock:
+            configs = list(shard.configs.values())
+        for config in configs:
+            try:
+                self._request(shard, {"op": "start", "config": config})
+                logger.info("Camera '%s' restarted on ingest process %s", config.camera_id, shard.shard_id)
+            except Exception as ex:
+                logger.error("Error restarting camera '%s' on ingest process %s: %s", config.camera_id, shard.shard_id, ex)
+
+    def _monitor_loop(self) -> None:
+        while not self._stop_event.wait(self._health_interval):
+            for shard in self._shards:
+                if self._stop_event.is_set():
+                    return
+                if shard.process is None or not shard.process.is_alive():
+                    self._respawn(shard)
+                    continue
+                try:
+                    data = self._request(shard, {"op": "ping"})
+                    shard.last_heartbeat = time.time()
+                    shard.missed_heartbeats = 0
+                    shard.cameras = data.get("cameras", {})
+                except Exception as ex:
+                    shard.missed_heartbeats += 1
+                    logger.warning("Ingest process %s missed heartbeat (%s): %s", shard.shard_id, shard.missed_heartbeats, ex)
+                    if shard.missed_heartbeats >= self._max_missed:
+                        self._respawn(shard)
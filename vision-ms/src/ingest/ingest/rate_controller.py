@@ -0,0 +1,64 @@
+from __future__ import annotations
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveRateController:
+    """Control AIMD de la tasa de publicación de una cámara.
+
+    Con presión del broker (conexión `blocked`, ventana de confirms casi llena
+    o confirms lentos) la tasa se reduce a la mitad, como máximo una vez por
+    `adjust_interval`; sin presión sube `step_fps` por intervalo hasta la tasa
+    de la fuente. `allow()` decide si el frame actual se publica.
+    """
+
+    def __init__(self, min_fps: float, latency_threshold_ms: float, window_ratio_threshold: float = 0.75,
+                 step_fps: float = 1.0, adjust_interval: float = 1.0) -> None:
+        self.min_fps = max(0.1, min_fps)
+        self.latency_threshold_ms = latency_threshold_ms
+        self.window_ratio_threshold = window_ratio_threshold
+        self.step_fps = step_fps
+        self.adjust_interval = adjust_interval
+        self.max_fps = 0.0
+        self.current_fps = 0.0
+        self.throttled = 0
+        self._last_adjust = 0.0
+        self._next_allowed = 0.0
+
+    def set_source_fps(self, fps: float) -> None:
+        fps = float(fps or 0) or 30.0
+        if fps != self.max_fps:
+            self.max_fps = fps
+            self.current_fps = fps
+
+    def update(self, blocked: bool, in_flight_ratio: float, confirm_latency_ms: float) -> None:
+        now = time.monotonic()
+        if now - self._last_adjust < self.adjust_interval:
+            return
+        self._last_adjust = now
+
+        pressure = (
+            blocked
+            or in_flight_ratio >= self.window_ratio_threshold
+            or (self.latency_threshold_ms > 0 and confirm_latency_ms > self.latency_threshold_ms)
+        )
+        previous = self.current_fps
+        if pressure:
+            self.current_fps = max(self.min_fps, self.current_fps / 2)
+        else:
+            self.current_fps = min(self.max_fps, self.current_fps + self.step_fps)
+
+        if self.current_fps != previous:
+            logger.info("Publish rate %s -> %.1f fps (blocked=%s, inFlight=%.0f%%, confirmLatency=%.0fms)",
+                        "decreased" if pressure else "increased", self.current_fps, blocked, in_flight_ratio * 100, confirm_latency_ms)
+
+    def allow(self) -> bool:
+        if self.current_fps >= self.max_fps:
+            return True
+        now = time.monotonic()
+        if now < self._next_allowed:
+            self.throttled += 1
+            return False
+        self._next_allowed = now + 1.0 / self.current_fps
+        return True
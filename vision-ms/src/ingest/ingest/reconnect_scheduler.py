@@ -0,0 +1,134 @@
+from __future__ import annotations
+import logging
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_CONNECTING = "connecting"
+STATE_STREAMING = "streaming"
+STATE_BACKOFF = "backoff"
+STATE_WAITING = "waiting"
+STATE_HIBERNATING = "hibernating"
+
+
+@dataclass
+class _StreamState:
+    state: str = STATE_WAITING
+    attempts: int = 0
+    next_attempt_at: float = 0.0
+    last_error: Optional[str] = None
+    # CaptureStream dueño de la clave: al reiniciar una cámara el stream viejo
+    # puede terminar después de que el nuevo ya se registró
+    owner: object = None
+
+
+class ReconnectScheduler:
+    """Coordina las aperturas RTSP de todas las cámaras de un CameraManager.
+
+    Abrir un cv2.VideoCapture es lento y bloqueante; si un NVR se reinicia,
+    todas sus cámaras reintentan a la vez. El scheduler limita las aperturas
+    concurrentes con un semáforo global y, ante cada fallo, calcula una espera
+    con backoff exponencial y jitter para que los reintentos se escalonen.
+    Los intentos se reinician cuando el stream entrega su primer frame.
+
+    `open_slots` permite compartir el semáforo entre procesos (modo process:
+    uno de multiprocessing creado por el IngestProcessPool), así el límite de
+    aperturas es global y no por proceso.
+    """
+
+    def __init__(self, max_concurrent_opens: int, base_delay_seconds: float, max_delay_seconds: float,
+                 jitter_ratio: float = 0.5, open_slots=None) -> None:
+        self.max_concurrent_opens = max(1, max_concurrent_opens)
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max(base_delay_seconds, max_delay_seconds)
+        self.jitter_ratio = min(max(jitter_ratio, 0.0), 1.0)
+        # Exponente a partir del cual base * 2**n ya alcanza el máximo: los intentos crecen sin
+        # límite en una caída larga y 2.0 ** 1024 desborda el float
+        self._max_exponent = (
+            max(0, math.ceil(math.log2(self.max_delay_seconds / base_delay_seconds)))
+            if base_delay_seconds > 0 else 0
+        )
+        self._open_slots = open_slots if open_slots is not None else threading.BoundedSemaphore(self.max_concurrent_opens)
+        self._lock = threading.Lock()
+        self._streams: Dict[str, _StreamState] = {}
+
+    def _stream(self, key: str) -> _StreamState:
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = self._streams[key] = _StreamState()
+        return stream
+
+    def claim(self, key: str, owner: object) -> None:
+        """Registra `owner` como dueño de `key` con el estado reiniciado."""
+        with self._lock:
+            self._streams[key] = _StreamState(owner=owner)
+
+    def acquire_open(self, key: str, stop_event: threading.Event) -> bool:
+        """Bloquea hasta tener un cupo de apertura. Devuelve False si se pidió parar."""
+        with self._lock:
+            self._stream(key).state = STATE_WAITING
+        while not stop_event.is_set():
+            if self._open_slots.acquire(timeout=0.5):
+                with self._lock:
+                    self._stream(key).state = STATE_CONNECTING
+                return True
+        return False
+
+    def release_open(self, key: str, opened: bool) -> None:
+        self._open_slots.release()
+        if opened:
+            with self._lock:
+                self._stream(key).state = STATE_STREAMING
+
+    def mark_streaming(self, key: str) -> None:
+        """Primer frame tras abrir: el stream está sano y el backoff vuelve a empezar."""
+        with self._lock:
+            stream = self._stream(key)
+            stream.state = STATE_STREAMING
+            stream.attempts = 0
+            stream.last_error = None
+
+    def mark_hibernating(self, key: str) -> None:
+        """Stream cerrado a propósito por falta de consumers; no cuenta como fallo."""
+        with self._lock:
+            stream = self._stream(key)
+            stream.state = STATE_HIBERNATING
+            stream.attempts = 0
+
+    def mark_failed(self, key: str, error: str) -> float:
+        """Registra un fallo (apertura o lectura) y devuelve cuánto esperar antes de reintentar."""
+        with self._lock:
+            stream = self._stream(key)
+            stream.attempts += 1
+            exponent = min(stream.attempts - 1, self._max_exponent)
+            delay = min(self.max_delay_seconds, self.base_delay_seconds * (2 ** exponent))
+            # Jitter hacia abajo: nunca supera el máximo y dispersa cámaras que fallaron juntas
+            delay *= 1.0 - self.jitter_ratio * random.random()
+            stream.state = STATE_BACKOFF
+            stream.next_attempt_at = time.time() + delay
+            stream.last_error = error
+            logger.debug("Reconnect %s: attempt %d failed (%s); retrying in %.1fs", key, stream.attempts, error, delay)
+            return delay
+
+    def state(self, key: str) -> dict:
+        with self._lock:
+            stream = self._streams.get(key) or _StreamState()
+            return {
+                "state": stream.state,
+                "attempts": stream.attempts,
+                "retry_in_seconds": round(max(0.0, stream.next_attempt_at - time.time()), 1)
+                if stream.state == STATE_BACKOFF else 0.0,
+                "last_error": stream.last_error,
+            }
+
+    def remove(self, key: str, owner: object = None) -> None:
+        """Borra el estado de `key`; con `owner`, solo si la clave sigue siendo suya."""
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is not None and (owner is None or stream.owner is owner):
+                del self._streams[key]
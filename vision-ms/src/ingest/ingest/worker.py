@@ -1,23 +1,121 @@
 from __future__ import annotations
-import base64
 import logging
 import threading
 import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 import cv2
-import numpy as np
+from .capture import CaptureStream, HIBERNATE_OFF, HIBERNATE_GRAB_ONLY, HIBERNATE_DISCONNECTED
+from .frame_slot import CapturedFrame, LatestFrameSlot
+from .reconnect_scheduler import ReconnectScheduler
+from .rate_controller import AdaptiveRateController
+from .motion_gate import MotionGate
 from ..publishers.publisher import RabbitPublisher
-from ..dto.ingest_dto import CameraConfig
-from ...helpers.constants.constants import constants
+from ..publishers.demand_monitor import ConsumerDemandMonitor
+from ..dto.ingest_dto import CameraConfig, RenditionConfig
+from ...helpers.dto.frame_dto import FrameMessageDTO
+from ...helpers.utils.frame_codec import encode_frame, frame_routing_key, frame_queue_name, RENDITION_ANALYTICS
+from ...helpers.utils.frame_bus import FrameBusWriter, frame_bus_name
 
 logger = logging.getLogger(__name__)
 
+SOURCE_MAIN = "main"
+SOURCE_SUB = "sub"
+
+@dataclass
+class _Source:
+    """Un stream de la cámara (principal o sub-stream) y las renditions que alimenta."""
+    name: str
+    capture: CaptureStream
+    slot: LatestFrameSlot
+    renditions: List[RenditionConfig]
+    rate: AdaptiveRateController
+    motion_gate: Optional[MotionGate] = None
+    frames_published: int = 0
+    # Desde cuándo ninguna de sus renditions tiene consumers (None = hay demanda)
+    idle_since: Optional[float] = None
+
+
 class CameraWorker(threading.Thread):
+    """Etapa de encode/publish de una cámara.
+
+    La captura corre en su propio thread (CaptureStream) y deja solo el último
+    frame en un LatestFrameSlot; este thread siempre toma el más reciente, de
+    modo que la latencia glass-to-broker queda acotada aunque el broker o el
+    encoder se atrasen. Los frames sobrescritos se cuentan como descartados.
+
+    Si la cámara tiene sub-stream, se abren dos capturas con reconexión
+    independiente: el sub-stream (baja resolución nativa) alimenta la
+    rendition de analítica y el stream principal solo la de archivo.
+
+    Con frame bus habilitado cada rendition se escribe además (o solo, si
+    publish_amqp es False) como BGR crudo en un ring de memoria compartida
+    para los consumers del mismo host, sin pasar por JPEG ni RabbitMQ.
+
+    Con hibernación habilitada solo se codifican y publican las renditions que
+    tienen consumers (cola con consumers en RabbitMQ o lector vivo en el frame
+    bus). Si ningún consumer lee un stream durante `grace_seconds` la captura
+    pasa a grab-only, y tras `disconnect_seconds` se cierra; vuelve sola en
+    cuanto aparece un consumer.
+    """
 
-    def __init__(self, config: CameraConfig) -> None:
+    def __init__(self, config: CameraConfig, scheduler: Optional[ReconnectScheduler] = None) -> None:
         super().__init__(daemon=True)
         self.config = config
+        self._scheduler = scheduler
         self._stop_event = threading.Event()
-        self._publisher = RabbitPublisher(config.amqp_url, config.exchange)
+        self._frames_ready = threading.Condition()
+        self._publisher = RabbitPublisher(config.amqp_url, config.exchange, channel_key=config.camera_id)
+        self._bus_writers: Dict[str, FrameBusWriter] = {}
+        self._sources: List[_Source] = []
+
+        if config.sub_stream_url:
+            analytics = [r for r in config.renditions if r.name == RENDITION_ANALYTICS]
+            others = [r for r in config.renditions if r.name != RENDITION_ANALYTICS]
+            self._sources.append(self._build_source(SOURCE_MAIN, config.rtsp_url, others, target_fps=0.0))
+            self._sources.append(self._build_source(SOURCE_SUB, config.sub_stream_url, analytics, target_fps=config.target_fps))
+        else:
+            self._sources.append(self._build_source(SOURCE_MAIN, config.rtsp_url, list(config.renditions), target_fps=config.target_fps))
+
+        # Demanda de consumers por rendition; sin hibernación siempre hay demanda
+        hibernation = config.hibernation
+        self._demand_monitor: Optional[ConsumerDemandMonitor] = None
+        if hibernation.enabled and config.publish_amqp:
+            self._demand_monitor = ConsumerDemandMonitor.get(config.amqp_url, hibernation.check_interval_seconds)
+        self._queues = {r.name: frame_queue_name(config.camera_id, r.name) for r in config.renditions}
+        self._demand: Dict[str, bool] = {r.name: True for r in config.renditions}
+        self._next_demand_check = 0.0
+
+        # Métricas de publicación
+        self.publish_errors = 0
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    def _build_source(self, name: str, url: str, renditions: List[RenditionConfig], target_fps: float) -> _Source:
+        slot = LatestFrameSlot(self._frames_ready)
+        capture = CaptureStream(
+            camera_id=self.config.camera_id,
+            rtsp_url=url,
+            reconnect_delay_seconds=self.config.reconnect_delay_seconds,
+            slot=slot,
+            stop_event=self._stop_event,
+            target_fps=target_fps,
+            stream_name=name,
+            scheduler=self._scheduler,
+            open_timeout_ms=self.config.open_timeout_ms,
+            read_timeout_ms=self.config.read_timeout_ms,
+        )
+        return _Source(
+            name=name,
+            capture=capture,
+            slot=slot,
+            renditions=renditions,
+            rate=AdaptiveRateController(
+                min_fps=self.config.min_publish_fps,
+                latency_threshold_ms=self.config.backpressure_latency_ms,
+            ),
+            motion_gate=MotionGate(self.config.motion_gate) if self.config.motion_gate.enabled else None,
+        )
 
     def stop(self) -> None:
         logger.info("Stopping CameraWorker for camera %s", self.config.camera_id)
@@ -25,71 +123,75 @@ class CameraWorker(threading.Thread):
 
     def is_stopped(self) -> bool:
         return self._stop_event.is_set()
-    
-    def is_int(self, value: str) -> bool:
-        try:
-            int(value)
-            return True
-        except ValueError:
-            return False
+
+    def stats(self) -> dict:
+        return {
+            "streams": {
+                source.name: {
+                    **source.capture.stats(),
+                    "frames_dropped": source.slot.dropped,
+                    "frames_published": source.frames_published,
+                    "frames_throttled": source.rate.throttled,
+                    "frames_motion_suppressed": source.motion_gate.suppressed if source.motion_gate else 0,
+                    "publish_fps": round(source.rate.current_fps, 1),
+                    "renditions": [r.name for r in source.renditions],
+                }
+                for source in self._sources
+            },
+            "demand": dict(self._demand),
+            "publish_errors": self.publish_errors,
+            "publisher": self._publisher.stats(),
+            "last_latency_ms": round(self.last_latency_ms, 1),
+            "max_latency_ms": round(self.max_latency_ms, 1),
+        }
+
+    def _take_frames(self, timeout: float) -> List[Tuple[_Source, CapturedFrame]]:
+        with self._frames_ready:
+            ready = [(source, source.slot.take_nowait()) for source in self._sources]
+            ready = [(source, item) for source, item in ready if item is not None]
+            if ready:
+                return ready
+            self._frames_ready.wait(timeout)
+            ready = [(source, source.slot.take_nowait()) for source in self._sources]
+            return [(source, item) for source, item in ready if item is not None]
 
     def run(self) -> None:
         camera_id = self.config.camera_id
-        routing_key = f"camera.{camera_id}"
-        cap = None
-        
-        logger.info("CameraWorker thread STARTED for camera %s (exchange=%s, routingKey=%s)", camera_id, self.config.exchange, routing_key)
-        while not self._stop_event.is_set():
-            try:
-                if cap is None or not cap.isOpened():
-                    logger.info("Camera %s: No active capture. Trying to open stream: %s", camera_id, self.config.rtsp_url)
-                    
-                    cap = self._open_capture()
-                    if cap is None:
-                        logger.warning("Camera %s: Failed to open stream. Retrying in %s seconds...", camera_id, self.config.reconnect_delay_seconds)
-                        time.sleep(self.config.reconnect_delay_seconds)
-                        continue
-
-                    fps, width, height = self._read_video_properties(cap)
-                    logger.info("Camera %s: Stream opened (fps=%s, resolution=%sx%s)", camera_id, fps, width, height)
-                    first_frame_sent = False
-
-                ok, frame = cap.read()
-                if not ok or frame is None:
-                    logger.warning("Camera %s: Frame read failed. Releasing and reconnecting.", camera_id)
-                    cap.release()
-                    cap = None
-                    time.sleep(self.config.reconnect_delay_seconds)
-                    continue
-
-                frame_b64, frame = self.resize_compress_and_decode(frame, width, height)
-                if not frame_b64:
-                    continue
-
-                payload = self._build_payload(
-                    camera_id=camera_id,
-                    timestamp=time.time(),
-                    frame_b64=frame_b64,
-                    fps=fps,
-                    width=width,
-                    height=height,
-                )
+        routing_keys = {r.name: frame_routing_key(camera_id, r.name) for r in self.config.renditions}
+        first_frame_sent = False
 
-                self._publisher.publish(routing_key, payload)
-                if not first_frame_sent:
-                    first_frame_sent = True
-                    logger.info("Camera %s: First frame published (payloadSize=%d bytes)", camera_id, len(frame_b64))
+        logger.info("CameraWorker thread STARTED for camera %s (exchange=%s, routingKeys=%s, streams=%s)",
+                    camera_id, self.config.exchange, list(routing_keys.values()), [s.name for s in self._sources])
+        self._open_frame_bus()
+        if self._demand_monitor is not None:
+            for queue in self._queues.values():
+                self._demand_monitor.watch(queue)
+        for source in self._sources:
+            source.capture.start()
 
-            except Exception as ex:
-                logger.exception("Camera %s: Unexpected worker error: %s", camera_id, ex)
-                if cap is not None:
-                    cap.release()
-                    cap = None
-                time.sleep(self.config.reconnect_delay_seconds)
+        while not self._stop_event.is_set():
+            if self.config.hibernation.enabled:
+                self._refresh_demand(time.time())
+            for source, item in self._take_frames(timeout=1.0):
+                try:
+                    published = self._publish_frame(source, item, routing_keys, log_first=not first_frame_sent)
+                    first_frame_sent = first_frame_sent or published
+
+                except Exception as ex:
+                    self.publish_errors += 1
+                    logger.exception("Camera %s: Unexpected worker error: %s", camera_id, ex)
+                    self._stop_event.wait(self.config.reconnect_delay_seconds)
+                    # Lo que se capturó durante la espera ya es viejo
+                    for s in self._sources:
+                        s.slot.clear()
+                    break
 
-        if cap is not None:
-            cap.release()
-            logger.debug("Camera %s: VideoCapture released on shutdown.", camera_id)
+        for source in self._sources:
+            source.capture.join(timeout=self.config.reconnect_delay_seconds + 1)
+        if self._demand_monitor is not None:
+            for queue in self._queues.values():
+                self._demand_monitor.unwatch(queue)
+        self._close_frame_bus()
 
         try:
             self._publisher.close()
@@ -98,58 +200,154 @@ class CameraWorker(threading.Thread):
 
         logger.info("CameraWorker for camera %s STOPPED", camera_id)
 
-    def _open_capture(self):
-        logger.info("Opening RTSP for camera %s: %s", self.config.camera_id, self.config.rtsp_url)
-        rtsp_url = int(self.config.rtsp_url) if self.is_int(self.config.rtsp_url) else self.config.rtsp_url
-        cap = cv2.VideoCapture(rtsp_url)
-        if not cap.isOpened():
-            logger.error("Failed to open RTSP stream for camera %s", self.config.camera_id)
-            return None
-        return cap
-    
-    def _read_video_properties(self, cap):
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    def _publish_frame(self, source: _Source, item: CapturedFrame, routing_keys: Dict[str, str], log_first: bool) -> bool:
+        camera_id = self.config.camera_id
+        fps = source.capture.effective_fps
+        if source.motion_gate is not None and not source.motion_gate.should_publish(item.frame, item.timestamp):
+            return False
 
-        if width == 0 or height == 0:
-            ok, frame = cap.read()
-            if ok and frame is not None:
-                height, width = frame.shape[:2]
+        if self.config.adaptive_rate and self.config.publish_amqp:
+            source.rate.set_source_fps(fps)
+            source.rate.update(*self._publisher.backpressure())
+            if not source.rate.allow():
+                return False
 
-        return fps, width, height
+        renditions = [r for r in source.renditions if self._demand[r.name]]
+        if not renditions:
+            return False
 
+        for rendition, resized, width, height in self.resize_renditions(item.frame, renditions):
+            writer = self._bus_writers.get(rendition.name)
+            if writer is not None:
+                writer.write(resized, item.timestamp, fps, camera_id=camera_id, user_id=self.config.user_id)
+
+            if not self.config.publish_amqp:
+                continue
+
+            jpeg = self.encode(rendition, resized)
+            message = self._build_message(
+                camera_id=camera_id,
+                timestamp=item.timestamp,
+                jpeg=jpeg,
+                fps=fps,
+                width=width,
+                height=height,
+            )
+            body, content_type = encode_frame(message, self.config.wire_format)
+            self._publisher.publish_raw(routing_keys[rendition.name], body, content_type=content_type)
+
+            if log_first:
+                logger.info("Camera %s: First frame published (stream=%s, rendition=%s, %sx%s, payloadSize=%d bytes, format=%s)",
+                            camera_id, source.name, rendition.name, width, height, len(body), self.config.wire_format)
+
+        if source.motion_gate is not None:
+            source.motion_gate.mark_published(item.timestamp)
+        source.frames_published += 1
+        self.last_latency_ms = (time.time() - item.timestamp) * 1000
+        self.max_latency_ms = max(self.max_latency_ms, self.last_latency_ms)
+        return True
+
+    def _build_message(self, camera_id, timestamp, jpeg, fps, width, height) -> FrameMessageDTO:
+        return FrameMessageDTO(
+            camera_id=camera_id,
+            user_id=self.config.user_id,
+            timestamp=timestamp,
+            frame=jpeg,
+            fps=fps,
+            width=width,
+            height=height
+        )
     
-    def _build_payload(self, camera_id, timestamp, frame_b64, fps, width, height):
-        return {
-            "camera_id": camera_id,
-            "user_id": self.config.user_id,
-            "timestamp": timestamp,
-            "frame": frame_b64,
-            "fps": fps,
-            "width": width,
-            "height": height
-        }
-    
-    def jpeg_to_frame(self, jpeg_bytes: bytes):
-        np_buffer = np.frombuffer(jpeg_bytes, dtype=np.uint8)
-        frame = cv2.imdecode(np_buffer, cv2.IMREAD_COLOR)
-        return frame
-    
-    def resize_compress_and_decode(self, frame, width, height):
-        if width > self.config.frame_width:
-            width = self.config.frame_width
-        if height > self.config.frame_height:
-            height = self.config.frame_height
-            
-        resized = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
-        ok, encoded = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, self.config.jpeg_quality])
-        if not ok:
-            raise RuntimeError("Error al comprimir")
-        jpeg_bytes = encoded.tobytes()
-        frame_decoded = self.jpeg_to_frame(jpeg_bytes)
-        jpeg_bytes = base64.b64encode(jpeg_bytes).decode("utf-8")
-        return jpeg_bytes, frame_decoded
+    def _has_demand(self, rendition: str) -> bool:
+        writer = self._bus_writers.get(rendition)
+        if writer is not None and writer.has_readers(max_age_seconds=max(2.0, self.config.hibernation.check_interval_seconds)):
+            return True
+        if not self.config.publish_amqp:
+            return False
+        if self._demand_monitor is None:
+            return True
+        consumers = self._demand_monitor.consumers(self._queues[rendition])
+        # Conteo desconocido (aún no consultado o broker caído): se sigue publicando
+        return consumers is None or consumers > 0
+
+    def _refresh_demand(self, now: float) -> None:
+        if now < self._next_demand_check:
+            return
+        self._next_demand_check = now + 1.0
+        hibernation = self.config.hibernation
+
+        for name in self._demand:
+            self._demand[name] = self._has_demand(name)
+
+        for source in self._sources:
+            if any(self._demand[r.name] for r in source.renditions):
+                source.idle_since = None
+                mode = HIBERNATE_OFF
+            else:
+                source.idle_since = source.idle_since or now
+                idle = now - source.idle_since
+                if hibernation.disconnect_seconds > 0 and idle >= hibernation.disconnect_seconds:
+                    mode = HIBERNATE_DISCONNECTED
+                elif idle >= hibernation.grace_seconds:
+                    mode = HIBERNATE_GRAB_ONLY
+                else:
+                    mode = HIBERNATE_OFF
 
+            if source.capture.hibernation != mode:
+                logger.info("Camera %s: stream '%s' hibernation %s -> %s",
+                            self.config.camera_id, source.name, source.capture.hibernation, mode)
+                source.capture.hibernation = mode
 
+    def _open_frame_bus(self) -> None:
+        if not self.config.frame_bus:
+            return
+        for rendition in self.config.renditions:
+            name = frame_bus_name(self.config.camera_id, rendition.name)
+            try:
+                self._bus_writers[rendition.name] = FrameBusWriter(
+                    name=name,
+                    slots=self.config.frame_bus_slots,
+                    max_width=rendition.width,
+                    max_height=rendition.height,
+                )
+            except Exception as ex:
+                logger.error("Camera %s: Error creating frame bus ring '%s': %s", self.config.camera_id, name, ex)
 
+    def _close_frame_bus(self) -> None:
+        for writer in self._bus_writers.values():
+            writer.close()
+        self._bus_writers.clear()
+
+    def _target_size(self, rendition: RenditionConfig, width: int, height: int) -> Tuple[int, int]:
+        if width > rendition.width:
+            width = rendition.width
+        if height > rendition.height:
+            height = rendition.height
+        return width, height
+
+    def resize_renditions(self, frame, renditions: List[RenditionConfig]) -> List[Tuple[RenditionConfig, object, int, int]]:
+        """Resize de cada rendition; las que tienen el mismo tamaño comparten el resize.
+
+        Devuelve una lista de (rendition, frame_bgr, width, height).
+        """
+        src_height, src_width = frame.shape[:2]
+        resized_cache: Dict[Tuple[int, int], object] = {}
+        out = []
+        for rendition in renditions:
+            size = self._target_size(rendition, src_width, src_height)
+            resized = resized_cache.get(size)
+            if resized is None:
+                if size == (src_width, src_height):
+                    resized = frame
+                else:
+                    resized = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                resized_cache[size] = resized
+            out.append((rendition, resized, size[0], size[1]))
+        return out
+
+    def encode(self, rendition: RenditionConfig, frame):
+        """JPEG encode (sin volver a decodificar); devuelve el buffer de cv2.imencode."""
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, rendition.jpeg_quality])
+        if not ok:
+            raise RuntimeError("Error al comprimir")
+        return encoded
@@ -0,0 +1,339 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+import pika
+from pika.spec import Basic
+
+logger = logging.getLogger(__name__)
+
+# pipelined = confirms asíncronos con ventana acotada de mensajes sin confirmar por canal
+# none = fire-and-forget (sin confirm_delivery), suficiente para frames transitorios
+CONFIRM_MODE_PIPELINED = "pipelined"
+CONFIRM_MODE_NONE = "none"
+
+
+class PublisherChannel:
+    """Canal AMQP de una cámara sobre la conexión compartida del proceso.
+
+    `publish` se llama desde el thread de la cámara y nunca bloquea: si la
+    ventana de mensajes en vuelo (encolados + sin confirmar) está llena, o el
+    canal no está abierto, el frame se descarta y se cuenta en `dropped`.
+    Todo acceso al canal pika ocurre en el thread de IO de la conexión.
+    """
+
+    def __init__(self, owner: "SharedAmqpConnection", key: Any, window: int, confirm: bool) -> None:
+        self.key = key
+        self._owner = owner
+        self._window = max(1, window)
+        self._confirm = confirm
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._channel = None
+        self._opening = False
+        self.closed = False
+        # Solo IO thread
+        self._next_tag = 0
+        self._unconfirmed: Deque[Tuple[int, float]] = deque()
+        # Métricas
+        self.published = 0
+        self.confirmed = 0
+        self.nacked = 0
+        self.dropped = 0
+        self.confirm_latency_ms = 0.0
+
+    # ---------------- thread de la cámara ----------------
+    def publish(self, exchange: str, routing_key: str, body: bytes, properties: pika.BasicProperties) -> bool:
+        with self._lock:
+            if self.closed or self._channel is None or self._in_flight >= self._window:
+                self.dropped += 1
+                return False
+            self._in_flight += 1
+
+        if not self._owner.call_threadsafe(lambda: self._do_publish(exchange, routing_key, body, properties)):
+            self._release(1, dropped=True)
+            return False
+        return True
+
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def in_flight_ratio(self) -> float:
+        return self._in_flight / self._window
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "confirmed": self.confirmed,
+            "nacked": self.nacked,
+            "dropped": self.dropped,
+            "in_flight": self._in_flight,
+            "confirm_latency_ms": round(self.confirm_latency_ms, 1),
+        }
+
+    def _release(self, count: int, dropped: bool = False) -> None:
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - count)
+            if dropped:
+                self.dropped += count
+
+    # ---------------- thread de IO ----------------
+    def _do_publish(self, exchange: str, routing_key: str, body: bytes, properties: pika.BasicProperties) -> None:
+        channel = self._channel
+        if channel is None or not channel.is_open:
+            self._release(1, dropped=True)
+            return
+        try:
+            channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body, properties=properties, mandatory=False)
+        except Exception as ex:
+            logger.warning("Publish failed on channel '%s': %s", self.key, ex)
+            self._release(1, dropped=True)
+            return
+
+        self.published += 1
+        if self._confirm:
+            self._next_tag += 1
+            self._unconfirmed.append((self._next_tag, time.monotonic()))
+        else:
+            self._release(1)
+
+    def _on_open(self, channel) -> None:
+        self._opening = False
+        if self.closed:
+            channel.close()
+            return
+        channel.add_on_close_callback(self._on_channel_closed)
+        self._next_tag = 0
+        self._unconfirmed.clear()
+        if self._confirm:
+            channel.confirm_delivery(ack_nack_callback=self._on_confirm)
+        with self._lock:
+            self._channel = channel
+        logger.debug("Publisher channel '%s' opened", self.key)
+
+    def _on_confirm(self, frame) -> None:
+        method = frame.method
+        tag = method.delivery_tag
+        now = time.monotonic()
+        released = 0
+        sent_at = None
+
+        if method.multiple:
+            while self._unconfirmed and self._unconfirmed[0][0] <= tag:
+                _, sent_at = self._unconfirmed.popleft()
+                released += 1
+        else:
+            for item in self._unconfirmed:
+                if item[0] == tag:
+                    sent_at = item[1]
+                    self._unconfirmed.remove(item)
+                    released = 1
+                    break
+
+        if not released:
+            return
+        if isinstance(method, Basic.Nack):
+            self.nacked += released
+        else:
+            self.confirmed += released
+        if sent_at is not None:
+            latency = (now - sent_at) * 1000
+            self.confirm_latency_ms = latency if not self.confirm_latency_ms else 0.8 * self.confirm_latency_ms + 0.2 * latency
+        self._release(released)
+
+    def _reset(self) -> None:
+        with self._lock:
+            self._channel = None
+            self._in_flight = max(0, self._in_flight - len(self._unconfirmed))
+        self._unconfirmed.clear()
+        self._opening = False
+
+    def _on_channel_closed(self, channel, reason) -> None:
+        logger.warning("Publisher channel '%s' closed: %s", self.key, reason)
+        self._reset()
+        if not self.closed:
+            self._owner.reopen_later(self)
+
+    def _close(self) -> None:
+        channel = self._channel
+        self._reset()
+        if channel is not None and channel.is_open:
+            channel.close()
+
+
+class SharedAmqpConnection:
+    """Una conexión AMQP por proceso (y URL/exchange) con un canal por cámara.
+
+    La conexión es un pika.SelectConnection que corre en su propio thread de
+    IO; los threads de las cámaras publican a través de
+    ioloop.add_callback_threadsafe, así que ningún publish espera el round
+    trip del broker. Ante una caída se reconecta y reabre todos los canales.
+    """
+
+    _instances: Dict[Tuple[int, str, str], "SharedAmqpConnection"] = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, amqp_url: str, exchange: str, confirm_mode: str, window: int) -> "SharedAmqpConnection":
+        key = (os.getpid(), amqp_url, exchange)
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = cls(amqp_url, exchange, confirm_mode, window)
+                cls._instances[key] = instance
+            return instance
+
+    @classmethod
+    def close_all(cls) -> None:
+        with cls._instances_lock:
+            instances = list(cls._instances.values())
+            cls._instances.clear()
+        for instance in instances:
+            instance.close()
+
+    def __init__(self, amqp_url: str, exchange: str, confirm_mode: str, window: int, reconnect_delay_seconds: float = 5) -> None:
+        self._amqp_url = amqp_url
+        self._exchange = exchange
+        self._confirm = confirm_mode == CONFIRM_MODE_PIPELINED
+        self._window = window
+        self._reconnect_delay = reconnect_delay_seconds
+        self._lock = threading.Lock()
+        self._channels: Dict[Any, PublisherChannel] = {}
+        self._connection: Optional[pika.SelectConnection] = None
+        self._ready = False
+        self._stop_event = threading.Event()
+        self.blocked = False
+        self._thread = threading.Thread(target=self._run, name="amqp-publisher-io", daemon=True)
+        self._thread.start()
+
+    @property
+    def exchange(self) -> str:
+        return self._exchange
+
+    def channel(self, key: Any) -> PublisherChannel:
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is None or channel.closed:
+                channel = PublisherChannel(self, key, self._window, self._confirm)
+                self._channels[key] = channel
+        # Si la conexión aún no está lista, _on_exchange_ready abrirá el canal
+        self.call_threadsafe(lambda: self._open_channel(channel))
+        return channel
+
+    def release(self, channel: PublisherChannel) -> None:
+        with self._lock:
+            if self._channels.get(channel.key) is channel:
+                del self._channels[channel.key]
+        channel.closed = True
+        self.call_threadsafe(channel._close)
+
+    def call_threadsafe(self, callback: Callable[[], None]) -> bool:
+        connection = self._connection
+        if connection is None or not self._ready:
+            return False
+        try:
+            connection.ioloop.add_callback_threadsafe(callback)
+            return True
+        except Exception:
+            return False
+
+    def reopen_later(self, channel: PublisherChannel) -> None:
+        connection = self._connection
+        if connection is not None and self._ready:
+            connection.ioloop.call_later(self._reconnect_delay, lambda: self._open_channel(channel))
+
+    def close(self) -> None:
+        self._stop_event.set()
+        connection = self._connection
+        if connection is not None:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._close_connection)
+            except Exception:
+                pass
+        self._thread.join(timeout=5)
+
+    # ---------------- thread de IO ----------------
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            logger.info("Connecting to RabbitMQ at %s", self._amqp_url)
+            params = pika.URLParameters(self._amqp_url)
+            params.heartbeat = 30
+            # Si la conexión se bloquea (por slow consumer), cerrar después de X segundos
+            params.blocked_connection_timeout = 30
+            params.socket_timeout = 30
+            try:
+                self._connection = pika.SelectConnection(
+                    parameters=params,
+                    on_open_callback=self._on_connection_open,
+                    on_open_error_callback=self._on_connection_open_error,
+                    on_close_callback=self._on_connection_closed,
+                )
+                self._connection.ioloop.start()
+            except Exception as ex:
+                logger.error("RabbitMQ publisher connection error: %s", ex)
+            self._ready = False
+            self._connection = None
+            if not self._stop_event.is_set():
+                self._stop_event.wait(self._reconnect_delay)
+        logger.info("RabbitMQ publisher connection closed (%s)", self._amqp_url)
+
+    def _on_connection_open(self, connection) -> None:
+        connection.add_on_connection_blocked_callback(self._on_blocked)
+        connection.add_on_connection_unblocked_callback(self._on_unblocked)
+        connection.channel(on_open_callback=self._on_control_channel_open)
+
+    def _on_connection_open_error(self, connection, error) -> None:
+        logger.error("Could not connect to RabbitMQ at %s: %s", self._amqp_url, error)
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason) -> None:
+        self._ready = False
+        self.blocked = False
+        with self._lock:
+            channels = list(self._channels.values())
+        for channel in channels:
+            channel._reset()
+        if not self._stop_event.is_set():
+            logger.warning("RabbitMQ publisher connection lost: %s", reason)
+        connection.ioloop.stop()
+
+    def _on_control_channel_open(self, channel) -> None:
+        channel.exchange_declare(
+            exchange=self._exchange,
+            exchange_type="topic",
+            durable=True,
+            callback=lambda _frame: self._on_exchange_ready(channel),
+        )
+
+    def _on_exchange_ready(self, control_channel) -> None:
+        control_channel.close()
+        self._ready = True
+        logger.info("Connected to RabbitMQ at %s", self._amqp_url)
+        with self._lock:
+            channels = list(self._channels.values())
+        for channel in channels:
+            self._open_channel(channel)
+
+    def _open_channel(self, channel: PublisherChannel) -> None:
+        connection = self._connection
+        if connection is None or not self._ready or channel.closed:
+            return
+        if channel._opening or channel._channel is not None:
+            return
+        channel._opening = True
+        connection.channel(on_open_callback=channel._on_open)
+
+    def _on_blocked(self, connection, frame) -> None:
+        logger.warning("RabbitMQ connection blocked by broker: %s", frame.method.reason)
+        self.blocked = True
+
+    def _on_unblocked(self, connection, frame) -> None:
+        logger.info("RabbitMQ connection unblocked")
+        self.blocked = False
+
+    def _close_connection(self) -> None:
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
@@ -0,0 +1,133 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+import pika
+from pika.exceptions import AMQPError, ChannelClosedByBroker
+
+logger = logging.getLogger(__name__)
+
+
+class ConsumerDemandMonitor:
+    """Cuenta los consumers de las colas de frames de las cámaras del proceso.
+
+    Un thread hace `queue_declare(passive=True)` de cada cola vigilada cada
+    `interval_seconds` sobre una BlockingConnection propia (una por proceso y
+    URL), así las cámaras consultan el último conteo sin tocar la red. Una
+    cola inexistente cuenta como 0 consumers; si el broker no responde el
+    conteo es None (desconocido) y las cámaras siguen publicando.
+    """
+
+    _instances: Dict[Tuple[int, str], "ConsumerDemandMonitor"] = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, amqp_url: str, interval_seconds: float) -> "ConsumerDemandMonitor":
+        key = (os.getpid(), amqp_url)
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = cls(amqp_url, interval_seconds)
+                cls._instances[key] = instance
+            return instance
+
+    @classmethod
+    def close_all(cls) -> None:
+        with cls._instances_lock:
+            instances = list(cls._instances.values())
+            cls._instances.clear()
+        for instance in instances:
+            instance.close()
+
+    def __init__(self, amqp_url: str, interval_seconds: float) -> None:
+        self._amqp_url = amqp_url
+        self._interval = interval_seconds
+        self._lock = threading.Lock()
+        # cola -> (referencias, último conteo)
+        self._queues: Dict[str, Tuple[int, Optional[int]]] = {}
+        self._connection: Optional[pika.BlockingConnection] = None
+        self._channel = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="amqp-demand-monitor", daemon=True)
+        self._thread.start()
+
+    def watch(self, queue: str) -> None:
+        with self._lock:
+            refs, count = self._queues.get(queue, (0, None))
+            self._queues[queue] = (refs + 1, count)
+
+    def unwatch(self, queue: str) -> None:
+        with self._lock:
+            refs, count = self._queues.get(queue, (0, None))
+            if refs <= 1:
+                self._queues.pop(queue, None)
+            else:
+                self._queues[queue] = (refs - 1, count)
+
+    def consumers(self, queue: str) -> Optional[int]:
+        with self._lock:
+            return self._queues.get(queue, (0, None))[1]
+
+    def close(self) -> None:
+        self._stop_event.set()
+        self._thread.join(timeout=self._interval + 1)
+
+    def _connect(self) -> None:
+        params = pika.URLParameters(self._amqp_url)
+        params.heartbeat = 30
+        params.socket_timeout = 10
+        params.connection_attempts = 1
+        self._connection = pika.BlockingConnection(params)
+        self._channel = self._connection.channel()
+
+    def _count(self, queue: str) -> int:
+        try:
+            return self._channel.queue_declare(queue=queue, passive=True).method.consumer_count
+        except ChannelClosedByBroker as ex:
+            if ex.reply_code != 404:
+                raise
+            # La cola aún no existe: nadie la consume. El canal quedó cerrado por el broker
+            self._channel = self._connection.channel()
+            return 0
+
+    def _poll(self) -> None:
+        with self._lock:
+            queues = list(self._queues.keys())
+        if not queues:
+            return
+        if self._connection is None or self._connection.is_closed:
+            self._connect()
+
+        counts = {queue: self._count(queue) for queue in queues}
+        # Mantiene viva la conexión (heartbeats) entre consultas
+        self._connection.process_data_events(time_limit=0)
+        with self._lock:
+            for queue, count in counts.items():
+                if queue in self._queues:
+                    self._queues[queue] = (self._queues[queue][0], count)
+
+    def _mark_unknown(self) -> None:
+        with self._lock:
+            for queue, (refs, _) in self._queues.items():
+                self._queues[queue] = (refs, None)
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self._poll()
+            except (AMQPError, OSError) as ex:
+                logger.warning("Consumer demand check failed on %s: %s", self._amqp_url, ex)
+                self._mark_unknown()
+                self._connection = None
+            except Exception as ex:
+                logger.exception("Unexpected consumer demand monitor error: %s", ex)
+                self._mark_unknown()
+                self._connection = None
+            self._stop_event.wait(self._interval)
+
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
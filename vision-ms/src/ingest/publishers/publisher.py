@@ -1,69 +1,81 @@
 from __future__ import annotations
 import json
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 import pika
+from .connection import SharedAmqpConnection, PublisherChannel
+from ...helpers.constants.constants import constants
 #import ssl
 #import certifi
 
 logger = logging.getLogger(__name__)
 
 class RabbitPublisher:
+    """Publisher de una cámara.
 
-    def __init__(self, amqp_url: str, exchange: str) -> None:
+    No abre su propia conexión: usa un canal (uno por `channel_key`) sobre la
+    SharedAmqpConnection del proceso. Los publish son asíncronos; con
+    AMQP_PUBLISH_CONFIRM_MODE=pipelined se confirman en segundo plano con una
+    ventana de AMQP_PUBLISH_WINDOW mensajes en vuelo, y con `none` son
+    fire-and-forget. Si la ventana está llena el frame se descarta.
+    """
+
+    def __init__(self, amqp_url: str, exchange: str, channel_key: Any = None) -> None:
         self._amqp_url = amqp_url
         self._exchange = exchange
-        self._connection: Optional[pika.BlockingConnection] = None
-        self._channel: Optional[pika.adapters.blocking_connection.BlockingChannel] = None
+        self._channel_key = channel_key if channel_key is not None else id(self)
+        self._connection: Optional[SharedAmqpConnection] = None
+        self._channel: Optional[PublisherChannel] = None
 
     def connect(self) -> None:
-        if self._connection and self._connection.is_open:
+        if self._channel is not None and not self._channel.closed:
             return
-        logger.info("Connecting to RabbitMQ at %s", self._amqp_url)
         # SSL
         #ssl_context = ssl.create_default_context(cafile=certifi.where())
         #ssl_context.verify_mode = ssl.CERT_REQUIRED
         #ssl_context.check_hostname = True
-        # RabbitMQ
-        params = pika.URLParameters(self._amqp_url)
-        params.heartbeat = 30
-        # Si la conexión se bloquea (por slow consumer), cerrar después de X segundos
-        params.blocked_connection_timeout = 30
-        params.socket_timeout = 30
-        params.connection_attempts = 5
-        params.retry_delay = 5
-        #SSL
         #params.ssl_options = pika.SSLOptions(ssl_context)
-        #params.port = 5672
-                
-        self._connection = pika.BlockingConnection(params)
-        self._channel = self._connection.channel()
-        self._channel.confirm_delivery()
-        self._channel.exchange_declare(
+        self._connection = SharedAmqpConnection.get(
+            amqp_url=self._amqp_url,
             exchange=self._exchange,
-            exchange_type="topic",
-            durable=True
+            confirm_mode=constants["AMQP_PUBLISH_CONFIRM_MODE"],
+            window=constants["AMQP_PUBLISH_WINDOW"],
         )
-        logger.info("Connected to RabbitMQ at %s", self._amqp_url)
+        self._channel = self._connection.channel(self._channel_key)
+        logger.info("Publisher channel '%s' registered on shared RabbitMQ connection %s", self._channel_key, self._amqp_url)
 
-    def publish(self, routing_key: str, payload: Dict[str, Any]) -> None:
-        if self._channel is None or self._channel.is_closed:
-            self.connect()
+    def publish(self, routing_key: str, payload: Dict[str, Any]) -> bool:
         body = json.dumps(payload).encode("utf-8")
+        return self.publish_raw(routing_key, body, content_type="application/json")
+
+    def publish_raw(self, routing_key: str, body: bytes, content_type: Optional[str] = None) -> bool:
+        """Encola el mensaje; devuelve False si se descartó (ventana llena o canal caído)."""
+        if self._channel is None or self._channel.closed:
+            self.connect()
         assert self._channel is not None
-        self._channel.basic_publish(
+        return self._channel.publish(
             exchange=self._exchange,
             routing_key=routing_key,
             body=body,
-            properties=pika.BasicProperties(delivery_mode=1),  # mensajes NO  persistentes.  2 si es persistente
-            mandatory=False
+            properties=pika.BasicProperties(
+                delivery_mode=1,  # mensajes NO  persistentes.  2 si es persistente
+                content_type=content_type,
+            ),
         )
 
+    def backpressure(self) -> Tuple[bool, float, float]:
+        """Señales de presión del broker: (blocked, ocupación de la ventana 0..1, latencia de confirm en ms)."""
+        if self._channel is None or self._connection is None:
+            return False, 0.0, 0.0
+        return self._connection.blocked, self._channel.in_flight_ratio(), self._channel.confirm_latency_ms
+
+    def stats(self) -> dict:
+        return self._channel.stats() if self._channel is not None else {}
+
     def close(self) -> None:
         try:
-            if self._channel and self._channel.is_open:
-                self._channel.close()
-            if self._connection and self._connection.is_open:
-                self._connection.close()
+            if self._connection is not None and self._channel is not None:
+                self._connection.release(self._channel)
+            self._channel = None
         except Exception as ex:
-            logger.warning("Error closing RabbitMQ connection: %s", ex)
+            logger.warning("Error closing RabbitMQ channel: %s", ex)
@@ -9,7 +9,8 @@ import logging
 from .routers.default_router import DefaultRouter
 from .routers.people_router import PersonRouter
 from .helpers.utils.logger import configure_logging
-from .face_registry.recognition.face_engine import FaceEngine
+from .helpers.utils.engine_pool import FaceEnginePool
+from .face_recognition.recognition.face_engine import FaceEngine
 from .helpers.constants.constants import constants
 
 logger = logging.getLogger(__name__)
@@ -52,7 +53,7 @@ def create_app() -> FastAPI:
         db: AsyncIOMotorDatabase = await init_mongo()
         app.state.db = db
         logger.info("Mongo initialized.")
-        engine = FaceEngine()
+        engine = FaceEnginePool(FaceEngine)
         app.state.loop = asyncio.get_running_loop()
         
         app.state.default_router = DefaultRouter(db=db, engine=engine, main_loop=app.state.loop)
@@ -68,6 +69,8 @@ def create_app() -> FastAPI:
         if hasattr(app.state, "default_router"):
             app.state.default_router.stop_all()
             logger.info("Stopped all workers.")
+            await app.state.default_router.flush()
+            logger.info("Pending writes flushed.")
 
         if hasattr(app.state, "mongo_client"):
             app.state.db.close()
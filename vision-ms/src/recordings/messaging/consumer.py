@@ -1,10 +1,6 @@
 from __future__ import annotations
-import base64
-import json
 import logging
 import threading
-import cv2
-import numpy as np
 import pika
 import asyncio
 from typing import Optional
@@ -13,18 +9,25 @@ from ..dto.recordings_dto import RecordingDTO, RecordingStatus
 from ..services.recordings_service import RecordingsService
 from ..recorder.recorder_manager import RecorderManager
 from ...helpers.constants.constants import constants
+from ...helpers.utils.frame_codec import decode_frame, decode_frame_image, frame_routing_key, frame_queue_name, RENDITION_ARCHIVE
+from ...helpers.utils.amqp import declare_queue, queue_arguments
+from ...helpers.utils.frame_bus import FrameBusSubscription, frame_bus_name
 
 logger = logging.getLogger(__name__)
 
 class VideoConsumer(threading.Thread):
 
-    def __init__(self, camera_id: int, db: AsyncIOMotorDatabase, main_loop: asyncio.AbstractEventLoop):
+    def __init__(self, camera_id: int, db: AsyncIOMotorDatabase, main_loop: asyncio.AbstractEventLoop,
+                 rtsp_url: Optional[str] = None):
         super().__init__(daemon=True)
         self.camera_id = camera_id
         # Servicios
         self._main_loop: asyncio.AbstractEventLoop = main_loop
         self._recordings_service = RecordingsService(db=db)
-        self._recorder = RecorderManager(camera_id=camera_id)
+        self._rtsp_url = rtsp_url
+        self._recorder: Optional[RecorderManager] = None
+        # userId de los frames de la cámara, para los eventos que se cierran sin frame
+        self._user_id: Optional[int] = None
         # Flag de parada del thread
         self._stop_flag = threading.Event()
         # RabbitMQ
@@ -32,6 +35,8 @@ class VideoConsumer(threading.Thread):
         self._exchange = constants["AMQP_EXCHANGE"]
         self._connection: Optional[pika.BlockingConnection] = None
         self._channel: Optional[pika.adapters.blocking_connection.BlockingChannel] = None
+        # Frames locales por memoria compartida en lugar de RabbitMQ
+        self._use_frame_bus: bool = constants["FRAME_BUS_ENABLED"]
 
     def stop(self):
         self._stop_flag.set()
@@ -55,22 +60,99 @@ class VideoConsumer(threading.Thread):
 
         logger.info("Conectado a RabbitMQ %s", self._amqp_url)
 
+    def _process_frame(self, frame, timestamp: float, camera_id: int, user_id: int, fps: float, width: int, height: int) -> None:
+        self._user_id = user_id
+        event = self._recorder.handle_frame(frame, timestamp, fps, width, height)
+        if event:
+            self._save_event(event)
+
+    def _save_event(self, event) -> None:
+        """Persiste un evento de grabación (desde handle_frame o, en remux, desde el tick del remuxer)."""
+        recording = RecordingDTO(
+            userId=self._user_id,
+            cameraId=self.camera_id,
+            filePath=event["file_path"],
+            contentType=event["content_type"],
+            fileSize=event["file_size"],
+            durationMs=event["duration_ms"],
+            startedAt=event["started_at"],
+            endedAt=event["ended_at"],
+            status=RecordingStatus.READY,
+            movementScore=event["movement_score"],
+            createdAt=event["created_at"],
+        )
+        try:
+            self._main_loop.call_soon_threadsafe(
+                asyncio.create_task,
+                self._recordings_service.create(recording)
+            )
+            logger.info(f"Evento guardado en Mongo: {recording}")
+        except Exception as e:
+            logger.exception("Error guardando en Mongo: %s", e)
+
+    def _run_frame_bus(self):
+        subscription = FrameBusSubscription(frame_bus_name(self.camera_id, RENDITION_ARCHIVE))
+        try:
+            while not self._stop_flag.is_set():
+                # Copia fuera del ring: el recorder retiene el último frame y lo escribe más tarde
+                item = subscription.next(timeout=1.0, copy=True)
+                if item is None:
+                    continue
+                try:
+                    self._process_frame(
+                        item.frame,
+                        timestamp=item.timestamp,
+                        camera_id=item.camera_id,
+                        user_id=item.user_id,
+                        fps=item.fps,
+                        width=item.width,
+                        height=item.height,
+                    )
+                except Exception as e:
+                    logger.exception("Error processing bus frame for camera %s: %s", self.camera_id, e)
+        finally:
+            subscription.close()
+            logger.info("VideoConsumer stopped for camera %s", self.camera_id)
+
     def run(self):
         logger.info("VideoConsumer started for camera %s", self.camera_id)
+        # En modo remux el RecorderManager lanza ffmpeg; se crea en el thread del consumer
+        self._recorder = RecorderManager(camera_id=self.camera_id, rtsp_url=self._rtsp_url, on_event=self._save_event)
+        try:
+            if self._use_frame_bus:
+                self._run_frame_bus()
+            else:
+                self._run_amqp()
+        finally:
+            self._recorder.close()
+
+    def _run_amqp(self):
         self.connect()
 
-        queue_name = f"video-archive.{self.camera_id}"
+        queue_name = frame_queue_name(self.camera_id, RENDITION_ARCHIVE)
 
         self._channel.exchange_declare(
             exchange=self._exchange,
             exchange_type="topic",
             durable=True
         )
-        self._channel.queue_declare(queue=queue_name, durable=True)
+        self._channel = declare_queue(
+            self._connection,
+            self._channel,
+            queue_name,
+            durable=True,
+            arguments=queue_arguments(
+                max_length=constants["ARCHIVE_QUEUE_MAX_LENGTH"],
+                overflow=constants["ARCHIVE_QUEUE_OVERFLOW"],
+                message_ttl_ms=constants["ARCHIVE_QUEUE_MESSAGE_TTL_MS"],
+            ),
+        )
+        # Sin prefetch el broker empuja toda la cola al consumer y su memoria crece
+        self._channel.basic_qos(prefetch_count=constants["CONSUMER_PREFETCH"])
         self._channel.queue_bind(
             exchange=self._exchange,
             queue=queue_name,
-            routing_key=f"camera.{self.camera_id}",
+            routing_key=frame_routing_key(self.camera_id, RENDITION_ARCHIVE),
         )
 
         def callback(ch, method, properties, body):
@@ -78,47 +160,22 @@ class VideoConsumer(threading.Thread):
                 ch.basic_cancel(consumer_tag=self.camera_id)
                 return
             try:
-                msg = json.loads(body)
-                frame_b64 = msg["frame"]
-                timestamp = float(msg.get("timestamp", 0))
-                camera_id = msg["camera_id"]
-                user_id = msg["user_id"]
-                fps = msg["fps"]
-                width = msg["width"]
-                height = msg["height"]
-
-                frame_bytes = base64.b64decode(frame_b64)
-                arr = np.frombuffer(frame_bytes, np.uint8)
-                frame = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+                msg = decode_frame(body, properties.content_type)
+                timestamp = msg.timestamp
+                camera_id = msg.camera_id
+                user_id = msg.user_id
+                fps = msg.fps
+                width = msg.width
+                height = msg.height
+
+                frame = decode_frame_image(msg)
                 if frame is None:
                     logger.warning("Frame inválido recibido en camera %s", self.camera_id)
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
                     return
 
-                event = self._recorder.handle_frame(frame, timestamp, fps, width, height)
-                if event:  
-                    recording = RecordingDTO(
-                        userId=user_id,
-                        cameraId=camera_id,
-                        filePath=event["file_path"],
-                        contentType=event["content_type"],
-                        fileSize=event["file_size"],
-                        durationMs=event["duration_ms"],
-                        startedAt=event["started_at"],
-                        endedAt=event["ended_at"],
-                        status=RecordingStatus.READY,
-                        movementScore=event["movement_score"],
-                        createdAt=event["created_at"],
-                    )
-                    try:
-                        self._main_loop.call_soon_threadsafe(
-                            asyncio.create_task,
-                            self._recordings_service.create(recording)
-                        )
-                        logger.info(f"Evento guardado en Mongo: {recording}")
-                    except Exception as e:
-                        logger.exception("Error guardando en Mongo: %s", e)
-                    
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                self._process_frame(frame, timestamp, camera_id, user_id, fps, width, height)
+                ch.basic_ack(delivery_tag=method.delivery_tag)
 
             except Exception as e:
                 logger.exception("Error processing message for camera %s: %s", self.camera_id, e)
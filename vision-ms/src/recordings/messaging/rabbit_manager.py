@@ -1,5 +1,6 @@
 from __future__ import annotations
 import logging
+import threading
 from typing import Dict, Optional
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorDatabase
@@ -12,6 +13,8 @@ class RecordingRabbitManager:
 
     def __init__(self, db: AsyncIOMotorDatabase, main_loop: asyncio.AbstractEventLoop):
         self.db = db
+        # start es check-then-act y se llama desde los threads de /start-batch
+        self._start_lock = threading.Lock()
         self.consumers: Dict[int, VideoConsumer] = {}
         self.main_loop: asyncio.AbstractEventLoop = main_loop
 
@@ -35,13 +38,17 @@ class RecordingRabbitManager:
             logger.error("Error stopping consumer: %s", e)
 
     def start(self, req: ApiReqDTO):
+        with self._start_lock:
+            self._start(req)
+
+    def _start(self, req: ApiReqDTO):
         if req.cameraId in self.consumers and self.is_running(req.cameraId ):
             logger.warning("Consumer for camera %s already running.", req.cameraId )
             return
 
         logger.info("Starting consumer for camera %s …", req.cameraId )
         
-        consumer = VideoConsumer(camera_id=req.cameraId, db=self.db, main_loop=self.main_loop)
+        consumer = VideoConsumer(camera_id=req.cameraId, db=self.db, main_loop=self.main_loop, rtsp_url=req.rtspUrl)
         try:
             consumer.start()
             self.consumers[req.cameraId ] = consumer
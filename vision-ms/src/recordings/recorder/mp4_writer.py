@@ -8,6 +8,20 @@ from ...helpers.constants.constants import constants
 
 logger = logging.getLogger(__name__)
 
+def recording_root(base_path: str) -> str:
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", ".."))
+    return os.path.join(root, base_path)
+
+
+def build_recording_path(base_path: str, camera_id: int) -> str:
+    date_path = datetime.utcnow().strftime("%Y/%m/%d")
+    folder = os.path.join(recording_root(base_path), str(camera_id), date_path)
+    os.makedirs(folder, exist_ok=True)
+
+    filename = datetime.utcnow().strftime("%H%M%S_event.mp4")
+    return os.path.join(folder, filename)
+
+
 class MP4Writer:
 
     def __init__(self, base_path: str, camera_id: int):
@@ -17,13 +31,7 @@ class MP4Writer:
         self.path = None
 
     def open(self, width: int, height: int, fps: int) -> str:
-        root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", ".."))
-        date_path = datetime.utcnow().strftime("%Y/%m/%d")
-        folder = os.path.join(root, self.base_path, str(self.camera_id), date_path)
-        os.makedirs(folder, exist_ok=True)
-
-        filename = datetime.utcnow().strftime("%H%M%S_event.mp4")
-        self.path = os.path.join(folder, filename)
+        self.path = build_recording_path(self.base_path, self.camera_id)
         logger.info(f"Ruta final del video: ${self.path}")
         fourcc = cv2.VideoWriter_fourcc(*"mp4v")
         self.writer = cv2.VideoWriter(self.path, fourcc, fps, (width, height), isColor=True)
@@ -1,20 +1,63 @@
 import time
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any, List
 import logging
 import os
-from .mp4_writer import MP4Writer
+import shutil
+import subprocess
+import tempfile
+import threading
+from .mp4_writer import MP4Writer, build_recording_path, recording_root
+from .segment_remuxer import SegmentRemuxer, Segment, ffmpeg_available
 from ..detection.motion_detector import MotionDetector
 from ...helpers.constants.constants import constants
 from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
+RECORDING_MODE_TRANSCODE = "transcode"
+RECORDING_MODE_REMUX = "remux"
+
+
 class RecorderManager:
+    """Decide cuándo grabar a partir del movimiento en los frames de archivo.
+
+    En modo transcode los frames se escriben con MP4Writer. En modo remux
+    (requiere ffmpeg y la URL RTSP) un SegmentRemuxer copia el stream
+    comprimido a segmentos en spool; al cerrar un evento se concatenan sin
+    re-codificar los segmentos que lo cubren (más RECORDING_PREROLL_SECONDS) y
+    los segmentos que ya no pertenecen a ningún evento se eliminan.
 
-    def __init__(self, camera_id: int):
+    En remux el cierre por inactividad y la concatenación corren en el tick
+    del SegmentRemuxer, no en `handle_frame`: con el motion gate o la
+    hibernación del ingest los frames pueden dejar de llegar. Esos eventos se
+    entregan por `on_event`; `close` entrega también el evento abierto y los
+    pendientes. En transcode `handle_frame` sigue devolviendo el evento.
+    """
+
+    def __init__(self, camera_id: int, rtsp_url: Optional[str] = None,
+                 on_event: Optional[Callable[[Dict[str, Any]], None]] = None):
         self.camera_id = camera_id
         self.idle_seconds = constants["INGEST_IDLE_ON_MOTION_SECONDS"]
         self.base_path = constants["STORAGE_BASE_PATH"]
+        self.preroll_seconds = constants["RECORDING_PREROLL_SECONDS"]
+        self.ffmpeg_binary = constants["RECORDING_FFMPEG_BINARY"]
+        self.mode = self._resolve_mode(constants["RECORDING_MODE"], rtsp_url)
+        self.remuxer: Optional[SegmentRemuxer] = None
+        self._on_event = on_event
+        # handle_frame (thread del consumer) y el tick del remuxer comparten el estado del evento
+        self._lock = threading.RLock()
+        # Eventos cerrados cuyo último segmento ffmpeg todavía está escribiendo
+        self._pending_events: List[Dict[str, Any]] = []
+        if self.mode == RECORDING_MODE_REMUX:
+            self.remuxer = SegmentRemuxer(
+                camera_id=camera_id,
+                rtsp_url=rtsp_url,
+                spool_dir=os.path.join(recording_root(self.base_path), ".spool", str(camera_id)),
+                segment_seconds=constants["RECORDING_SEGMENT_SECONDS"],
+                reconnect_delay_seconds=constants["INGEST_RECONNECT_DELAY_SECONDS"],
+                ffmpeg_binary=self.ffmpeg_binary,
+                on_tick=self._on_remux_tick,
+            )
         self.motion_detector = MotionDetector()
         self.writer: Optional[MP4Writer] = None
         self.recording: bool = False
@@ -23,22 +66,83 @@ class RecorderManager:
         self.current_file_path: Optional[str] = None
         self.movement_score: int = 0
         self.last_frame = None
+        if self.remuxer is not None:
+            self.remuxer.start()
+
+    def _resolve_mode(self, mode: str, rtsp_url: Optional[str]) -> str:
+        if mode != RECORDING_MODE_REMUX:
+            return RECORDING_MODE_TRANSCODE
+        if not rtsp_url:
+            logger.warning("Camera %s: remux recording requires the RTSP URL; falling back to transcode", self.camera_id)
+            return RECORDING_MODE_TRANSCODE
+        if not ffmpeg_available(self.ffmpeg_binary):
+            logger.warning("Camera %s: '%s' not found; falling back to transcode recording", self.camera_id, self.ffmpeg_binary)
+            return RECORDING_MODE_TRANSCODE
+        return RECORDING_MODE_REMUX
+
+    def close(self) -> None:
+        """Cierra el evento abierto y entrega los pendientes por `on_event`."""
+        if self.remuxer is not None:
+            # SIGTERM: ffmpeg cierra el segmento actual, que pasa a estar completo
+            self.remuxer.stop()
+            self.remuxer.join(timeout=5)
+        with self._lock:
+            now = time.time()
+            events = []
+            if self.recording:
+                event = self._close_recording(now)
+                if event:
+                    events.append(event)
+            if self.remuxer is not None:
+                events += self._finish_pending(now, final=True)
+        for event in events:
+            self._deliver(event)
 
     def handle_frame(self, frame, timestamp: float, fps: float, width: int, height: int) -> Optional[Dict[str, Any]]:
         now = timestamp or time.time()
-        self.last_frame = frame
         movement = self.motion_detector.detect(frame)
         is_motion = movement and movement > 0.1
 
-        if is_motion:
-            return self._on_motion(frame, now, width, height, fps)
+        with self._lock:
+            self.last_frame = frame
+            if is_motion:
+                return self._on_motion(frame, now, width, height, fps)
+            return self._on_no_motion(now)
+
+    def _on_remux_tick(self) -> None:
+        with self._lock:
+            now = time.time()
+            if (self.recording and self.last_motion_ts is not None
+                    and now - self.last_motion_ts >= self.idle_seconds):
+                # Sin frames no llega el _on_no_motion que cerraría el evento
+                self._close_recording(self.last_motion_ts + self.idle_seconds)
+            events = self._finish_pending(now)
+        for event in events:
+            self._deliver(event)
 
-        return self._on_no_motion(now)
+    def _deliver(self, event: Dict[str, Any]) -> None:
+        if self._on_event is None:
+            logger.warning("Camera %s: recording %s finished without on_event; not persisted",
+                           self.camera_id, event["file_path"])
+            return
+        try:
+            self._on_event(event)
+        except Exception as e:
+            logger.exception("Camera %s: Error delivering recording event: %s", self.camera_id, e)
 
     def _on_motion(self, frame, now: float, width: int, height: int, fps: float):
         self.last_motion_ts = now
         self.movement_score += 1
-        
+
+        if self.remuxer is not None:
+            # El video lo graba ffmpeg; aquí solo se marca el inicio del evento
+            if not self.recording:
+                logger.info("Motion detected — marking event start for camera %s (remux)", self.camera_id)
+                self.recording = True
+                self.event_start_ts = now
+                self.movement_score = 1
+            return None
+
         if not self.recording:
             logger.info("Motion detected — starting recording for camera %s", self.camera_id)
             try:
@@ -70,6 +174,8 @@ class RecorderManager:
         time_since_last_motion = now - self.last_motion_ts
 
         if time_since_last_motion < self.idle_seconds:
+            if self.remuxer is not None:
+                return None
             try:
                 if self.writer and self.last_frame is not None:
                     self.writer.write(self.last_frame)
@@ -80,8 +186,17 @@ class RecorderManager:
 
         return self._close_recording(now)
 
-    def _close_recording(self, end_ts: float) -> Dict[str, Any]:
+    def _close_recording(self, end_ts: float) -> Optional[Dict[str, Any]]:
         logger.info("Stopping recording after %s idle seconds for camera %s", self.idle_seconds, self.camera_id)
+        if self.remuxer is not None:
+            self._pending_events.append({
+                "started_at": self.event_start_ts or end_ts,
+                "ended_at": end_ts,
+                "movement_score": self.movement_score,
+            })
+            self._reset()
+            return None
+
         try:
             file_path = self.writer.close() if self.writer else self.current_file_path
         except Exception as e:
@@ -112,7 +227,10 @@ class RecorderManager:
             "content_type": content_type
         }
 
-        # Reset
+        self._reset()
+        return event
+
+    def _reset(self) -> None:
         self.writer = None
         self.recording = False
         self.last_motion_ts = None
@@ -121,4 +239,90 @@ class RecorderManager:
         self.movement_score = 0
         self.last_frame = None
 
-        return event
+    def _finish_pending(self, now: float, final: bool = False) -> List[Dict[str, Any]]:
+        """Eventos pendientes cuyos segmentos ya están cerrados; con `final`, todos."""
+        segments = self.remuxer.completed_segments()
+        events = []
+        while self._pending_events:
+            pending = self._pending_events[0]
+            covered = any(s.end_ts >= pending["ended_at"] for s in segments)
+            # Si ffmpeg quedó caído se cierra el evento con los segmentos que existan
+            expired = now - pending["ended_at"] > 3 * self.remuxer.segment_seconds
+            if not (covered or expired or final):
+                break
+            self._pending_events.pop(0)
+            event = self._build_remux_event(pending, segments)
+            if event:
+                events.append(event)
+
+        if not final:
+            self._prune_segments(segments, now)
+        return events
+
+    def _build_remux_event(self, pending: Dict[str, Any], segments: List[Segment]) -> Optional[Dict[str, Any]]:
+        start = pending["started_at"] - self.preroll_seconds
+        end = pending["ended_at"]
+        selected = [s for s in segments if s.end_ts > start and s.start_ts < end]
+        if not selected:
+            logger.warning("Camera %s: no remuxed segments cover event %s-%s; event dropped", self.camera_id, start, end)
+            return None
+
+        file_path = build_recording_path(self.base_path, self.camera_id)
+        try:
+            self._concat_segments(selected, file_path)
+        except subprocess.CalledProcessError as e:
+            logger.error("Error concatenating segments for camera %s (ffmpeg exit %s): %s", self.camera_id,
+                         e.returncode, (e.stderr or b"").decode(errors="replace").strip()[-500:])
+            return None
+        except Exception as e:
+            logger.error("Error concatenating segments for camera %s: %s", self.camera_id, e)
+            return None
+
+        started_at = selected[0].start_ts
+        ended_at = selected[-1].end_ts
+        return {
+            "file_path": file_path,
+            "started_at": datetime.fromtimestamp(started_at, tz=timezone.utc),
+            "ended_at": datetime.fromtimestamp(ended_at, tz=timezone.utc),
+            "duration_ms": float((ended_at - started_at) * 1000),
+            "movement_score": pending["movement_score"],
+            "created_at": datetime.now(timezone.utc),
+            "file_size": os.path.getsize(file_path) if os.path.exists(file_path) else None,
+            "content_type": "video/mp4",
+        }
+
+    def _concat_segments(self, segments: List[Segment], file_path: str) -> None:
+        if len(segments) == 1:
+            shutil.copyfile(segments[0].path, file_path)
+            return
+
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as listing:
+            for segment in segments:
+                listing.write("file '%s'\n" % segment.path.replace("'", "'\\''"))
+        try:
+            subprocess.run(
+                [self.ffmpeg_binary, "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+                 "-f", "concat", "-safe", "0", "-i", listing.name,
+                 "-c", "copy", "-movflags", "+faststart", file_path],
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+        finally:
+            os.unlink(listing.name)
+
+    def _prune_segments(self, segments: List[Segment], now: float) -> None:
+        # Se conserva lo necesario para el pre-roll y para los eventos abiertos o pendientes
+        keep_from = now - self.preroll_seconds
+        if self.recording and self.event_start_ts is not None:
+            keep_from = min(keep_from, self.event_start_ts - self.preroll_seconds)
+        for pending in self._pending_events:
+            keep_from = min(keep_from, pending["started_at"] - self.preroll_seconds)
+
+        for segment in segments:
+            if segment.end_ts >= keep_from:
+                break
+            try:
+                os.remove(segment.path)
+            except OSError as e:
+                logger.warning("Camera %s: could not remove segment %s: %s", self.camera_id, segment.path, e)
@@ -0,0 +1,191 @@
+import os
+import glob
+import shutil
+import logging
+import threading
+import subprocess
+import time
+import tempfile
+from datetime import datetime, timezone
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_NAME_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def _mtime(path: str, default: float) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return default
+
+
+def ffmpeg_available(binary: str = "ffmpeg") -> bool:
+    return shutil.which(binary) is not None
+
+
+@dataclass
+class Segment:
+    path: str
+    # Inicio del segmento en epoch UTC (tomado del nombre del archivo)
+    start_ts: float
+    # Fin del segmento: inicio del siguiente, o su última escritura si ffmpeg se
+    # cortó antes de abrir otro; None mientras ffmpeg lo está escribiendo
+    end_ts: Optional[float] = None
+
+
+class SegmentRemuxer(threading.Thread):
+    """Graba el stream RTSP de una cámara en segmentos MP4 sin decodificar.
+
+    Lanza ffmpeg con `-c copy`, de modo que los paquetes H.264/H.265 de la
+    cámara se escriben tal cual en segmentos de `segment_seconds` dentro de
+    `spool_dir`. No decide qué se conserva: RecorderManager toma los
+    segmentos cerrados que cubren un evento de movimiento y descarta el resto.
+    Si ffmpeg termina (caída de la cámara, red), se relanza tras
+    `reconnect_delay_seconds`.
+
+    Mientras corre llama a `on_tick` cada `tick_seconds` (también sin frames
+    de archivo ni ffmpeg vivo), para que RecorderManager cierre los eventos
+    sin depender de que lleguen frames. Al arrancar vacía el spool: los
+    segmentos de una ejecución anterior no pertenecen a ningún evento.
+    """
+
+    def __init__(self, camera_id: int, rtsp_url: str, spool_dir: str, segment_seconds: int = 10,
+                 reconnect_delay_seconds: int = 5, ffmpeg_binary: str = "ffmpeg",
+                 on_tick: Optional[Callable[[], None]] = None, tick_seconds: float = 1.0) -> None:
+        super().__init__(daemon=True)
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        self.spool_dir = spool_dir
+        self.segment_seconds = segment_seconds
+        self.reconnect_delay_seconds = reconnect_delay_seconds
+        self.ffmpeg_binary = ffmpeg_binary
+        self.on_tick = on_tick
+        self.tick_seconds = tick_seconds
+        self._stop_event = threading.Event()
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    def _command(self) -> List[str]:
+        command = [self.ffmpeg_binary, "-hide_banner", "-loglevel", "error", "-nostdin"]
+        if self.rtsp_url.startswith("rtsp://"):
+            command += ["-rtsp_transport", "tcp"]
+        return command + [
+            "-i", self.rtsp_url,
+            "-map", "0:v:0",
+            "-c", "copy",
+            "-f", "segment",
+            "-segment_time", str(self.segment_seconds),
+            "-segment_format", "mp4",
+            "-segment_format_options", "movflags=+faststart",
+            "-reset_timestamps", "1",
+            "-strftime", "1",
+            os.path.join(self.spool_dir, f"{SEGMENT_NAME_FORMAT}.mp4"),
+        ]
+
+    @property
+    def running(self) -> bool:
+        process = self._process
+        return process is not None and process.poll() is None
+
+    def run(self) -> None:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._purge_spool()
+        logger.info("SegmentRemuxer STARTED for camera %s (spool=%s, segment=%ss)",
+                    self.camera_id, self.spool_dir, self.segment_seconds)
+
+        while not self._stop_event.is_set():
+            try:
+                # stderr a un archivo: un PIPE que nadie lee bloquea a ffmpeg cuando se llena
+                with tempfile.TemporaryFile() as stderr:
+                    with self._lock:
+                        # stop() pudo llegar después del chequeo del while: sin esto ffmpeg quedaría huérfano
+                        if self._stop_event.is_set():
+                            break
+                        # TZ=UTC para que el nombre de cada segmento sea su inicio en UTC
+                        self._process = subprocess.Popen(
+                            self._command(),
+                            stdout=subprocess.DEVNULL,
+                            stderr=stderr,
+                            env={**os.environ, "TZ": "UTC"},
+                        )
+                    terminated = False
+                    while True:
+                        try:
+                            self._process.wait(timeout=self.tick_seconds)
+                            break
+                        except subprocess.TimeoutExpired:
+                            if self._stop_event.is_set():
+                                # SIGTERM primero; si en un tick no cerró, SIGKILL
+                                if terminated:
+                                    self._process.kill()
+                                else:
+                                    self._process.terminate()
+                                    terminated = True
+                            self._tick()
+                    if self._stop_event.is_set():
+                        break
+                    stderr.seek(0)
+                    logger.warning("Camera %s: ffmpeg exited with code %s: %s. Restarting in %s seconds...",
+                                   self.camera_id, self._process.returncode,
+                                   stderr.read().decode(errors="replace").strip()[-500:],
+                                   self.reconnect_delay_seconds)
+            except Exception as ex:
+                logger.exception("Camera %s: Unexpected remuxer error: %s", self.camera_id, ex)
+
+            self.restarts += 1
+            deadline = time.monotonic() + self.reconnect_delay_seconds
+            while not self._stop_event.wait(min(self.tick_seconds, max(0.0, deadline - time.monotonic()))):
+                self._tick()
+                if time.monotonic() >= deadline:
+                    break
+
+        logger.info("SegmentRemuxer for camera %s STOPPED", self.camera_id)
+
+    def _tick(self) -> None:
+        if self.on_tick is None:
+            return
+        try:
+            self.on_tick()
+        except Exception as ex:
+            logger.exception("Camera %s: Error in remuxer tick: %s", self.camera_id, ex)
+
+    def _purge_spool(self) -> None:
+        for path in glob.glob(os.path.join(self.spool_dir, "*.mp4")):
+            try:
+                os.remove(path)
+            except OSError as ex:
+                logger.warning("Camera %s: could not remove stale segment %s: %s", self.camera_id, path, ex)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                # 'q' no aplica con -nostdin; SIGTERM deja a ffmpeg cerrar el segmento actual
+                self._process.terminate()
+
+    def segments(self) -> List[Segment]:
+        """Segmentos en spool ordenados por inicio; el último sigue abierto (end_ts=None)."""
+        result: List[Segment] = []
+        for path in glob.glob(os.path.join(self.spool_dir, "*.mp4")):
+            name = os.path.splitext(os.path.basename(path))[0]
+            try:
+                start = datetime.strptime(name, SEGMENT_NAME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+            except ValueError:
+                continue
+            result.append(Segment(path=path, start_ts=start))
+
+        result.sort(key=lambda s: s.start_ts)
+        for current, following in zip(result, result[1:]):
+            # Entre ejecuciones de ffmpeg hay un hueco: el segmento termina en su última escritura
+            current.end_ts = min(following.start_ts, _mtime(current.path, following.start_ts))
+        if result and not self.running:
+            # Sin ffmpeg corriendo el último segmento también está cerrado
+            result[-1].end_ts = max(result[-1].start_ts, _mtime(result[-1].path, result[-1].start_ts))
+        return result
+
+    def completed_segments(self) -> List[Segment]:
+        return [s for s in self.segments() if s.end_ts is not None]
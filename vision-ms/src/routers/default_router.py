@@ -2,40 +2,151 @@ from __future__ import annotations
 from fastapi import APIRouter
 from motor.motor_asyncio import AsyncIOMotorDatabase
 import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import List
 from ..helpers.dto.api_dto import ApiReqDTO
+from ..helpers.constants.constants import constants
 from ..ingest.ingest.manager import CameraManager
+from ..ingest.ingest.probe import probe_stream
 from ..face_recognition.messaging.rabbit_manager import FaceRecognitionRabbitManager
 from ..recordings.messaging.rabbit_manager import RecordingRabbitManager
-from ..face_recognition.recognition.face_engine import FaceEngine
+from ..helpers.utils.engine_pool import FaceEnginePool
+
+logger = logging.getLogger(__name__)
 
 class DefaultRouter:
-    def __init__(self, db: AsyncIOMotorDatabase, engine: FaceEngine, main_loop: asyncio.AbstractEventLoop): 
+    def __init__(self, db: AsyncIOMotorDatabase, engine: FaceEnginePool, main_loop: asyncio.AbstractEventLoop): 
         self.camera_manager = CameraManager()
         self.face_recognition_rm = FaceRecognitionRabbitManager(db=db, engine=engine, main_loop=main_loop)
         self.recording_rm = RecordingRabbitManager(db=db, main_loop=main_loop)
+        # Operaciones por lote: probe RTSP y arranque de cámaras con paralelismo acotado
+        self._batch_executor = ThreadPoolExecutor(max_workers=constants["INGEST_BATCH_CONCURRENCY"],
+                                                  thread_name_prefix="camera-batch")
         self.router = APIRouter(prefix="/vision-services", tags=["Vision services"])
         self._register_routes()
         
     
     def stop_all(self):
-        self.camera_manager.stop_all()
+        self._batch_executor.shutdown(wait=False, cancel_futures=True)
+        self.camera_manager.shutdown()
         self.face_recognition_rm.stop_all()
         self.recording_rm.stop_all()
         return {"message": "OK"}
 
+    async def flush(self):
+        """Persistencia pendiente (avistamientos y escrituras write-behind) antes de apagar."""
+        await self.face_recognition_rm.flush()
+
+    def _steps(self, req: ApiReqDTO) -> tuple:
+        """(nombre, start, stop) de cada componente de una cámara, en orden de arranque."""
+        return (
+            ("ingest",
+             lambda: self.camera_manager.start_camera(camera_id=req.cameraId, user_id=req.userId, rtsp_url=req.rtspUrl,
+                                                      target_fps=req.analyticsFps, sub_stream_url=req.subStreamUrl),
+             lambda: self.camera_manager.stop_camera(camera_id=req.cameraId)),
+            ("face_recognition", lambda: self.face_recognition_rm.start(req=req), lambda: self.face_recognition_rm.stop(req)),
+            ("recordings", lambda: self.recording_rm.start(req=req), lambda: self.recording_rm.stop(req=req)),
+        )
+
+    def _stop_steps(self, req: ApiReqDTO, steps) -> List[str]:
+        # Cada componente se detiene aunque otro falle (p.ej. ingest ya parado con consumers vivos)
+        errors = []
+        for name, _, stop in steps:
+            try:
+                stop()
+            except KeyError:
+                errors.append(f"{name}: Camera {req.cameraId} not found")
+            except Exception as e:
+                logger.error("Batch stop (%s) failed for camera %s: %s", name, req.cameraId, e)
+                errors.append(f"{name}: {e}")
+        return errors
+
+    def _start_one(self, req: ApiReqDTO, probe: bool) -> dict:
+        result = {"id": req.cameraId, "ok": False, "message": "OK", "probe": None}
+        if probe:
+            # Un sub-stream inválido también deja la cámara publicando sin analítica
+            streams = [("probe", "Probe", req.rtspUrl)]
+            if req.subStreamUrl:
+                streams.append(("subStreamProbe", "Sub-stream probe", req.subStreamUrl))
+            for field, label, url in streams:
+                try:
+                    probed = probe_stream(url, constants["INGEST_OPEN_TIMEOUT_MS"])
+                except Exception as e:
+                    logger.error("Batch probe failed for camera %s: %s", req.cameraId, e)
+                    result["message"] = str(e)
+                    return result
+                result[field] = asdict(probed)
+                if not probed.ok:
+                    result["message"] = f"{label} failed: {probed.error}"
+                    return result
+
+        started = []
+        for step in self._steps(req):
+            name, start, _ = step
+            try:
+                start()
+            except Exception as e:
+                logger.error("Batch start (%s) failed for camera %s: %s", name, req.cameraId, e)
+                result["message"] = f"{name}: {e}"
+                # Deshace lo ya arrancado para no dejar el ingest publicando sin consumers
+                errors = self._stop_steps(req, reversed(started))
+                if errors:
+                    result["message"] += f" (rollback: {'; '.join(errors)})"
+                return result
+            started.append(step)
+        result["ok"] = True
+        return result
+
+    def _stop_one(self, req: ApiReqDTO) -> dict:
+        errors = self._stop_steps(req, self._steps(req))
+        return {"id": req.cameraId, "ok": not errors, "message": "; ".join(errors) or "OK"}
+
+    async def _run_batch(self, fn, reqs: List[ApiReqDTO], *args) -> dict:
+        loop = asyncio.get_running_loop()
+        # Un cameraId repetido en el mismo batch correría dos veces en paralelo: solo va el primero
+        unique = {}
+        for req in reqs:
+            unique.setdefault(req.cameraId, req)
+        done = await asyncio.gather(*[
+            loop.run_in_executor(self._batch_executor, fn, req, *args) for req in unique.values()
+        ])
+        by_request = {id(req): result for req, result in zip(unique.values(), done)}
+        results = [
+            by_request.get(id(req)) or {"id": req.cameraId, "ok": False, "message": "Duplicate cameraId in batch"}
+            for req in reqs
+        ]
+        succeeded = sum(1 for r in results if r["ok"])
+        return {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
+
     def _register_routes(self):
 
         @self.router.get("/health")
         def health():
             return {"status": "ok"}
 
+        @self.router.get("/status")
+        def status():
+            return {"cameras": self.camera_manager.status(), "processes": self.camera_manager.health(),
+                    "face_recognition": self.face_recognition_rm.stats()}
+
         @self.router.post("/start")
         async def start(req: ApiReqDTO):
-            self.camera_manager.start_camera(camera_id=req.cameraId, user_id=req.userId, rtsp_url=req.rtspUrl)
+            self.camera_manager.start_camera(camera_id=req.cameraId, user_id=req.userId, rtsp_url=req.rtspUrl,
+                                          target_fps=req.analyticsFps, sub_stream_url=req.subStreamUrl)
             self.face_recognition_rm.start(req=req)
             self.recording_rm.start(req=req)
             return {"id": req.cameraId, "message": "OK"}
         
+        @self.router.post("/start-batch")
+        async def start_batch(reqs: List[ApiReqDTO], probe: bool = True):
+            return await self._run_batch(self._start_one, reqs, probe)
+
+        @self.router.post("/stop-batch")
+        async def stop_batch(reqs: List[ApiReqDTO]):
+            return await self._run_batch(self._stop_one, reqs)
+
         @self.router.post("/restart")
         async def restart(req: ApiReqDTO):
             self.camera_manager.restart_camera(camera_id=req.cameraId)
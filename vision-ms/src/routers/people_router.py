@@ -3,10 +3,10 @@ from fastapi import APIRouter, HTTPException, UploadFile, File, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from ..face_registry.dto.person_dto import PersonDTO
 from ..face_registry.services.person_service import PersonService
-from ..face_recognition.recognition.face_engine import FaceEngine
+from ..helpers.utils.engine_pool import FaceEnginePool
 
 class PersonRouter:
-    def __init__(self, db: AsyncIOMotorDatabase, engine: FaceEngine): 
+    def __init__(self, db: AsyncIOMotorDatabase, engine: FaceEnginePool): 
         self.person_service = PersonService(db=db, engine=engine)
         self.router = APIRouter(prefix="/person-services", tags=["Person services"])
         self._register_routes()
@@ -34,7 +34,7 @@ class PersonRouter:
         
         @self.router.delete("/{person_id}")
         async def delete(person_id: int):
-            res = await self.person_service.delete(person_id==person_id)
+            res = await self.person_service.delete(person_id=person_id)
             return {"data": res, "message": "OK"}
         
         @self.router.put("/{person_id}/embeddings")
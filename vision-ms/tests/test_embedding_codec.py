@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from bson.binary import Binary
+from src.helpers.constants.constants import constants
+from src.helpers.utils.embedding_codec import (
+    DTYPE_FLOAT16, DTYPE_FLOAT32, EMBEDDING_SUBTYPE, HEADER_SIZE,
+    decode_embedding, decode_embedding_list, embedding_header, encode_embedding, encode_embedding_doc,
+    encode_embeddings_doc, is_encoded, legacy_migration,
+)
+
+
+def vector(dim=512, seed=0):
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def test_float32_round_trip_is_exact():
+    v = vector()
+    encoded = encode_embedding(v, dtype=DTYPE_FLOAT32)
+    assert isinstance(encoded, Binary) and encoded.subtype == EMBEDDING_SUBTYPE
+    assert len(encoded) == HEADER_SIZE + v.size * 4
+    decoded = decode_embedding(encoded)
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, v)
+
+
+def test_float16_round_trip_within_precision():
+    v = vector()
+    encoded = encode_embedding(v, dtype=DTYPE_FLOAT16)
+    assert len(encoded) == HEADER_SIZE + v.size * 2
+    decoded = decode_embedding(encoded)
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, v, rtol=1e-3, atol=1e-3)
+
+
+def test_list_round_trip():
+    values = [0.25, -0.5, 1.0]
+    assert decode_embedding_list(encode_embedding(values, dtype=DTYPE_FLOAT32)) == values
+
+
+def test_header_fields():
+    header = embedding_header(encode_embedding(vector(128), dtype=DTYPE_FLOAT16, model_version=7))
+    assert header.dtype == "float16"
+    assert header.dim == 128
+    assert header.model_version == 7
+
+
+def test_header_defaults_to_configured_model_version():
+    header = embedding_header(encode_embedding(vector(8), dtype=DTYPE_FLOAT32))
+    assert header.model_version == constants["FACE_EMBEDDING_MODEL_VERSION"]
+
+
+def test_truncated_and_unknown_headers_raise():
+    encoded = bytes(encode_embedding(vector(8), dtype=DTYPE_FLOAT32))
+    with pytest.raises(ValueError):
+        embedding_header(encoded[:HEADER_SIZE - 1])
+    bad_version = encoded[:2] + bytes([99]) + encoded[3:]
+    with pytest.raises(ValueError):
+        embedding_header(bad_version)
+
+
+def test_unsupported_dtype_raises():
+    with pytest.raises(ValueError):
+        encode_embedding(vector(8), dtype="int8")
+
+
+def test_legacy_list_is_not_encoded_and_still_decodes():
+    legacy = [0.1, 0.2, 0.3]
+    assert not is_encoded(legacy)
+    assert embedding_header(legacy) is None
+    np.testing.assert_allclose(decode_embedding(legacy), np.asarray(legacy, dtype=np.float32))
+    assert decode_embedding(None).size == 0
+
+
+def test_encode_doc_is_idempotent():
+    emb = {"embedding": [0.1, 0.2]}
+    encode_embedding_doc(emb)
+    first = emb["embedding"]
+    assert is_encoded(first)
+    encode_embedding_doc(emb)
+    assert emb["embedding"] is first
+
+    groups = {"manual": [{"embedding": [1.0]}], "auto": [{"embedding": first}, {"embedding": None}]}
+    encode_embeddings_doc(groups)
+    assert is_encoded(groups["manual"][0]["embedding"])
+    assert groups["auto"][0]["embedding"] is first
+    assert groups["auto"][1]["embedding"] is None
+
+
+def test_legacy_migration_targets_only_legacy_vectors():
+    encoded = encode_embedding([0.5, 0.5])
+    doc = {
+        "_id": 42,
+        "embeddings": {
+            "manual": [{"embedding": [0.1, 0.2]}],
+            "auto": [{"embedding": encoded}, {"embedding": [0.3, 0.4]}],
+        },
+    }
+    op = legacy_migration(doc)
+    document = op._doc
+    assert op._filter == {"_id": 42}
+    sets = document["$set"]
+    assert set(sets) == {"embeddings.manual.$[e0].embedding", "embeddings.auto.$[e1].embedding"}
+    assert all(is_encoded(value) for value in sets.values())
+    # Cada vector se ubica por su valor, no por posición
+    assert op._array_filters == [{"e0.embedding": [0.1, 0.2]}, {"e1.embedding": [0.3, 0.4]}]
+
+
+def test_legacy_migration_none_without_legacy_vectors():
+    doc = {"_id": 1, "embeddings": {"manual": [{"embedding": encode_embedding([1.0])}], "auto": []}}
+    assert legacy_migration(doc) is None
+    assert legacy_migration({"_id": 2}) is None
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from src.face_recognition.recognition.embedding_gallery import (
+    MATCH_CENTROID, MATCH_MAX, MATCH_POSE, MATCH_TOPK, NO_MATCH_DISTANCE, EmbeddingGallery,
+)
+from src.face_recognition.recognition.vector_index import INDEX_EXACT, INDEX_IVF
+from src.helpers.constants.constants import constants
+
+DIM = 16
+
+
+def unit(seed):
+    v = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def near(v, seed, noise=0.1):
+    w = v + noise * unit(seed)
+    return w / np.linalg.norm(w)
+
+
+def gallery(mode, index_kind=INDEX_EXACT, top_k=3, max_embeddings=50):
+    return EmbeddingGallery(dim=DIM, index_kind=index_kind, match_mode=mode, top_k=top_k, max_embeddings=max_embeddings)
+
+
+@pytest.mark.parametrize("mode", [MATCH_CENTROID, MATCH_MAX, MATCH_TOPK, MATCH_POSE])
+def test_matches_closest_person_in_every_mode(mode):
+    g = gallery(mode, top_k=2)
+    alice, bob = unit(1), unit(2)
+    g.set_person("alice", [near(alice, 10), near(alice, 11)], buckets=["FRONTAL", "PROFILE_LEFT"])
+    g.set_person("bob", [near(bob, 12), near(bob, 13)], buckets=["FRONTAL", "FRONTAL"])
+
+    (first, d1), (second, d2) = g.match_many([alice, bob])
+    assert (first, second) == ("alice", "bob")
+    assert 0.0 <= d1 < 0.1 and 0.0 <= d2 < 0.1
+
+
+def test_empty_gallery_and_invalid_queries_do_not_match():
+    g = gallery(MATCH_CENTROID)
+    assert g.match(unit(1)) == (None, NO_MATCH_DISTANCE)
+    g.add_embedding("alice", unit(1))
+    assert g.match_many([np.zeros(DIM), np.ones(DIM + 1)]) == [(None, NO_MATCH_DISTANCE)] * 2
+
+
+def test_max_mode_matches_any_stored_embedding():
+    # Dos embeddings opuestos no tienen centroide; max sí los encuentra
+    a, b = unit(1), unit(2)
+    opposite = -a
+    centroid = gallery(MATCH_CENTROID)
+    best = gallery(MATCH_MAX)
+    for g in (centroid, best):
+        g.set_person("alice", [a, opposite])
+        g.set_person("bob", [b])
+    assert best.match(a)[0] == "alice"
+    assert best.match(a)[1] == pytest.approx(0.0, abs=1e-5)
+    assert centroid.match(a)[0] == "bob"
+
+
+def test_topk_divides_by_fixed_k():
+    g = gallery(MATCH_TOPK, top_k=3)
+    query = unit(1)
+    # Una sola muestra idéntica no le gana a tres muy parecidas
+    g.set_person("single", [query])
+    g.set_person("many", [near(query, s, noise=0.05) for s in (20, 21, 22)])
+    person, distance = g.match(query)
+    assert person == "many"
+    assert distance < 0.05
+
+
+def test_ring_keeps_last_embeddings():
+    g = gallery(MATCH_MAX, max_embeddings=2)
+    a, b, c = unit(1), unit(2), unit(3)
+    g.add_embedding("alice", a)
+    g.add_embedding("alice", b)
+    g.add_embedding("alice", c)
+    g.set_person("bob", [near(a, 30, noise=0.5)])
+    assert len(g.entries["alice"].embeddings) == 2
+    # `a` salió del ring: la consulta `a` ya no coincide exacto con alice
+    assert g.match(c) == ("alice", pytest.approx(0.0, abs=1e-5))
+    assert g.match(a)[1] > 1e-3
+
+
+def test_remove_person_from_every_structure():
+    for mode in (MATCH_CENTROID, MATCH_TOPK, MATCH_POSE):
+        g = gallery(mode)
+        g.set_person("alice", [unit(1)])
+        g.set_person("bob", [unit(2)])
+        g.remove("alice")
+        assert "alice" not in g and len(g) == 1
+        assert g.match(unit(1))[0] == "bob"
+
+
+def test_ivf_gallery_matches_like_exact(monkeypatch):
+    monkeypatch.setitem(constants, "FACE_MATCH_IVF_MIN_TRAIN_SIZE", 64)
+    people = {i: unit(100 + i) for i in range(300)}
+    exact, ivf = gallery(MATCH_CENTROID), gallery(MATCH_CENTROID, index_kind=INDEX_IVF)
+    for g in (exact, ivf):
+        for person_id, vector in people.items():
+            g.add_embedding(person_id, vector)
+    ivf.index.wait_rebuild()
+    assert ivf.index.trained
+    ivf.index.nprobe = ivf.index.nlist_trained
+    queries = [near(people[i], 500 + i) for i in range(0, 300, 7)]
+    assert [p for p, _ in ivf.match_many(queries)] == [p for p, _ in exact.match_many(queries)]
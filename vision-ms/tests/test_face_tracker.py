@@ -0,0 +1,65 @@
+import pytest
+from src.face_recognition.recognition.face_tracker import FaceTracker, face_quality
+
+
+def box(x, y, side=120):
+    return [x, y, x + side, y + side]
+
+
+def test_new_face_is_recognized_and_keeps_its_track():
+    tracker = FaceTracker(recognize_every=5)
+    ids, recognize = tracker.update([box(0, 0)], [0.9])
+    assert recognize == [True]
+    for step in range(1, 4):
+        again, recognize = tracker.update([box(step * 5, 0)], [0.9])
+        assert again == ids and recognize == [False]
+
+
+def test_rerecognizes_every_n_frames_and_on_quality_gain():
+    tracker = FaceTracker(recognize_every=3, quality_gain=1.25)
+    tracker.update([box(0, 0, side=60)], [0.9])
+    assert tracker.update([box(0, 0, side=60)], [0.9])[1] == [False]
+    # Calidad mucho mejor (rostro más grande): se re-reconoce antes de tiempo
+    assert tracker.update([box(0, 0, side=100)], [0.9])[1] == [True]
+    assert tracker.update([box(0, 0, side=100)], [0.9])[1] == [False]
+    assert tracker.update([box(0, 0, side=100)], [0.9])[1] == [False]
+    assert tracker.update([box(0, 0, side=100)], [0.9])[1] == [True]
+
+
+def test_two_faces_are_tracked_apart():
+    tracker = FaceTracker()
+    ids, _ = tracker.update([box(0, 0), box(400, 0)], [0.9, 0.9])
+    swapped, recognize = tracker.update([box(405, 0), box(5, 0)], [0.9, 0.9])
+    assert swapped == [ids[1], ids[0]]
+    assert recognize == [False, False]
+
+
+def test_nearby_face_without_overlap_keeps_track_by_centroid():
+    tracker = FaceTracker(iou_threshold=0.3, centroid_ratio=0.5)
+    ids, _ = tracker.update([box(0, 0, side=100)], [0.9])
+    # Se movió 45px: IoU bajo pero centro cerca respecto al tamaño
+    assert tracker.update([box(45, 0, side=100)], [0.9])[0] == ids
+    assert tracker.update([box(400, 0, side=100)], [0.9])[0] != ids
+
+
+def test_identity_survives_until_track_expires():
+    tracker = FaceTracker(max_missed=2)
+    (track_id,), _ = tracker.update([box(0, 0)], [0.9])
+    tracker.set_identity(track_id, "alice", 0.2)
+    assert tracker.identity(track_id) == ("alice", 0.2)
+    for _ in range(2):
+        tracker.update([], [])
+    assert tracker.identity(track_id) == ("alice", 0.2)
+    tracker.update([], [])
+    assert tracker.identity(track_id) == (None, None)
+
+
+def test_stats_and_quality():
+    tracker = FaceTracker(recognize_every=100)
+    for _ in range(4):
+        tracker.update([box(0, 0)], [0.9])
+    stats = tracker.stats()
+    assert stats["detections"] == 4 and stats["recognitions"] == 1
+    assert stats["recognition_ratio"] == 0.25
+    assert face_quality(box(0, 0, side=56), 0.8) == pytest.approx(0.4)
+    assert face_quality(box(0, 0, side=224), 0.8) == pytest.approx(0.8)
@@ -0,0 +1,75 @@
+import base64
+import json
+import cv2
+import numpy as np
+import pytest
+from src.helpers.dto.frame_dto import FrameMessageDTO
+from src.helpers.utils.frame_codec import (
+    CONTENT_TYPE_FRAME, CONTENT_TYPE_JSON, HEADER_SIZE, WIRE_FORMAT_JSON,
+    decode_frame, decode_frame_image, encode_frame,
+)
+
+
+def jpeg(width=64, height=48):
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :width // 2] = (0, 0, 255)
+    ok, encoded = cv2.imencode(".jpg", image)
+    assert ok
+    return encoded
+
+
+def message(frame, camera_id=7, user_id=3):
+    return FrameMessageDTO(camera_id=camera_id, user_id=user_id, timestamp=1700000000.25, fps=12.5,
+                           width=64, height=48, frame=frame)
+
+
+def test_binary_round_trip():
+    frame = jpeg()
+    body, content_type = encode_frame(message(frame))
+    assert content_type == CONTENT_TYPE_FRAME
+    assert len(body) == HEADER_SIZE + frame.size
+
+    decoded = decode_frame(body, content_type)
+    assert (decoded.camera_id, decoded.user_id) == (7, 3)
+    assert decoded.timestamp == 1700000000.25
+    assert decoded.fps == 12.5
+    assert (decoded.width, decoded.height) == (64, 48)
+    # Vista sobre el body, sin copia
+    assert isinstance(decoded.frame, memoryview)
+    assert bytes(decoded.frame) == frame.tobytes()
+    assert decode_frame_image(decoded).shape == (48, 64, 3)
+
+
+def test_binary_round_trip_without_ids():
+    body, content_type = encode_frame(message(jpeg(), camera_id=None, user_id=None))
+    decoded = decode_frame(body, content_type)
+    assert decoded.camera_id is None and decoded.user_id is None
+
+
+def test_json_round_trip():
+    frame = jpeg().tobytes()
+    body, content_type = encode_frame(message(frame), wire_format=WIRE_FORMAT_JSON)
+    assert content_type == CONTENT_TYPE_JSON
+    decoded = decode_frame(body, content_type)
+    assert decoded.frame == frame
+    assert (decoded.camera_id, decoded.user_id, decoded.fps) == (7, 3, 12.5)
+
+
+def test_legacy_message_without_content_type():
+    frame = jpeg().tobytes()
+    body = json.dumps({"camera_id": 1, "user_id": 2, "frame": base64.b64encode(frame).decode()}).encode()
+    decoded = decode_frame(body, None)
+    assert decoded.frame == frame
+    assert decoded.timestamp == 0.0
+
+
+def test_truncated_and_foreign_headers_raise():
+    body, content_type = encode_frame(message(jpeg()))
+    with pytest.raises(ValueError):
+        decode_frame(body[:HEADER_SIZE - 1], content_type)
+    with pytest.raises(ValueError):
+        decode_frame(b"XXXX" + body[4:], content_type)
+
+
+def test_invalid_jpeg_decodes_to_none():
+    assert decode_frame_image(message(b"not a jpeg")) is None
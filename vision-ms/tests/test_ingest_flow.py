@@ -0,0 +1,72 @@
+import threading
+import time
+from src.ingest.ingest.frame_slot import LatestFrameSlot
+from src.ingest.ingest.rate_controller import AdaptiveRateController
+
+
+def test_slot_keeps_latest_frame_and_counts_drops():
+    slot = LatestFrameSlot()
+    slot.put("f1", 1.0)
+    slot.put("f2", 2.0)
+    slot.put("f3", 3.0)
+    item = slot.take(timeout=0.1)
+    assert (item.frame, item.timestamp, item.seq) == ("f3", 3.0, 3)
+    assert slot.dropped == 2
+    assert slot.take_nowait() is None
+
+
+def test_slot_take_waits_for_producer():
+    slot = LatestFrameSlot()
+    threading.Timer(0.05, slot.put, args=("late", 1.0)).start()
+    assert slot.take(timeout=2.0).frame == "late"
+    assert slot.take(timeout=0.01) is None
+
+
+def test_slots_share_condition():
+    cond = threading.Condition()
+    main, sub = LatestFrameSlot(cond), LatestFrameSlot(cond)
+    sub.put("sub", 1.0)
+    main.clear()
+    assert main.take_nowait() is None
+    assert sub.take_nowait().frame == "sub"
+
+
+def controller(**kwargs):
+    options = dict(min_fps=2.0, latency_threshold_ms=500.0, step_fps=1.0, adjust_interval=0.0)
+    options.update(kwargs)
+    rate = AdaptiveRateController(**options)
+    rate.set_source_fps(16.0)
+    return rate
+
+
+def test_rate_halves_under_pressure_and_recovers_additively():
+    rate = controller()
+    rate.update(blocked=True, in_flight_ratio=0.0, confirm_latency_ms=0.0)
+    assert rate.current_fps == 8.0
+    rate.update(blocked=False, in_flight_ratio=0.9, confirm_latency_ms=0.0)
+    assert rate.current_fps == 4.0
+    rate.update(blocked=False, in_flight_ratio=0.0, confirm_latency_ms=900.0)
+    assert rate.current_fps == 2.0
+    rate.update(blocked=True, in_flight_ratio=0.0, confirm_latency_ms=0.0)
+    assert rate.current_fps == 2.0
+    for _ in range(20):
+        rate.update(blocked=False, in_flight_ratio=0.0, confirm_latency_ms=0.0)
+    assert rate.current_fps == 16.0
+
+
+def test_rate_adjusts_at_most_once_per_interval():
+    rate = controller(adjust_interval=60.0)
+    rate.update(blocked=True, in_flight_ratio=0.0, confirm_latency_ms=0.0)
+    rate.update(blocked=True, in_flight_ratio=0.0, confirm_latency_ms=0.0)
+    assert rate.current_fps == 8.0
+
+
+def test_allow_throttles_below_source_rate():
+    rate = controller()
+    assert all(rate.allow() for _ in range(10))
+    rate.update(blocked=True, in_flight_ratio=0.0, confirm_latency_ms=0.0)
+    assert rate.allow()
+    assert not rate.allow()
+    assert rate.throttled == 1
+    time.sleep(1.0 / rate.current_fps + 0.01)
+    assert rate.allow()
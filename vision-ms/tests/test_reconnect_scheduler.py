@@ -0,0 +1,85 @@
+import threading
+from src.ingest.ingest.reconnect_scheduler import (
+    STATE_BACKOFF, STATE_CONNECTING, STATE_HIBERNATING, STATE_STREAMING, STATE_WAITING, ReconnectScheduler,
+)
+
+
+def scheduler(**kwargs):
+    options = dict(max_concurrent_opens=2, base_delay_seconds=1.0, max_delay_seconds=60.0, jitter_ratio=0.0)
+    options.update(kwargs)
+    return ReconnectScheduler(**options)
+
+
+def test_backoff_doubles_up_to_cap():
+    s = scheduler()
+    delays = [s.mark_failed("cam/main", "timeout") for _ in range(9)]
+    assert delays == [1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 60.0, 60.0, 60.0]
+    state = s.state("cam/main")
+    assert state["state"] == STATE_BACKOFF
+    assert state["attempts"] == 9
+    assert state["last_error"] == "timeout"
+
+
+def test_long_outage_does_not_overflow():
+    s = scheduler()
+    for _ in range(2000):
+        delay = s.mark_failed("cam/main", "down")
+    assert delay == 60.0
+
+
+def test_jitter_only_shortens_delay():
+    s = scheduler(jitter_ratio=0.5)
+    for attempt in range(1, 12):
+        delay = s.mark_failed("cam/main", "down")
+        nominal = min(60.0, 2.0 ** (attempt - 1))
+        assert nominal * 0.5 <= delay <= nominal
+
+
+def test_first_frame_and_hibernation_reset_backoff():
+    s = scheduler()
+    s.mark_failed("cam/main", "down")
+    s.mark_failed("cam/main", "down")
+    s.mark_streaming("cam/main")
+    assert s.state("cam/main")["state"] == STATE_STREAMING
+    assert s.mark_failed("cam/main", "down") == 1.0
+    s.mark_hibernating("cam/main")
+    assert s.state("cam/main")["state"] == STATE_HIBERNATING
+    assert s.mark_failed("cam/main", "down") == 1.0
+
+
+def test_open_slots_limit_concurrent_opens():
+    s = scheduler(max_concurrent_opens=1)
+    stop = threading.Event()
+    assert s.acquire_open("a/main", stop)
+    assert s.state("a/main")["state"] == STATE_CONNECTING
+
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(s.acquire_open("b/main", stop)))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive() and s.state("b/main")["state"] == STATE_WAITING
+
+    s.release_open("a/main", opened=True)
+    waiter.join(2.0)
+    assert acquired == [True]
+    assert s.state("a/main")["state"] == STATE_STREAMING
+
+
+def test_acquire_gives_up_when_stopped():
+    s = scheduler(max_concurrent_opens=1)
+    stop = threading.Event()
+    assert s.acquire_open("a/main", stop)
+    stop.set()
+    assert s.acquire_open("b/main", stop) is False
+
+
+def test_remove_respects_owner():
+    s = scheduler()
+    old, new = object(), object()
+    s.claim("cam/main", old)
+    s.claim("cam/main", new)
+    s.mark_failed("cam/main", "down")
+    s.remove("cam/main", owner=old)
+    assert s.state("cam/main")["attempts"] == 1
+    s.remove("cam/main", owner=new)
+    assert s.state("cam/main")["attempts"] == 0
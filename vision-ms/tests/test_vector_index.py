@@ -0,0 +1,124 @@
+import threading
+import numpy as np
+from src.face_recognition.recognition.vector_index import (
+    INDEX_EXACT, INDEX_IVF, ExactIndex, IVFIndex, create_index,
+)
+
+DIM = 32
+
+
+def vectors(count, seed=0):
+    rng = np.random.default_rng(seed)
+    # Vectores agrupados para que los clusters del k-means tengan sentido
+    centers = rng.standard_normal((20, DIM)).astype(np.float32)
+    data = centers[rng.integers(0, len(centers), count)] + 0.3 * rng.standard_normal((count, DIM)).astype(np.float32)
+    return (data / np.linalg.norm(data, axis=1, keepdims=True)).astype(np.float32)
+
+
+def build(index, data, start=0):
+    for key, vector in enumerate(data, start=start):
+        index.upsert(key, vector)
+    return index
+
+
+def ivf(**kwargs):
+    options = dict(nlist=16, nprobe=4, min_train_size=256, background_rebuild=False)
+    options.update(kwargs)
+    return IVFIndex(DIM, **options)
+
+
+def top_keys(index, queries, k):
+    rows, _ = index.search(queries, k=k)
+    return [set(index.keys[r] for r in row if r >= 0) for row in rows]
+
+
+def test_exact_index_remove_moves_last_row():
+    index = build(ExactIndex(DIM), vectors(4))
+    last_vector = index.matrix[3].copy()
+    assert index.remove(1) == (1, 3)
+    assert len(index) == 3 and 1 not in index
+    assert index.row_of(3) == 1
+    np.testing.assert_array_equal(index.matrix[1], last_vector)
+    assert index.remove(1) is None
+
+
+def test_ivf_below_train_size_is_exact():
+    data = vectors(100)
+    index = build(ivf(), data)
+    exact = build(ExactIndex(DIM), data)
+    assert not index.trained
+    assert top_keys(index, data[:10], 5) == top_keys(exact, data[:10], 5)
+
+
+def test_ivf_full_probe_matches_exact_top_k():
+    data = vectors(1000)
+    index = build(ivf(), data)
+    exact = build(ExactIndex(DIM), data)
+    assert index.trained
+    index.nprobe = index.nlist_trained
+    queries = vectors(50, seed=1)
+    assert top_keys(index, queries, 5) == top_keys(exact, queries, 5)
+
+
+def test_ivf_partial_probe_recall():
+    data = vectors(2000)
+    index = build(ivf(nprobe=8), data)
+    exact = build(ExactIndex(DIM), data)
+    queries = vectors(200, seed=2)
+    ivf_keys = top_keys(index, queries, 1)
+    exact_keys = top_keys(exact, queries, 1)
+    recall = np.mean([a == b for a, b in zip(ivf_keys, exact_keys)])
+    assert recall >= 0.9
+
+
+def test_ivf_rebuilds_on_growth_and_removals():
+    index = build(ivf(rebuild_growth=2.0), vectors(256))
+    assert index.rebuilds == 1 and index.stats()["vectors"] == 256
+    build(index, vectors(256, seed=3), start=256)
+    assert index.rebuilds == 2
+    for key in range(256):
+        index.remove(key)
+    assert index.rebuilds == 3
+    assert int(index.list_sizes().sum()) == len(index) == 256
+
+
+def test_background_rebuild_keeps_index_usable_and_reassigns_changed_rows():
+    data = vectors(600)
+    index = ivf(background_rebuild=True)
+    # Ocupa el thread de entrenamiento para que el re-entrenamiento quede pendiente
+    release = threading.Event()
+    blocker = IVFIndex._executor().submit(release.wait)
+    try:
+        build(index, data[:256])
+        assert index.stats()["rebuilding"] and not index.trained
+        # Sin entrenar: búsqueda exacta mientras tanto
+        assert index.search(data[:1], k=1)[0][0, 0] == index.row_of(0)
+        # Altas, cambios y bajas (swap con la última fila) durante el entrenamiento
+        build(index, data[256:300], start=256)
+        index.upsert(5, data[400])
+        index.remove(10)
+        index.remove(299)
+    finally:
+        release.set()
+        blocker.result()
+    index.wait_rebuild()
+
+    assert index.trained and not index.stats()["rebuilding"]
+    assert index.rebuilds == 1
+    size = len(index)
+    expected = np.argmax(index.matrix @ index._centroids.T, axis=1)
+    np.testing.assert_array_equal(index._assignment[:size], expected)
+    assert int(index.list_sizes().sum()) == size
+
+    exact = ExactIndex(DIM)
+    for key in index.keys:
+        exact.upsert(key, index.matrix[index.row_of(key)])
+    index.nprobe = index.nlist_trained
+    queries = vectors(20, seed=4)
+    assert top_keys(index, queries, 3) == top_keys(exact, queries, 3)
+
+
+def test_create_index_kinds():
+    assert isinstance(create_index(INDEX_IVF, DIM), IVFIndex)
+    assert type(create_index(INDEX_EXACT, DIM)) is ExactIndex
+    assert type(create_index("unknown", DIM)) is ExactIndex
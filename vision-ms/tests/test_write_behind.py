@@ -0,0 +1,147 @@
+import asyncio
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from src.face_recognition.repository.write_behind import WriteBehindQueue
+
+
+class FakeCollection:
+    """Colección mínima: registra cada bulk_write y puede fallar con writeErrors."""
+
+    name = "test"
+
+    def __init__(self, fail_indexes=(), raise_error=None):
+        self.calls = []
+        self.fail_indexes = set(fail_indexes)
+        self.raise_error = raise_error
+
+    async def bulk_write(self, ops, ordered):
+        self.calls.append((list(ops), ordered))
+        if self.raise_error is not None:
+            raise self.raise_error
+        if self.fail_indexes:
+            errors = [{"index": i, "errmsg": "duplicate key"} for i in sorted(self.fail_indexes)]
+            raise BulkWriteError({"writeErrors": errors})
+
+
+def make_queue(collection, max_batch=100, max_latency_ms=20, max_queue=0):
+    return WriteBehindQueue(collection, max_batch=max_batch, max_latency_ms=max_latency_ms, max_queue=max_queue)
+
+
+def update(key):
+    return UpdateOne({"_id": key}, {"$inc": {"n": 1}})
+
+
+def test_distinct_keys_write_unordered_batch():
+    async def scenario():
+        col = FakeCollection()
+        queue = make_queue(col)
+        for key in (1, 2, 3):
+            await queue.enqueue(update(key), key=key)
+        await queue.close()
+        return col
+
+    col = asyncio.run(scenario())
+    assert len(col.calls) == 1
+    ops, ordered = col.calls[0]
+    assert len(ops) == 3
+    assert ordered is False
+
+
+def test_repeated_key_forces_ordered_batch():
+    async def scenario():
+        col = FakeCollection()
+        queue = make_queue(col)
+        for key in (1, 2, 1):
+            await queue.enqueue(update(key), key=key)
+        await queue.close()
+        return col
+
+    col = asyncio.run(scenario())
+    assert [ordered for _, ordered in col.calls] == [True]
+
+
+def test_batches_split_at_max_batch():
+    async def scenario():
+        col = FakeCollection()
+        queue = make_queue(col, max_batch=2)
+        for key in range(5):
+            await queue.enqueue(update(key), key=key)
+        await queue.close()
+        return col, queue
+
+    col, queue = asyncio.run(scenario())
+    assert [len(ops) for ops, _ in col.calls] == [2, 2, 1]
+    assert queue.stats()["ops"] == 5
+
+
+def test_unordered_failure_maps_to_failed_ops_only():
+    async def scenario():
+        queue = make_queue(FakeCollection(fail_indexes={1}))
+        return await asyncio.gather(*(queue.enqueue(update(key), key=key, wait=True) for key in (1, 2, 3)))
+
+    assert asyncio.run(scenario()) == [True, False, True]
+
+
+def test_ordered_failure_marks_rest_of_batch_not_executed():
+    async def scenario():
+        queue = make_queue(FakeCollection(fail_indexes={1}))
+        return await asyncio.gather(*(queue.enqueue(update(key), key=key, wait=True) for key in (1, 2, 1, 3)))
+
+    assert asyncio.run(scenario()) == [True, False, False, False]
+
+
+def test_unexpected_error_fails_whole_batch():
+    async def scenario():
+        queue = make_queue(FakeCollection(raise_error=RuntimeError("connection lost")))
+        results = await asyncio.gather(*(queue.enqueue(update(key), key=key, wait=True) for key in (1, 2)))
+        return results, queue.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == [False, False]
+    assert stats["errors"] == 2
+
+
+def test_flush_waits_for_pending_writes():
+    async def scenario():
+        col = FakeCollection()
+        queue = make_queue(col, max_latency_ms=200)
+        await queue.enqueue(update(1), key=1)
+        await queue.enqueue(update(2), key=2)
+        before = len(col.calls)
+        await queue.flush()
+        return before, col, queue
+
+    before, col, queue = asyncio.run(scenario())
+    assert before == 0
+    assert sum(len(ops) for ops, _ in col.calls) == 2
+    assert len(queue) == 0
+
+
+def test_close_writes_everything_and_stops_flusher():
+    async def scenario():
+        col = FakeCollection()
+        queue = make_queue(col)
+        for key in range(3):
+            await queue.enqueue(update(key), key=key)
+        await queue.close()
+        return col, queue
+
+    col, queue = asyncio.run(scenario())
+    assert sum(len(ops) for ops, _ in col.calls) == 3
+    assert queue._task is None and queue._getter is None
+
+
+def test_writes_after_idle_window_are_not_lost():
+    async def scenario():
+        col = FakeCollection()
+        queue = make_queue(col, max_latency_ms=5)
+        await queue.enqueue(update(1), key=1, wait=True)
+        # El flusher queda esperando con un get() pendiente entre batches
+        await asyncio.sleep(0.05)
+        applied = await queue.enqueue(update(2), key=2, wait=True)
+        await queue.close()
+        return applied, col
+
+    applied, col = asyncio.run(scenario())
+    assert applied is True
+    assert sum(len(ops) for ops, _ in col.calls) == 2